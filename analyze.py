@@ -1,16 +1,182 @@
-"""Exploratory analysis of Medicaid provider spending data via DuckDB."""
+"""Exploratory analysis of Medicaid provider spending data via DuckDB.
+
+Each analysis is a named report (REPORTS): a SQL query over the raw claims
+with optional parameters. Reports run concurrently on cursors of one DuckDB
+connection, and each result is cached under data/report-cache keyed by a
+hash of its SQL, its parameters and the source files' fingerprint (size,
+mtime and Parquet footer), so re-running an unchanged report on unchanged
+data returns instantly.
+
+Usage:
+    python analyze.py                                   # every report
+    python analyze.py --list                            # report names and parameters
+    python analyze.py top_providers top_hcpcs -p limit=50
+    python analyze.py hcpcs_trend -p hcpcs_code=99213 -p start=2022-01-01
+    python analyze.py --partitioned                     # read the claim_month=*/ layout
+    python analyze.py --json reports/ --parquet reports/   # also write <report>.json / .parquet
+    python analyze.py --no-cache                        # re-run every query
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
 import duckdb
+import pyarrow.parquet as pq
 
-PARQUET = "medicaid-provider-spending.parquet"
-con = duckdb.connect()
+from convert_to_parquet import PARQUET_PATH, PARTITIONED_DIR, PARTITIONED_VIEW_SQL
 
+PARQUET = PARQUET_PATH
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "report-cache")
 
-def query(sql: str):
-    """Run a SQL query against the Parquet file and print results as a table."""
-    result = con.sql(sql)
-    result.show()
-    return result
+# name -> title, SQL over {source}, and parameters ($name in the SQL) with
+# their defaults. A None default is "no filter"; other values are parsed
+# from -p name=value as the default's type.
+REPORTS = {
+    "overview": {
+        "title": "Row count and date range",
+        "params": {},
+        "sql": """
+            SELECT
+                count(*)::INT AS total_rows,
+                min(claim_month) AS earliest_month,
+                max(claim_month) AS latest_month,
+                count(DISTINCT billing_npi) AS unique_billing_npis,
+                count(DISTINCT servicing_npi) AS unique_servicing_npis,
+                count(DISTINCT hcpcs_code) AS unique_hcpcs_codes
+            FROM {source}
+        """,
+    },
+    "top_providers": {
+        "title": "Top {limit} billing providers by total spending",
+        "params": {"limit": 20},
+        "sql": """
+            SELECT
+                billing_npi,
+                round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
+                sum(total_claims) AS total_claims,
+                sum(unique_beneficiaries) AS total_beneficiaries
+            FROM {source}
+            GROUP BY billing_npi
+            ORDER BY sum(total_paid) DESC
+            LIMIT $limit
+        """,
+    },
+    "top_hcpcs": {
+        "title": "Top {limit} HCPCS codes by total spending",
+        "params": {"limit": 20},
+        "sql": """
+            SELECT
+                hcpcs_code,
+                round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
+                sum(total_claims) AS total_claims,
+                count(DISTINCT billing_npi) AS num_providers
+            FROM {source}
+            GROUP BY hcpcs_code
+            ORDER BY sum(total_paid) DESC
+            LIMIT $limit
+        """,
+    },
+    "monthly_trend": {
+        "title": "Monthly spending trends",
+        "params": {"start": None, "end": None},
+        "sql": """
+            SELECT
+                claim_month,
+                round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
+                sum(total_claims) AS total_claims,
+                sum(unique_beneficiaries) AS total_beneficiaries
+            FROM {source}
+            WHERE ($start::DATE IS NULL OR claim_month >= $start::DATE)
+              AND ($end::DATE IS NULL OR claim_month <= $end::DATE)
+            GROUP BY claim_month
+            ORDER BY claim_month
+        """,
+    },
+    "paid_per_claim": {
+        "title": "Spending per claim distribution",
+        "params": {},
+        "sql": """
+            WITH provider_stats AS (
+                SELECT
+                    billing_npi,
+                    sum(total_paid) AS total_paid,
+                    sum(total_claims) AS total_claims,
+                    sum(total_paid) / nullif(sum(total_claims), 0) AS paid_per_claim
+                FROM {source}
+                GROUP BY billing_npi
+            )
+            SELECT
+                count(*) AS num_providers,
+                round(avg(paid_per_claim), 2) AS avg_paid_per_claim,
+                round(median(paid_per_claim), 2) AS median_paid_per_claim,
+                round(percentile_cont(0.90) WITHIN GROUP (ORDER BY paid_per_claim), 2) AS p90_paid_per_claim,
+                round(percentile_cont(0.99) WITHIN GROUP (ORDER BY paid_per_claim), 2) AS p99_paid_per_claim,
+                round(min(paid_per_claim), 2) AS min_paid_per_claim,
+                round(max(paid_per_claim), 2) AS max_paid_per_claim
+            FROM provider_stats
+        """,
+    },
+    "claims_per_provider": {
+        "title": "Claims per provider distribution",
+        "params": {},
+        "sql": """
+            WITH provider_stats AS (
+                SELECT billing_npi, sum(total_claims) AS total_claims
+                FROM {source}
+                GROUP BY billing_npi
+            )
+            SELECT
+                count(*) AS num_providers,
+                round(avg(total_claims), 0) AS avg_claims,
+                round(median(total_claims), 0) AS median_claims,
+                round(percentile_cont(0.90) WITHIN GROUP (ORDER BY total_claims), 0) AS p90_claims,
+                round(percentile_cont(0.99) WITHIN GROUP (ORDER BY total_claims), 0) AS p99_claims,
+                min(total_claims) AS min_claims,
+                max(total_claims) AS max_claims
+            FROM provider_stats
+        """,
+    },
+    "top_beneficiaries": {
+        "title": "Top {limit} providers by unique beneficiaries",
+        "params": {"limit": 20},
+        "sql": """
+            SELECT
+                billing_npi,
+                sum(unique_beneficiaries) AS total_beneficiaries,
+                round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
+                sum(total_claims) AS total_claims
+            FROM {source}
+            GROUP BY billing_npi
+            ORDER BY sum(unique_beneficiaries) DESC
+            LIMIT $limit
+        """,
+    },
+    "hcpcs_trend": {
+        "title": "Monthly spending for HCPCS {hcpcs_code}",
+        "params": {"hcpcs_code": "T1019", "start": None, "end": None},
+        "sql": """
+            SELECT
+                claim_month,
+                round(sum(total_paid) / 1e6, 2) AS total_paid_millions,
+                sum(total_claims) AS total_claims,
+                round(sum(total_paid) / nullif(sum(total_claims), 0), 2) AS paid_per_claim,
+                count(DISTINCT billing_npi) AS num_providers
+            FROM {source}
+            WHERE hcpcs_code = $hcpcs_code
+              AND ($start::DATE IS NULL OR claim_month >= $start::DATE)
+              AND ($end::DATE IS NULL OR claim_month <= $end::DATE)
+            GROUP BY claim_month
+            ORDER BY claim_month
+        """,
+    },
+}
 
 
 def section(title: str):
@@ -19,125 +185,149 @@ def section(title: str):
     print(f"{'=' * 60}\n")
 
 
-# ---------------------------------------------------------------------------
-# 1. Basic stats
-# ---------------------------------------------------------------------------
-section("Row count and date range")
-query(f"""
-    SELECT
-        count(*)::INT AS total_rows,
-        min(claim_month) AS earliest_month,
-        max(claim_month) AS latest_month,
-        count(DISTINCT billing_npi) AS unique_billing_npis,
-        count(DISTINCT servicing_npi) AS unique_servicing_npis,
-        count(DISTINCT hcpcs_code) AS unique_hcpcs_codes
-    FROM '{PARQUET}'
-""")
-
-# ---------------------------------------------------------------------------
-# 2. Top 20 providers by total spending
-# ---------------------------------------------------------------------------
-section("Top 20 billing providers by total spending")
-query(f"""
-    SELECT
-        billing_npi,
-        round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
-        sum(total_claims) AS total_claims,
-        sum(unique_beneficiaries) AS total_beneficiaries
-    FROM '{PARQUET}'
-    GROUP BY billing_npi
-    ORDER BY sum(total_paid) DESC
-    LIMIT 20
-""")
-
-# ---------------------------------------------------------------------------
-# 3. Top 20 HCPCS codes by total spending
-# ---------------------------------------------------------------------------
-section("Top 20 HCPCS codes by total spending")
-query(f"""
-    SELECT
-        hcpcs_code,
-        round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
-        sum(total_claims) AS total_claims,
-        count(DISTINCT billing_npi) AS num_providers
-    FROM '{PARQUET}'
-    GROUP BY hcpcs_code
-    ORDER BY sum(total_paid) DESC
-    LIMIT 20
-""")
-
-# ---------------------------------------------------------------------------
-# 4. Monthly spending trends
-# ---------------------------------------------------------------------------
-section("Monthly spending trends")
-query(f"""
-    SELECT
-        claim_month,
-        round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
-        sum(total_claims) AS total_claims,
-        sum(unique_beneficiaries) AS total_beneficiaries
-    FROM '{PARQUET}'
-    GROUP BY claim_month
-    ORDER BY claim_month
-""")
-
-# ---------------------------------------------------------------------------
-# 5. Distribution stats
-# ---------------------------------------------------------------------------
-section("Spending per claim distribution")
-query(f"""
-    WITH provider_stats AS (
-        SELECT
-            billing_npi,
-            sum(total_paid) AS total_paid,
-            sum(total_claims) AS total_claims,
-            sum(total_paid) / nullif(sum(total_claims), 0) AS paid_per_claim
-        FROM '{PARQUET}'
-        GROUP BY billing_npi
-    )
-    SELECT
-        count(*) AS num_providers,
-        round(avg(paid_per_claim), 2) AS avg_paid_per_claim,
-        round(median(paid_per_claim), 2) AS median_paid_per_claim,
-        round(percentile_cont(0.90) WITHIN GROUP (ORDER BY paid_per_claim), 2) AS p90_paid_per_claim,
-        round(percentile_cont(0.99) WITHIN GROUP (ORDER BY paid_per_claim), 2) AS p99_paid_per_claim,
-        round(min(paid_per_claim), 2) AS min_paid_per_claim,
-        round(max(paid_per_claim), 2) AS max_paid_per_claim
-    FROM provider_stats
-""")
-
-section("Claims per provider distribution")
-query(f"""
-    WITH provider_stats AS (
-        SELECT billing_npi, sum(total_claims) AS total_claims
-        FROM '{PARQUET}'
-        GROUP BY billing_npi
-    )
-    SELECT
-        count(*) AS num_providers,
-        round(avg(total_claims), 0) AS avg_claims,
-        round(median(total_claims), 0) AS median_claims,
-        round(percentile_cont(0.90) WITHIN GROUP (ORDER BY total_claims), 0) AS p90_claims,
-        round(percentile_cont(0.99) WITHIN GROUP (ORDER BY total_claims), 0) AS p99_claims,
-        min(total_claims) AS min_claims,
-        max(total_claims) AS max_claims
-    FROM provider_stats
-""")
-
-# ---------------------------------------------------------------------------
-# 6. Providers with highest beneficiary counts
-# ---------------------------------------------------------------------------
-section("Top 20 providers by unique beneficiaries")
-query(f"""
-    SELECT
-        billing_npi,
-        sum(unique_beneficiaries) AS total_beneficiaries,
-        round(sum(total_paid) / 1e9, 2) AS total_paid_billions,
-        sum(total_claims) AS total_claims
-    FROM '{PARQUET}'
-    GROUP BY billing_npi
-    ORDER BY sum(unique_beneficiaries) DESC
-    LIMIT 20
-""")
-
-print("\n✓ All exploratory queries complete.")
+def file_fingerprint(path: str) -> str:
+    """Size, mtime and a hash of the Parquet footer (schema, row groups and
+    their statistics), which changes whenever the data does."""
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        f.seek(-8, os.SEEK_END)
+        footer_len = int.from_bytes(f.read(4), "little")
+        f.seek(-8 - footer_len, os.SEEK_END)
+        footer = hashlib.sha1(f.read(footer_len)).hexdigest()
+    return f"{st.st_size}:{st.st_mtime_ns}:{footer}"
+
+
+def source_fingerprint(paths: list[str]) -> str:
+    return hashlib.sha1(
+        "\n".join(f"{p}:{file_fingerprint(p)}" for p in sorted(paths)).encode()
+    ).hexdigest()
+
+
+def cache_key(sql: str, params: dict, fingerprint: str) -> str:
+    text = json.dumps({"sql": sql, "params": params, "source": fingerprint}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def parse_params(pairs: list[str], names: list[str]) -> dict:
+    """-p name=value pairs, typed like the defaults of the reports that take them."""
+    defaults = {}
+    for name in names:
+        defaults.update(REPORTS[name]["params"])
+    values = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep or key not in defaults:
+            raise ValueError(f"unknown parameter {pair!r} (known: {', '.join(sorted(defaults)) or 'none'})")
+        default = defaults[key]
+        try:
+            values[key] = type(default)(value) if default is not None else value
+        except ValueError:
+            raise ValueError(f"parameter {key} must be {type(default).__name__}, got {value!r}")
+    return values
+
+
+def run_report(con, name: str, source: str, params: dict, fingerprint: str, use_cache: bool):
+    """Run one report on its own cursor, or load it from the cache.
+    Returns (arrow table, seconds, cached)."""
+    t = time.time()
+    report = REPORTS[name]
+    sql = report["sql"].format(source=source)
+    path = os.path.join(CACHE_DIR, f"{name}-{cache_key(sql, params, fingerprint)[:24]}.parquet")
+    if use_cache and os.path.exists(path):
+        return pq.read_table(path), time.time() - t, True
+    cur = con.cursor()
+    table = cur.execute(sql, params).to_arrow_table()
+    cur.close()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    return table, time.time() - t, False
+
+
+def json_value(val):
+    if hasattr(val, "isoformat"):
+        return val.isoformat()
+    if isinstance(val, Decimal):  # sum() of integers is a HUGEINT, read back as decimal(38,0)
+        return int(val) if val == val.to_integral_value() else float(val)
+    return val
+
+
+def write_json(table, path: str):
+    data = [{col: json_value(val) for col, val in row.items()} for row in table.to_pylist()]
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reports", nargs="*", help="reports to run (default: all)")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="report parameter, e.g. limit=50 (repeatable)")
+    parser.add_argument("--list", action="store_true", help="list reports and their parameters")
+    parser.add_argument("--partitioned", action="store_true",
+                        help=f"read the {PARTITIONED_DIR}/claim_month=*/ layout instead of {PARQUET}")
+    parser.add_argument("--workers", type=int, default=4, help="reports run concurrently")
+    parser.add_argument("--no-cache", action="store_true", help="ignore cached results")
+    parser.add_argument("--json", metavar="DIR", help="also write each result to DIR/<report>.json")
+    parser.add_argument("--parquet", metavar="DIR", help="also write each result to DIR/<report>.parquet")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, report in REPORTS.items():
+            params = ", ".join(f"{k}={v}" for k, v in report["params"].items())
+            print(f"  {name:<22}{report['title'].format(**report['params'])}{f'  ({params})' if params else ''}")
+        return
+
+    names = args.reports or list(REPORTS)
+    unknown = [n for n in names if n not in REPORTS]
+    if unknown:
+        parser.error(f"unknown report(s) {', '.join(unknown)} (see --list)")
+    try:
+        overrides = parse_params(args.param, names)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.partitioned:
+        source = f"({PARTITIONED_VIEW_SQL})"
+        files = [os.path.join(d, f) for d, _, fs in os.walk(PARTITIONED_DIR) for f in fs if f.endswith(".parquet")]
+    else:
+        source = f"'{PARQUET}'"
+        files = [PARQUET]
+    if not files or not all(os.path.exists(f) for f in files):
+        sys.exit(f"No Parquet data at {PARTITIONED_DIR if args.partitioned else PARQUET} — run convert_to_parquet.py first")
+    fingerprint = source_fingerprint(files)
+
+    start = time.time()
+    con = duckdb.connect()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        jobs = []
+        for name in names:
+            params = {k: overrides.get(k, v) for k, v in REPORTS[name]["params"].items()}
+            future = pool.submit(run_report, con, name, source, params, fingerprint, not args.no_cache)
+            jobs.append((name, params, future))
+
+        # Printed in report order as results come in
+        cached = 0
+        for name, params, future in jobs:
+            table, seconds, hit = future.result()
+            cached += hit
+            section(REPORTS[name]["title"].format(**params))
+            con.from_arrow(table).show(max_rows=100)
+            print(f"  {table.num_rows:,} rows ({'cached' if hit else f'{seconds:.1f}s'})")
+            for directory, suffix in ((args.json, "json"), (args.parquet, "parquet")):
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(directory, f"{name}.{suffix}")
+                    if suffix == "json":
+                        write_json(table, path)
+                    else:
+                        pq.write_table(table, f"{path}.tmp")
+                        os.replace(f"{path}.tmp", path)
+
+    print(f"\n✓ {len(jobs)} reports ({cached} cached) in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,264 @@
-"""Convert the Medicaid provider spending CSV to Parquet for fast querying."""
+"""Convert the Medicaid provider spending CSV to Parquet for fast querying.
 
-import duckdb
+Usage:
+    python convert_to_parquet.py                             # single file
+    python convert_to_parquet.py --partitioned               # claim_month=YYYY-MM-DD/ directories
+    python convert_to_parquet.py --partitioned --sort-by-npi # ...each partition sorted by billing_npi
+    python convert_to_parquet.py --workers 8 --memory-limit 16GB
+    python convert_to_parquet.py --workers 8 --check         # ...and compare with the serial path
+
+The partitioned layout lets DuckDB skip whole months for month-range filters,
+and sorting by billing_npi lets row-group min/max statistics skip most of a
+month for single-provider lookups. The claim_month column lives in the
+directory name; read it back with hive_partitioning (see PARTITIONED_VIEW_SQL).
+
+The CSV is parsed with an explicit schema (no auto-detect sampling). With
+--workers, it is split into newline-aligned byte ranges converted by a
+process pool, each worker writing one Parquet part within its share of
+--memory-limit; the parts are then published to the final layout through a
+staging path and an atomic rename. CMS's file has no quoted newlines, which
+byte-range splitting relies on. Empty fields are NULL on both paths, as in
+DuckDB's read_csv; --check verifies the parallel parts hold exactly the
+rows of a serial conversion before publishing them.
+"""
+
+import argparse
+import glob
+import os
+import shutil
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import duckdb
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from scripts.memory import parse_size, peak_rss_mb
 
 CSV_PATH = "medicaid-provider-spending.csv"
 PARQUET_PATH = "medicaid-provider-spending.parquet"
+PARTITIONED_DIR = "medicaid-provider-spending"
+
+# Source CSV schema, in file order
+CSV_SCHEMA = {
+    "BILLING_PROVIDER_NPI_NUM": "VARCHAR",
+    "SERVICING_PROVIDER_NPI_NUM": "VARCHAR",
+    "HCPCS_CODE": "VARCHAR",
+    "CLAIM_FROM_MONTH": "VARCHAR",
+    "TOTAL_UNIQUE_BENEFICIARIES": "INTEGER",
+    "TOTAL_CLAIMS": "INTEGER",
+    "TOTAL_PAID": "DOUBLE",
+}
+ARROW_TYPES = {"VARCHAR": pa.string(), "INTEGER": pa.int32(), "DOUBLE": pa.float64()}
 
-print(f"Converting {CSV_PATH} → {PARQUET_PATH} ...")
-start = time.time()
+# Smallest byte range worth a worker; a chunk gets a quarter of its budget
+MIN_CHUNK_BYTES = 16 * 1024 * 1024
 
-duckdb.sql(f"""
-    COPY (
+# Matches the `claims` view in query-service/src/db.ts: same columns, same order
+PARTITIONED_VIEW_SQL = f"""
+    SELECT billing_npi, servicing_npi, hcpcs_code, claim_month,
+           unique_beneficiaries, total_claims, total_paid
+    FROM read_parquet('{PARTITIONED_DIR}/*/*.parquet',
+                      hive_partitioning=true, hive_types={{'claim_month': DATE}})
+"""
+
+
+def select_sql(source: str) -> str:
+    return f"""
         SELECT
-            BILLING_PROVIDER_NPI_NUM::VARCHAR   AS billing_npi,
-            SERVICING_PROVIDER_NPI_NUM::VARCHAR AS servicing_npi,
-            HCPCS_CODE::VARCHAR                 AS hcpcs_code,
+            BILLING_PROVIDER_NPI_NUM            AS billing_npi,
+            SERVICING_PROVIDER_NPI_NUM          AS servicing_npi,
+            HCPCS_CODE                          AS hcpcs_code,
             CAST(CLAIM_FROM_MONTH || '-01' AS DATE) AS claim_month,
-            TOTAL_UNIQUE_BENEFICIARIES::INT     AS unique_beneficiaries,
-            TOTAL_CLAIMS::INT                   AS total_claims,
-            TOTAL_PAID::DOUBLE                  AS total_paid
-        FROM read_csv('{CSV_PATH}', auto_detect=true)
-    ) TO '{PARQUET_PATH}' (FORMAT PARQUET, COMPRESSION ZSTD)
-""")
-
-elapsed = time.time() - start
-import os
-size_gb = round(os.path.getsize(PARQUET_PATH) / 1e9, 2)
+            TOTAL_UNIQUE_BENEFICIARIES          AS unique_beneficiaries,
+            TOTAL_CLAIMS                        AS total_claims,
+            TOTAL_PAID                          AS total_paid
+        FROM {source}
+    """
+
+
+CSV_SOURCE = f"read_csv('{CSV_PATH}', header=true, auto_detect=false, columns={CSV_SCHEMA})"
+
+
+def byte_ranges(path: str, chunk_bytes: int) -> list[tuple[int, int]]:
+    """Split a file into ranges of ~chunk_bytes ending on a newline."""
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def convert_chunk(index: int, start: int, end: int, parts_dir: str, memory_limit: str) -> int:
+    """Worker: parse one byte range with the explicit schema, write one part."""
+    with open(CSV_PATH, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    table = pacsv.read_csv(
+        pa.py_buffer(data),
+        read_options=pacsv.ReadOptions(
+            column_names=list(CSV_SCHEMA), skip_rows=1 if start == 0 else 0, use_threads=False
+        ),
+        # Only empty fields are NULL, for strings too, as in DuckDB's read_csv
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: ARROW_TYPES[t] for name, t in CSV_SCHEMA.items()},
+            null_values=[""],
+            strings_can_be_null=True,
+        ),
+    )
+    del data
+    con = duckdb.connect(config={"threads": 1, "memory_limit": memory_limit})
+    con.register("csv_chunk", table)
+    rows = con.execute(f"""
+        COPY ({select_sql('csv_chunk')})
+        TO '{parts_dir}/part-{index:05d}.parquet' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """).fetchone()[0]
+    con.close()
+    return rows
+
+
+def convert_parallel(workers: int, memory_limit_bytes: int) -> str:
+    """Convert the CSV to Parquet parts in parallel; returns the parts glob."""
+    per_worker = memory_limit_bytes // workers
+    # CSV bytes, the Arrow table and DuckDB's write buffers are all resident
+    # at once in a worker, so a chunk gets a quarter of its budget.
+    chunk_bytes = per_worker // 4
+    ranges = byte_ranges(CSV_PATH, chunk_bytes)
+    parts_dir = f"{PARTITIONED_DIR}.parts.tmp"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    print(f"  {len(ranges)} chunks of ~{chunk_bytes / 1e6:.0f} MB across {workers} workers "
+          f"({per_worker / 1e9:.1f} GB each)")
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(convert_chunk, i, start, end, parts_dir, f"{per_worker // (1024 * 1024)}MB")
+            for i, (start, end) in enumerate(ranges)
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            total += future.result()
+            print(f"  [{done}/{len(ranges)}] {total:,} rows", end="\r", flush=True)
+    print()
+    return parts_dir
+
+
+def check_parts(parts_dir: str):
+    """Fail unless the parallel parts hold exactly the rows of a serial conversion."""
+    print("  checking the parts against a serial conversion ...")
+    parts = f"SELECT * FROM read_parquet('{parts_dir}/part-*.parquet')"
+    serial = select_sql(CSV_SOURCE)
+    missing, extra = duckdb.sql(f"""
+        SELECT (SELECT count(*) FROM ({serial} EXCEPT ALL {parts})),
+               (SELECT count(*) FROM ({parts} EXCEPT ALL {serial}))
+    """).fetchone()
+    if missing or extra:
+        raise SystemExit(f"  parallel conversion differs from serial: {missing:,} rows missing, {extra:,} extra")
+    print("  parts match the serial conversion")
+
+
+def write_partitioned(source: str, sort_by_npi: bool):
+    """Write claim_month partitions to a staging dir, then swap it into place."""
+    staging = f"{PARTITIONED_DIR}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    duckdb.sql(f"""
+        COPY ({source}) TO '{staging}'
+        (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (claim_month))
+    """)
+
+    # Partitioned COPY doesn't keep a global ORDER BY within each file, so
+    # sort each (single-month, few-million-row) partition in a second pass.
+    if sort_by_npi:
+        for part in sorted(glob.glob(f"{staging}/claim_month=*")):
+            sorted_path = os.path.join(part, "sorted.parquet")
+            duckdb.sql(f"""
+                COPY (
+                    SELECT * FROM read_parquet('{part}/data_*.parquet')
+                    ORDER BY billing_npi, hcpcs_code
+                ) TO '{sorted_path}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 122880)
+            """)
+            for f in glob.glob(f"{part}/data_*.parquet"):
+                os.remove(f)
+            os.replace(sorted_path, os.path.join(part, "data_0.parquet"))
+
+    shutil.rmtree(PARTITIONED_DIR, ignore_errors=True)
+    os.replace(staging, PARTITIONED_DIR)
+
+
+def write_single(source: str):
+    staging = f"{PARQUET_PATH}.tmp"
+    duckdb.sql(f"COPY ({source}) TO '{staging}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+    os.replace(staging, PARQUET_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partitioned", action="store_true", help="write claim_month=*/ partitions")
+    parser.add_argument("--sort-by-npi", action="store_true", help="sort each partition by billing_npi")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="convert byte-range chunks in a process pool of this size (0 = DuckDB's reader)")
+    parser.add_argument("--memory-limit", default="8GB", help="total memory budget, e.g. 16GB")
+    parser.add_argument("--check", action="store_true",
+                        help="with --workers, compare the parts with a serial conversion before publishing")
+    args = parser.parse_args()
+
+    memory_limit_bytes = parse_size(args.memory_limit)
+    # Each worker needs 4 × MIN_CHUNK_BYTES of the budget; use fewer workers
+    # rather than exceed --memory-limit
+    max_workers = memory_limit_bytes // (4 * MIN_CHUNK_BYTES)
+    if args.workers > max_workers:
+        if max_workers == 0:
+            parser.error(f"--memory-limit {args.memory_limit} is below the "
+                         f"{4 * MIN_CHUNK_BYTES // (1024 * 1024)}MB one worker needs")
+        print(f"--memory-limit {args.memory_limit} fits {max_workers} workers, not {args.workers}")
+        args.workers = max_workers
+    target = f"{PARTITIONED_DIR}/claim_month=*/" if args.partitioned else PARQUET_PATH
+    print(f"Converting {CSV_PATH} → {target} ...")
+    start = time.time()
+
+    parts_dir = None
+    if args.workers > 0:
+        parts_dir = convert_parallel(args.workers, memory_limit_bytes)
+        source = f"SELECT * FROM read_parquet('{parts_dir}/part-*.parquet')"
+        print(f"  parsed in {time.time() - start:.0f}s, publishing ...")
+    else:
+        source = select_sql(CSV_SOURCE)
+    # Set after the pool has exited so the workers don't inherit a connection
+    duckdb.sql(f"SET memory_limit = '{args.memory_limit}'")
+    if parts_dir and args.check:
+        check_parts(parts_dir)
+
+    if args.partitioned:
+        write_partitioned(source, args.sort_by_npi)
+    else:
+        write_single(source)
+    if parts_dir:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    elapsed = time.time() - start
+    if args.partitioned:
+        files = glob.glob(f"{PARTITIONED_DIR}/*/*.parquet")
+        size_gb = round(sum(os.path.getsize(f) for f in files) / 1e9, 2)
+        rows = duckdb.sql(f"SELECT count(*) FROM ({PARTITIONED_VIEW_SQL})").fetchone()[0]
+        layout = f"{len(files)} partitions, "
+    else:
+        size_gb = round(os.path.getsize(PARQUET_PATH) / 1e9, 2)
+        rows = duckdb.sql(f"SELECT count(*) FROM '{PARQUET_PATH}'").fetchone()[0]
+        layout = ""
+
+    own_rss, worker_rss = peak_rss_mb()
+    print(f"Done in {elapsed:.0f}s — {rows:,} rows, {layout}{size_gb} GB")
+    workers = f", {worker_rss:,.0f} MB (largest worker)" if args.workers > 0 else ""
+    print(f"  {rows / elapsed:,.0f} rows/sec, peak RSS {own_rss:,.0f} MB (main){workers}")
 
-rows = duckdb.sql(f"SELECT count(*) FROM '{PARQUET_PATH}'").fetchone()[0]
 
-print(f"Done in {elapsed:.0f}s — {rows:,} rows, {size_gb} GB")
+if __name__ == "__main__":
+    main()
@@ -16,10 +16,14 @@ const VIEWS: [string, string][] = [
   ["provider_hcpcs", "provider_hcpcs.parquet"],
   ["provider_monthly", "provider_monthly.parquet"],
   ["brfss", "brfss_harmonized.parquet"],
+  ["brfss_cube", "brfss_cube.parquet"],
   ["medicare", "medicare_*.parquet"],
   ["medicare_inpatient", "inpatient_*.parquet"],
   ["nhanes", "nhanes_2021_2023.parquet"],
+  ["nhanes_all_cycles", "nhanes_2021_2023.parquet"],
+  ["nhanes_stats", "nhanes_stats.parquet"],
   ["dac", "dac_clinicians.parquet"],
+  ["npi_crosswalk", "npi_crosswalk.parquet"],
   ["medicare_partd", "partd_*.parquet"],
 ];
 
@@ -44,6 +48,95 @@ const GLOB_VIEW_COLUMNS: Record<string, string> = {
   medicare_partd: MEDICARE_PARTD_COLS,
 };
 
+// Hive-partitioned layouts (written by convert_to_parquet.py --partitioned,
+// harmonize_brfss.py --partitioned and ingest_nhanes.py) take precedence over
+// the single file so DuckDB can prune partitions and row groups. The partition column comes back
+// from the directory name (appended last), so the view lists columns explicitly
+// where needed to keep the single-file column order. latestOnly limits the
+// view to the partition with the greatest value of that key (by name).
+const PARTITIONED_VIEWS: Record<string, { dir: string; cols: string; hiveTypes: string; latestOnly?: string }> = {
+  claims: {
+    dir: "medicaid-provider-spending",
+    cols: "billing_npi, servicing_npi, hcpcs_code, claim_month, unique_beneficiaries, total_claims, total_paid",
+    hiveTypes: "{'claim_month': DATE}",
+  },
+  brfss: {
+    dir: "brfss_harmonized",
+    cols: "*",
+    hiveTypes: "{'survey_year': SMALLINT}",
+  },
+  // Each cycle's weights sum to the US population, so the default view holds
+  // only the latest ingested cycle; nhanes_all_cycles has every ingested
+  // cycle for cycle comparisons.
+  nhanes: {
+    dir: "nhanes",
+    cols: "*",
+    hiveTypes: "{'survey_cycle': VARCHAR}",
+    latestOnly: "survey_cycle",
+  },
+  nhanes_all_cycles: {
+    dir: "nhanes",
+    cols: "*",
+    hiveTypes: "{'survey_cycle': VARCHAR}",
+  },
+};
+
+function partitionedViewSQL(viewName: string): string | null {
+  const spec = PARTITIONED_VIEWS[viewName];
+  if (!spec || !existsSync(`${DATA_DIR}/${spec.dir}`)) return null;
+  let where = "";
+  if (spec.latestOnly) {
+    const prefix = `${spec.latestOnly}=`;
+    const latest = readdirSync(`${DATA_DIR}/${spec.dir}`)
+      .filter((d) => d.startsWith(prefix))
+      .map((d) => d.slice(prefix.length))
+      .sort()
+      .pop();
+    if (latest === undefined) return null;
+    where = ` WHERE ${spec.latestOnly} = '${latest}'`;
+  }
+  return `CREATE OR REPLACE VIEW ${viewName} AS SELECT ${spec.cols} FROM read_parquet('${DATA_DIR}/${spec.dir}/*/*.parquet', hive_partitioning=true, hive_types=${spec.hiveTypes})${where}`;
+}
+
+// Normalized layouts (written by ingest_dac.py): each table is registered as a
+// <view>_<table> view for per-NPI lookups. The dataset view keeps reading the
+// wide file, which scans much faster than the join; only if it is missing does
+// the view join the tables back into the wide file's columns.
+// Matches COMPAT_VIEW_SQL in scripts/ingest_dac.py
+const DAC_COMPAT_SQL = `SELECT
+  l.npi, c.ind_pac_id, l.ind_enrl_id,
+  c.provider_last_name, c.provider_first_name, c.provider_middle_name, c.suff, c.gndr, c.cred,
+  c.med_sch, c.grd_yr,
+  e.pri_spec, e.sec_spec_1, e.sec_spec_2, e.sec_spec_3, e.sec_spec_4, e.sec_spec_all, e.telehlth,
+  l.facility_name, l.org_pac_id, l.num_org_mem,
+  a.adr_ln_1, a.adr_ln_2, l.ln_2_sprs, a.city, a.state, a.zip_code, l.telephone,
+  e.ind_assgn, l.grp_assgn, l.adrs_id
+FROM dac_locations l
+LEFT JOIN dac_clinicians c ON c.npi = l.npi
+LEFT JOIN dac_enrollments e ON e.npi = l.npi AND e.ind_enrl_id = l.ind_enrl_id
+LEFT JOIN dac_addresses a ON a.adrs_id = l.adrs_id`;
+
+const NORMALIZED_VIEWS: Record<string, { dir: string; tables: string[]; sql: string }> = {
+  dac: {
+    dir: "dac",
+    tables: ["clinicians", "enrollments", "addresses", "locations"],
+    sql: DAC_COMPAT_SQL,
+  },
+};
+
+function normalizedViewSQL(viewName: string, widePath: string): string[] | null {
+  const spec = NORMALIZED_VIEWS[viewName];
+  if (!spec || !existsSync(`${DATA_DIR}/${spec.dir}`)) return null;
+  return [
+    ...spec.tables.map(
+      (t) => `CREATE OR REPLACE VIEW ${viewName}_${t} AS SELECT * FROM read_parquet('${DATA_DIR}/${spec.dir}/${t}.parquet')`
+    ),
+    existsSync(widePath)
+      ? `CREATE OR REPLACE VIEW ${viewName} AS SELECT * FROM read_parquet('${widePath}')`
+      : `CREATE OR REPLACE VIEW ${viewName} AS ${spec.sql}`,
+  ];
+}
+
 function buildGlobViewSQL(viewName: string, filePath: string): string {
   const cols = GLOB_VIEW_COLUMNS[viewName];
   if (cols) {
@@ -81,12 +174,18 @@ async function tryCreateViews(): Promise<void> {
       continue;
     }
 
-    if (!existsSync(filePath)) {
+    const partitionedSQL = partitionedViewSQL(viewName);
+    const normalizedSQL = normalizedViewSQL(viewName, filePath);
+    if (!partitionedSQL && !normalizedSQL && !existsSync(filePath)) {
       missing.push(fileName);
       continue;
     }
     try {
-      await db.run(`CREATE OR REPLACE VIEW ${viewName} AS SELECT * FROM read_parquet('${filePath}')`);
+      for (const sql of normalizedSQL ?? [
+        partitionedSQL ?? `CREATE OR REPLACE VIEW ${viewName} AS SELECT * FROM read_parquet('${filePath}')`,
+      ]) {
+        await db.run(sql);
+      }
       created.push(viewName);
     } catch (err) {
       console.error(`Failed to create view ${viewName}:`, err);
@@ -134,12 +233,18 @@ export async function reloadViews(): Promise<{ created: string[]; missing: strin
       continue;
     }
 
-    if (!existsSync(filePath)) {
+    const partitionedSQL = partitionedViewSQL(viewName);
+    const normalizedSQL = normalizedViewSQL(viewName, filePath);
+    if (!partitionedSQL && !normalizedSQL && !existsSync(filePath)) {
       missing.push(fileName);
       continue;
     }
     try {
-      await db.run(`CREATE OR REPLACE VIEW ${viewName} AS SELECT * FROM read_parquet('${filePath}')`);
+      for (const sql of normalizedSQL ?? [
+        partitionedSQL ?? `CREATE OR REPLACE VIEW ${viewName} AS SELECT * FROM read_parquet('${filePath}')`,
+      ]) {
+        await db.run(sql);
+      }
       created.push(viewName);
     } catch (err) {
       console.error(`Failed to create view ${viewName}:`, err);
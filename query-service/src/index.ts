@@ -1,6 +1,7 @@
 import { Hono } from "hono";
 import { serve } from "@hono/node-server";
-import { createWriteStream, createReadStream, existsSync, readdirSync, statSync, unlinkSync } from "fs";
+import { createWriteStream, createReadStream, existsSync, mkdirSync, readdirSync, statSync, unlinkSync } from "fs";
+import { dirname, isAbsolute, resolve, sep } from "path";
 import { pipeline } from "stream/promises";
 import { Readable } from "stream";
 import { initDB, executeSQL, reloadViews, isReady } from "./db.js";
@@ -10,6 +11,14 @@ const DATA_DIR = process.env.DATA_DIR || "/data";
 
 const app = new Hono();
 
+// Resolve an uploaded file name under DATA_DIR, or null if it would escape it
+function dataFilePath(name: string): string | null {
+  if (isAbsolute(name) || name.split(/[\\/]/).includes("..")) return null;
+  const root = resolve(DATA_DIR);
+  const filePath = resolve(root, name);
+  return filePath.startsWith(root + sep) ? filePath : null;
+}
+
 const API_KEY = process.env.RAILWAY_API_KEY || "";
 
 // Auth middleware for /query and /reload
@@ -79,7 +88,10 @@ app.post("/upload", async (c) => {
     if (!filename) {
       return c.json({ error: "X-Filename header required" }, 400);
     }
-    const filePath = `${DATA_DIR}/${filename}`;
+    const filePath = dataFilePath(filename);
+    if (!filePath) {
+      return c.json({ error: "X-Filename must be a relative path inside the data directory" }, 400);
+    }
     console.log(`Receiving upload: ${filename} -> ${filePath}...`);
 
     const body = c.req.raw.body;
@@ -88,6 +100,8 @@ app.post("/upload", async (c) => {
     }
 
     const append = c.req.header("X-Append") === "true";
+    // Partitioned datasets upload as e.g. medicaid-provider-spending/claim_month=2024-01-01/data_0.parquet
+    mkdirSync(dirname(filePath), { recursive: true });
     const nodeStream = Readable.fromWeb(body as import("stream/web").ReadableStream);
     const fileStream = createWriteStream(filePath, { flags: append ? "a" : "w" });
     await pipeline(nodeStream, fileStream);
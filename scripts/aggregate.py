@@ -1,24 +1,114 @@
-"""Pre-aggregate the raw Medicaid Parquet into summary tables for the web app."""
+"""Pre-aggregate the raw Medicaid Parquet into summary tables for the web app.
 
+The raw file is scanned exactly once: it is rolled up to the finest grain any
+output needs (billing_npi × hcpcs_code × claim_month), and every summary below
+is derived from that rollup instead of the raw file.
+
+Usage:
+    python scripts/aggregate.py                 # full rebuild
+    python scripts/aggregate.py --incremental   # only months changed since last run
+
+In incremental mode the rollup is kept in a month-partitioned store (see
+incremental.py) and only the groups touched by new or restated months are
+recomputed and merged into the existing outputs.
+
+Next to the exact unique_providers / unique_hcpcs_codes counts of the
+monthly, state-monthly and state × code outputs, a HyperLogLog sketch of the
+same values (providers_hll / hcpcs_codes_hll, see hll.py) lets distinct
+counts over coarser groups (a year, a region, a set of codes, all time) be
+estimated from the outputs alone.
+
+paid_per_claim_monthly holds, per code-month and per state-month, a DDSketch
+of paid per claim (paid_per_claim_dd, see ddsketch.py): every base row's
+total_paid / total_claims, weighted by its claims. Sketches merge, so
+medians and percentiles over any set of months, codes or states come from
+that table alone, within 1% of the exact claim-weighted quantile.
+"""
+
+import argparse
 import duckdb
 import json
 import os
+import sys
 import time
 
+import ddsketch
+import hll
+from incremental import (
+    changed_months,
+    file_signature,
+    load_state,
+    merge_parquet,
+    refresh_rollup,
+    save_state,
+    sql_dates,
+)
+
 RAW = os.path.join(os.path.dirname(__file__), "..", "medicaid-provider-spending.parquet")
 OUT = os.path.join(os.path.dirname(__file__), "..", "web", "public", "data")
+NPI_LOOKUP = f"{OUT}/npi_lookup.parquet"
+
+OUTPUTS = [
+    "monthly_totals.parquet",
+    "hcpcs_summary.parquet",
+    "hcpcs_monthly.parquet",
+    "provider_summary.parquet",
+    "top_providers_monthly.parquet",
+    "provider_hcpcs_summary.parquet",
+    "state_summary.parquet",
+    "state_monthly.parquet",
+    "state_hcpcs_summary.parquet",
+    "paid_per_claim_monthly.parquet",
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--incremental", action="store_true", help="only rebuild months changed since the last run")
+INCREMENTAL = parser.parse_args().incremental
 
 os.makedirs(OUT, exist_ok=True)
 con = duckdb.connect()
+hll.register(con)
+ddsketch.register(con)
 
 start = time.time()
 
+# Months to rebuild; None means a full rebuild of every output
+changed = None
+
 
-def write_parquet(name: str, sql: str):
+def materialize(name: str, sql: str):
     t = time.time()
-    con.sql(f"COPY ({sql}) TO '{OUT}/{name}.parquet' (FORMAT PARQUET, COMPRESSION SNAPPY)")
-    rows = con.sql(f"SELECT count(*) FROM '{OUT}/{name}.parquet'").fetchone()[0]
-    size = os.path.getsize(f"{OUT}/{name}.parquet")
+    con.sql(f"CREATE OR REPLACE TEMP TABLE {name} AS {sql}")
+    rows = con.sql(f"SELECT count(*) FROM {name}").fetchone()[0]
+    print(f"  {name} — {rows:,} rows ({time.time() - t:.1f}s)")
+    return rows
+
+
+def scope(name: str, source: str, predicate: str):
+    """Restrict `source` to the groups being rebuilt (all of it on a full run)."""
+    if changed is None:
+        con.sql(f"CREATE OR REPLACE TEMP VIEW {name} AS SELECT * FROM {source}")
+    else:
+        materialize(name, f"SELECT * FROM {source} WHERE {predicate}")
+
+
+def in_keys(column: str, keys: str) -> str:
+    """Null-safe `column IN (SELECT ... FROM keys)`. A NULL billing_npi or
+    hcpcs_code is a group of its own in the outputs, and once `keys` holds a
+    NULL a plain IN is NULL for every other row, which NOT (...) then drops."""
+    return f"EXISTS (SELECT 1 FROM {keys} k(key) WHERE key IS NOT DISTINCT FROM {column})"
+
+
+def write_parquet(name: str, sql: str, order_by: str, stale: str):
+    """Write an output, or on an incremental run replace its `stale` rows."""
+    t = time.time()
+    path = f"{OUT}/{name}.parquet"
+    if changed is None:
+        con.sql(f"COPY ({sql} ORDER BY {order_by}) TO '{path}' (FORMAT PARQUET, COMPRESSION SNAPPY)")
+    else:
+        merge_parquet(con, path, sql, stale, order_by)
+    rows = con.sql(f"SELECT count(*) FROM '{path}'").fetchone()[0]
+    size = os.path.getsize(path)
     print(f"  {name}.parquet — {rows:,} rows, {size / 1e6:.1f} MB ({time.time() - t:.1f}s)")
     return rows
 
@@ -44,28 +134,107 @@ def write_json(name: str, sql: str):
     print(f"  {name}.json — {len(data):,} records, {size / 1e3:.1f} KB ({time.time() - t:.1f}s)")
 
 
+# ---------------------------------------------------------------------------
+# 0. Rollups — the only pass over the raw file
+# ---------------------------------------------------------------------------
+# base collapses servicing_npi; raw_rows keeps the raw row count for stats.json.
+# Distinct counts of billing_npi / hcpcs_code at any coarser grain are exact
+# over base, since each (npi, hcpcs, month) combination appears exactly once.
+print("\n[0/13] rollups")
+months = refresh_rollup(con, RAW, INCREMENTAL)
+inputs = {"npi_lookup": file_signature(NPI_LOOKUP)}
+previous = load_state(OUT, inputs, OUTPUTS) if INCREMENTAL else None
+if previous is not None:
+    changed = changed_months(previous, months)
+    if not changed:
+        print("\nNo new or restated months — outputs are up to date.")
+        sys.exit(0)
+    print(f"  changed months: {', '.join(changed)}")
+
+# Month- and year-keyed outputs are rebuilt for the changed months/years only
+changed_dates = sql_dates(changed or [])
+changed_years = sorted({int(m[:4]) for m in changed or []})
+year_months = sql_dates(m for m in set(months) | set(changed or []) if int(m[:4]) in changed_years)
+scope("month_base", "base", f"claim_month IN ({changed_dates})")
+scope("year_base", "base", f"claim_month IN ({year_months})")
+
+# All-time outputs are rebuilt for touched keys: those present in a changed
+# month now, or whose previous [first_month, last_month] span covered one
+if changed is not None:
+    covers = " OR ".join(f"DATE '{m}' BETWEEN first_month AND last_month" for m in changed)
+    materialize("touched_hcpcs", f"""
+        SELECT DISTINCT hcpcs_code FROM month_base
+        UNION
+        SELECT hcpcs_code FROM '{OUT}/hcpcs_summary.parquet' WHERE {covers}
+    """)
+    materialize("touched_npis", f"""
+        SELECT DISTINCT billing_npi FROM month_base
+        UNION
+        SELECT billing_npi FROM '{OUT}/provider_summary.parquet' WHERE {covers}
+    """)
+    materialize("touched_states", f"""
+        SELECT DISTINCT state FROM '{NPI_LOOKUP}'
+        WHERE {in_keys("billing_npi", "touched_npis")}
+    """)
+    materialize("prev_top_providers", f"""
+        SELECT DISTINCT billing_npi FROM '{OUT}/top_providers_monthly.parquet'
+    """)
+scope("hcpcs_base", "base", in_keys("hcpcs_code", "touched_hcpcs"))
+scope("npi_base", "base", in_keys("billing_npi", "touched_npis"))
+
+# Base rows attributed to a provider state, for the state summaries
+state_join = f"""
+    SELECT n.state, b.*
+    FROM base b
+    INNER JOIN '{NPI_LOOKUP}' n ON b.billing_npi = n.billing_npi
+    WHERE n.state IS NOT NULL AND n.state != ''
+"""
+if changed is None:
+    materialize("base_state", state_join)
+else:
+    con.sql(f"CREATE OR REPLACE TEMP VIEW base_state AS {state_join}")
+scope("state_base", "base_state", in_keys("state", "touched_states"))
+scope("state_month_base", "base_state", f"claim_month IN ({changed_dates})")
+scope("state_hcpcs_base", "base_state", in_keys("hcpcs_code", "touched_hcpcs"))
+
+# HyperLogLog register entry of every provider and code, hashed once each
+# and LEFT JOINed in wherever an output sketches them, so rows with a NULL
+# key still count toward the totals; the sketches skip them, as COUNT(DISTINCT)
+# does.
+materialize("npi_entries", """
+    SELECT billing_npi, hll_entry(billing_npi) AS npi_entry
+    FROM (SELECT DISTINCT billing_npi FROM base WHERE billing_npi IS NOT NULL)
+""")
+materialize("hcpcs_entries", """
+    SELECT hcpcs_code, hll_entry(hcpcs_code) AS hcpcs_entry
+    FROM (SELECT DISTINCT hcpcs_code FROM base WHERE hcpcs_code IS NOT NULL)
+""")
+
 # ---------------------------------------------------------------------------
 # 1. monthly_totals — ~84 rows
 # ---------------------------------------------------------------------------
-print("\n[1/11] monthly_totals")
-write_parquet("monthly_totals", f"""
+print("\n[1/13] monthly_totals")
+write_parquet("monthly_totals", hll.compacted("""
     SELECT
         claim_month,
         SUM(total_paid)::DOUBLE AS total_paid,
         SUM(total_claims)::BIGINT AS total_claims,
         SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
         COUNT(DISTINCT billing_npi)::INT AS unique_providers,
-        COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes
-    FROM '{RAW}'
+        COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes,
+        list(DISTINCT npi_entry ORDER BY npi_entry) FILTER (WHERE npi_entry IS NOT NULL) AS providers_hll,
+        list(DISTINCT hcpcs_entry ORDER BY hcpcs_entry) FILTER (WHERE hcpcs_entry IS NOT NULL) AS hcpcs_codes_hll
+    FROM month_base
+    LEFT JOIN npi_entries USING (billing_npi)
+    LEFT JOIN hcpcs_entries USING (hcpcs_code)
     GROUP BY claim_month
-    ORDER BY claim_month
-""")
+""", "providers_hll", "hcpcs_codes_hll"), order_by="claim_month", stale=f"claim_month IN ({changed_dates})")
 
 # ---------------------------------------------------------------------------
 # 2. hcpcs_summary — ~10.9K rows
 # ---------------------------------------------------------------------------
-print("\n[2/11] hcpcs_summary")
-write_parquet("hcpcs_summary", f"""
+print("\n[2/13] hcpcs_summary")
+write_parquet("hcpcs_summary", """
     SELECT
         hcpcs_code,
         SUM(total_paid)::DOUBLE AS total_paid,
@@ -74,33 +243,33 @@ write_parquet("hcpcs_summary", f"""
         COUNT(DISTINCT billing_npi)::INT AS unique_providers,
         MIN(claim_month) AS first_month,
         MAX(claim_month) AS last_month
-    FROM '{RAW}'
+    FROM hcpcs_base
     GROUP BY hcpcs_code
-    ORDER BY SUM(total_paid) DESC
-""")
+""", order_by="total_paid DESC", stale=in_keys("hcpcs_code", "touched_hcpcs"))
 
 # ---------------------------------------------------------------------------
 # 3. hcpcs_monthly — ~900K rows
 # ---------------------------------------------------------------------------
-print("\n[3/11] hcpcs_monthly")
-write_parquet("hcpcs_monthly", f"""
+print("\n[3/13] hcpcs_monthly")
+write_parquet("hcpcs_monthly", hll.compacted("""
     SELECT
         hcpcs_code,
         claim_month,
         SUM(total_paid)::DOUBLE AS total_paid,
         SUM(total_claims)::BIGINT AS total_claims,
         SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
-        COUNT(DISTINCT billing_npi)::INT AS unique_providers
-    FROM '{RAW}'
+        COUNT(DISTINCT billing_npi)::INT AS unique_providers,
+        list(npi_entry ORDER BY npi_entry) FILTER (WHERE npi_entry IS NOT NULL) AS providers_hll
+    FROM month_base
+    LEFT JOIN npi_entries USING (billing_npi)
     GROUP BY hcpcs_code, claim_month
-    ORDER BY hcpcs_code, claim_month
-""")
+""", "providers_hll"), order_by="hcpcs_code, claim_month", stale=f"claim_month IN ({changed_dates})")
 
 # ---------------------------------------------------------------------------
 # 4. provider_summary — ~617K rows
 # ---------------------------------------------------------------------------
-print("\n[4/11] provider_summary")
-write_parquet("provider_summary", f"""
+print("\n[4/13] provider_summary")
+write_parquet("provider_summary", """
     SELECT
         billing_npi,
         SUM(total_paid)::DOUBLE AS total_paid,
@@ -109,41 +278,51 @@ write_parquet("provider_summary", f"""
         COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes,
         MIN(claim_month) AS first_month,
         MAX(claim_month) AS last_month
-    FROM '{RAW}'
+    FROM npi_base
     GROUP BY billing_npi
-    ORDER BY SUM(total_paid) DESC
-""")
+""", order_by="total_paid DESC", stale=in_keys("billing_npi", "touched_npis"))
 
 # ---------------------------------------------------------------------------
 # 5. top_providers_monthly — monthly detail for top 1K providers
 # ---------------------------------------------------------------------------
-print("\n[5/11] top_providers_monthly")
-write_parquet("top_providers_monthly", f"""
-    WITH top_providers AS (
-        SELECT billing_npi
-        FROM '{RAW}'
-        GROUP BY billing_npi
-        ORDER BY SUM(total_paid) DESC
-        LIMIT 1000
-    )
+# Incrementally, only changed months of the top set and every month of
+# providers new to the top set are recomputed.
+print("\n[5/13] top_providers_monthly")
+materialize("top_providers", f"""
+    SELECT billing_npi
+    FROM '{OUT}/provider_summary.parquet'
+    ORDER BY total_paid DESC
+    LIMIT 1000
+""")
+scope("top_base", "base", f"""
+    {in_keys("billing_npi", "top_providers")}
+    AND (claim_month IN ({changed_dates})
+         OR NOT {in_keys("billing_npi", "prev_top_providers")})
+""")
+write_parquet("top_providers_monthly", hll.compacted("""
     SELECT
-        r.billing_npi,
-        r.claim_month,
-        SUM(r.total_paid)::DOUBLE AS total_paid,
-        SUM(r.total_claims)::BIGINT AS total_claims,
-        SUM(r.unique_beneficiaries)::BIGINT AS unique_beneficiaries,
-        COUNT(DISTINCT r.hcpcs_code)::INT AS unique_hcpcs_codes
-    FROM '{RAW}' r
-    INNER JOIN top_providers tp ON r.billing_npi = tp.billing_npi
-    GROUP BY r.billing_npi, r.claim_month
-    ORDER BY r.billing_npi, r.claim_month
+        b.billing_npi,
+        b.claim_month,
+        SUM(b.total_paid)::DOUBLE AS total_paid,
+        SUM(b.total_claims)::BIGINT AS total_claims,
+        SUM(b.unique_beneficiaries)::BIGINT AS unique_beneficiaries,
+        COUNT(DISTINCT b.hcpcs_code)::INT AS unique_hcpcs_codes,
+        list(h.hcpcs_entry ORDER BY h.hcpcs_entry) FILTER (WHERE h.hcpcs_entry IS NOT NULL) AS hcpcs_codes_hll
+    FROM top_base b
+    INNER JOIN top_providers tp ON b.billing_npi = tp.billing_npi
+    LEFT JOIN hcpcs_entries h ON b.hcpcs_code = h.hcpcs_code
+    GROUP BY b.billing_npi, b.claim_month
+""", "hcpcs_codes_hll"), order_by="billing_npi, claim_month", stale=f"""
+    NOT {in_keys("billing_npi", "top_providers")}
+    OR NOT {in_keys("billing_npi", "prev_top_providers")}
+    OR claim_month IN ({changed_dates})
 """)
 
 # ---------------------------------------------------------------------------
 # 6. provider_hcpcs_summary — yearly spending by provider and HCPCS code
 # ---------------------------------------------------------------------------
-print("\n[6/11] provider_hcpcs_summary")
-write_parquet("provider_hcpcs_summary", f"""
+print("\n[6/13] provider_hcpcs_summary")
+write_parquet("provider_hcpcs_summary", """
     SELECT
         billing_npi,
         hcpcs_code,
@@ -151,99 +330,151 @@ write_parquet("provider_hcpcs_summary", f"""
         SUM(total_paid)::DOUBLE AS total_paid,
         SUM(total_claims)::BIGINT AS total_claims,
         SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries
-    FROM '{RAW}'
+    FROM year_base
     GROUP BY billing_npi, hcpcs_code, EXTRACT(YEAR FROM claim_month)
     HAVING SUM(total_paid) >= 25000
-    ORDER BY billing_npi, hcpcs_code, year
-""")
+""", order_by="billing_npi, hcpcs_code, year", stale=f"year IN ({', '.join(map(str, changed_years)) or 'NULL'})")
 
 # ---------------------------------------------------------------------------
 # 7. state_summary — spending aggregated by provider state
 # ---------------------------------------------------------------------------
-NPI_LOOKUP = f"{OUT}/npi_lookup.parquet"
-print("\n[7/11] state_summary")
-write_parquet("state_summary", f"""
+print("\n[7/13] state_summary")
+write_parquet("state_summary", """
     SELECT
-        n.state,
-        SUM(r.total_paid)::DOUBLE AS total_paid,
-        SUM(r.total_claims)::BIGINT AS total_claims,
-        SUM(r.unique_beneficiaries)::BIGINT AS unique_beneficiaries,
-        COUNT(DISTINCT r.billing_npi)::INT AS unique_providers,
-        COUNT(DISTINCT r.hcpcs_code)::INT AS unique_hcpcs_codes
-    FROM '{RAW}' r
-    INNER JOIN '{NPI_LOOKUP}' n ON r.billing_npi = n.billing_npi
-    WHERE n.state IS NOT NULL AND n.state != ''
-    GROUP BY n.state
-    ORDER BY SUM(r.total_paid) DESC
-""")
+        state,
+        SUM(total_paid)::DOUBLE AS total_paid,
+        SUM(total_claims)::BIGINT AS total_claims,
+        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
+        COUNT(DISTINCT billing_npi)::INT AS unique_providers,
+        COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes
+    FROM state_base
+    GROUP BY state
+""", order_by="total_paid DESC", stale=in_keys("state", "touched_states"))
 
 # ---------------------------------------------------------------------------
-# 8. state_hcpcs_summary — top procedures by state
+# 8. state_monthly — ~4.5K rows, for yearly and regional distinct counts
 # ---------------------------------------------------------------------------
-print("\n[8/11] state_hcpcs_summary")
-write_parquet("state_hcpcs_summary", f"""
+print("\n[8/13] state_monthly")
+write_parquet("state_monthly", hll.compacted("""
     SELECT
-        n.state,
-        r.hcpcs_code,
-        SUM(r.total_paid)::DOUBLE AS total_paid,
-        SUM(r.total_claims)::BIGINT AS total_claims,
-        SUM(r.unique_beneficiaries)::BIGINT AS unique_beneficiaries,
-        COUNT(DISTINCT r.billing_npi)::INT AS unique_providers
-    FROM '{RAW}' r
-    INNER JOIN '{NPI_LOOKUP}' n ON r.billing_npi = n.billing_npi
-    WHERE n.state IS NOT NULL AND n.state != ''
-    GROUP BY n.state, r.hcpcs_code
-    HAVING SUM(r.total_paid) >= 100000
-    ORDER BY n.state, SUM(r.total_paid) DESC
-""")
+        state,
+        claim_month,
+        SUM(total_paid)::DOUBLE AS total_paid,
+        SUM(total_claims)::BIGINT AS total_claims,
+        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
+        COUNT(DISTINCT billing_npi)::INT AS unique_providers,
+        COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes,
+        list(DISTINCT npi_entry ORDER BY npi_entry) FILTER (WHERE npi_entry IS NOT NULL) AS providers_hll,
+        list(DISTINCT hcpcs_entry ORDER BY hcpcs_entry) FILTER (WHERE hcpcs_entry IS NOT NULL) AS hcpcs_codes_hll
+    FROM state_month_base
+    LEFT JOIN npi_entries USING (billing_npi)
+    LEFT JOIN hcpcs_entries USING (hcpcs_code)
+    GROUP BY state, claim_month
+""", "providers_hll", "hcpcs_codes_hll"), order_by="state, claim_month", stale=f"claim_month IN ({changed_dates})")
 
 # ---------------------------------------------------------------------------
-# 9. stats.json — overall summary stats for landing page
+# 9. state_hcpcs_summary — top procedures by state
 # ---------------------------------------------------------------------------
-print("\n[9/11] stats.json")
+print("\n[9/13] state_hcpcs_summary")
+write_parquet("state_hcpcs_summary", hll.compacted("""
+    SELECT
+        state,
+        hcpcs_code,
+        SUM(total_paid)::DOUBLE AS total_paid,
+        SUM(total_claims)::BIGINT AS total_claims,
+        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
+        COUNT(DISTINCT billing_npi)::INT AS unique_providers,
+        list(npi_entry ORDER BY npi_entry) FILTER (WHERE npi_entry IS NOT NULL) AS providers_hll
+    FROM state_hcpcs_base
+    LEFT JOIN npi_entries USING (billing_npi)
+    GROUP BY state, hcpcs_code
+    HAVING SUM(total_paid) >= 100000
+""", "providers_hll"), order_by="state, total_paid DESC", stale=in_keys("hcpcs_code", "touched_hcpcs"))
+
+# ---------------------------------------------------------------------------
+# 10. paid_per_claim_monthly — ~900K code-month + ~4.5K state-month rows
+# ---------------------------------------------------------------------------
+# Code-month rows (state NULL) cover every provider; state-month rows
+# (hcpcs_code NULL) those with a state in npi_lookup. Rows with no claims
+# have no paid per claim and are left out of all three measures.
+print("\n[10/13] paid_per_claim_monthly")
+write_parquet("paid_per_claim_monthly", """
+    SELECT
+        hcpcs_code,
+        state,
+        claim_month,
+        SUM(n)::BIGINT AS total_claims,
+        SUM(paid)::DOUBLE AS total_paid,
+        list_sort(list({'k': k, 'n': n})) AS paid_per_claim_dd
+    FROM (
+        SELECT hcpcs_code, NULL::VARCHAR AS state, claim_month,
+               dd_bucket(total_paid / total_claims) AS k,
+               SUM(total_claims)::BIGINT AS n, SUM(total_paid) AS paid
+        FROM month_base
+        WHERE total_claims > 0
+        GROUP BY ALL
+        UNION ALL
+        SELECT NULL::VARCHAR AS hcpcs_code, state, claim_month,
+               dd_bucket(total_paid / total_claims) AS k,
+               SUM(total_claims)::BIGINT AS n, SUM(total_paid) AS paid
+        FROM state_month_base
+        WHERE total_claims > 0
+        GROUP BY ALL
+    )
+    GROUP BY hcpcs_code, state, claim_month
+""", order_by="hcpcs_code, state, claim_month", stale=f"claim_month IN ({changed_dates})")
+
+# ---------------------------------------------------------------------------
+# 11. stats.json — overall summary stats for landing page
+# ---------------------------------------------------------------------------
+# Derived from the outputs above: provider_summary / hcpcs_summary hold one
+# row per distinct provider / code (plus a NULL group, not counted), and the
+# rollup manifest the raw row count.
+print("\n[11/13] stats.json")
+total_rows = sum(int(fp.split(":")[0]) for fp in months.values())
 write_json("stats", f"""
     SELECT
-        COUNT(*)::BIGINT AS total_rows,
+        {total_rows}::BIGINT AS total_rows,
         MIN(claim_month) AS earliest_month,
         MAX(claim_month) AS latest_month,
-        COUNT(DISTINCT billing_npi)::INT AS unique_providers,
-        COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes,
+        (SELECT COUNT(billing_npi) FROM '{OUT}/provider_summary.parquet')::INT AS unique_providers,
+        (SELECT COUNT(hcpcs_code) FROM '{OUT}/hcpcs_summary.parquet')::INT AS unique_hcpcs_codes,
         ROUND(SUM(total_paid), 2)::DOUBLE AS total_spending,
         SUM(total_claims)::BIGINT AS total_claims
-    FROM '{RAW}'
+    FROM '{OUT}/monthly_totals.parquet'
 """)
 
 # ---------------------------------------------------------------------------
-# 9. monthly_trend.json — for landing page chart
+# 12. monthly_trend.json — for landing page chart
 # ---------------------------------------------------------------------------
-print("\n[10/11] monthly_trend.json")
+print("\n[12/13] monthly_trend.json")
 write_json("monthly_trend", f"""
     SELECT
         claim_month AS month,
-        ROUND(SUM(total_paid), 2)::DOUBLE AS total_paid,
-        SUM(total_claims)::BIGINT AS total_claims,
-        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries
-    FROM '{RAW}'
-    GROUP BY claim_month
+        ROUND(total_paid, 2)::DOUBLE AS total_paid,
+        total_claims,
+        unique_beneficiaries
+    FROM '{OUT}/monthly_totals.parquet'
     ORDER BY claim_month
 """)
 
 # ---------------------------------------------------------------------------
-# 10. top_providers.json — for landing page
+# 13. top_providers.json — for landing page
 # ---------------------------------------------------------------------------
-print("\n[11/11] top_providers.json")
+print("\n[13/13] top_providers.json")
 write_json("top_providers", f"""
     SELECT
         billing_npi,
-        ROUND(SUM(total_paid), 2)::DOUBLE AS total_paid,
-        SUM(total_claims)::BIGINT AS total_claims,
-        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries
-    FROM '{RAW}'
-    GROUP BY billing_npi
-    ORDER BY SUM(total_paid) DESC
+        ROUND(total_paid, 2)::DOUBLE AS total_paid,
+        total_claims,
+        unique_beneficiaries
+    FROM '{OUT}/provider_summary.parquet'
+    ORDER BY total_paid DESC
     LIMIT 20
 """)
 
+save_state(OUT, months, inputs)
+
 elapsed = time.time() - start
 print(f"\nAll done in {elapsed:.0f}s")
 
@@ -0,0 +1,218 @@
+"""
+Precompute survey-weighted BRFSS prevalences into a cube, written to
+data/brfss_cube.parquet (the brfss_cube view in query-service/src/db.ts).
+
+Run after harmonize_brfss.py. For every survey year, INDICATOR and
+DIMENSION level, the cube has one row per state (_STATE) and one national
+row (state NULL). The 'all' dimension (level NULL) is the whole population.
+Each row holds:
+
+    sample_n, sample_yes        unweighted valid respondents / with the outcome
+    weight_total, weight_yes    SUM(_LLCPWT) over them / over those with the outcome
+    prevalence                  weight_yes / weight_total
+    se                          Taylor-linearized standard error of prevalence
+    var_yy, var_xy, var_xx      the variance sums se is computed from
+
+The standard error is the with-replacement estimate over strata (_STSTR) and
+PSUs (_PSU) that SUDAAN and R's survey package use for a ratio, treating the
+cell as a domain. Every PSU in the year's design counts, including those
+with no respondents in the cell. Strata with a single PSU contribute
+nothing. With y = weighted outcome and x = weight summed per PSU, and n_h
+PSUs in stratum h:
+
+    var_yy = SUM_h n_h / (n_h - 1) * (SUM_i y_hi^2     - (SUM_i y_hi)^2 / n_h)
+    var_xy = SUM_h n_h / (n_h - 1) * (SUM_i x_hi y_hi  - SUM_i x_hi SUM_i y_hi / n_h)
+    var_xx = SUM_h n_h / (n_h - 1) * (SUM_i x_hi^2     - (SUM_i x_hi)^2 / n_h)
+    se     = SQRT(var_yy - 2 p var_xy + p^2 var_xx) / weight_total
+
+Strata nest within states and years. So the sums of rows that cover
+different states or years can be added together to pool them, e.g. for
+regions or multi-year estimates. Levels of one dimension cannot be pooled.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/harmonize_brfss.py --partitioned
+    python scripts/aggregate_brfss_cube.py
+    python scripts/aggregate_brfss_cube.py --indicators obesity current_smoker --dimensions all _AGEG5YR
+"""
+
+import argparse
+import os
+import time
+
+import duckdb
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data")
+PARTITIONED_DIR = os.path.join(DATA, "brfss_harmonized")
+SINGLE_FILE = os.path.join(DATA, "brfss_harmonized.parquet")
+OUTPUT_FILE = os.path.join(DATA, "brfss_cube.parquet")
+
+# indicator: (valid response, outcome), using the codes documented in
+# web/src/lib/brfssSchemas.ts
+INDICATORS: dict[str, tuple[str, str]] = {
+    "obesity": ("_BMI5CAT BETWEEN 1 AND 4", "_BMI5CAT = 4"),
+    "overweight_or_obese": ("_RFBMI5 IN (1, 2)", "_RFBMI5 = 2"),
+    "current_smoker": ("_SMOKER3 BETWEEN 1 AND 4", "_SMOKER3 IN (1, 2)"),
+    "current_ecig": ("_CURECI2 IN (1, 2)", "_CURECI2 = 2"),
+    "binge_drinking": ("_RFBING6 IN (1, 2)", "_RFBING6 = 2"),
+    "heavy_drinking": ("_RFDRHV8 IN (1, 2)", "_RFDRHV8 = 2"),
+    "no_leisure_activity": ("_TOTINDA IN (1, 2)", "_TOTINDA = 2"),
+    "fair_poor_health": ("_RFHLTH IN (1, 2)", "_RFHLTH = 2"),
+    "frequent_mental_distress": ("_MENT14D IN (1, 2)", "_MENT14D = 2"),
+    "frequent_physical_distress": ("_PHYS14D IN (1, 2)", "_PHYS14D = 2"),
+    "depression": ("ADDEPEV3 IN (1, 2)", "ADDEPEV3 = 1"),
+    "diabetes": ("DIABETE4 BETWEEN 1 AND 4", "DIABETE4 = 1"),
+    "hypertension": ("BPHIGH6 BETWEEN 1 AND 4", "BPHIGH6 = 1"),
+    "heart_disease": ("_MICHD IN (1, 2)", "_MICHD = 1"),
+    "copd": ("CHCCOPD3 IN (1, 2)", "CHCCOPD3 = 1"),
+    "current_asthma": ("ASTHMA3 IN (1, 2)", "ASTHMA3 = 1 AND ASTHNOW = 1"),
+    "no_health_plan": ("_HLTHPL1 IN (1, 2)", "_HLTHPL1 = 2"),
+    "cost_barrier": ("MEDCOST1 IN (1, 2)", "MEDCOST1 = 1"),
+    "flu_shot": ("_FLSHOT7 IN (1, 2)", "_FLSHOT7 = 1"),
+}
+
+# Demographic columns whose codes become the cube's levels; 'all' is the
+# whole population. Income is split by era like the source columns.
+DIMENSIONS = ["all", "SEXVAR", "_AGEG5YR", "_IMPRACE", "_EDUCAG", "_INCOMG", "_INCOMG1"]
+
+CUBE_COLUMNS = """
+    survey_year SMALLINT, indicator VARCHAR, dimension VARCHAR, level SMALLINT, state SMALLINT,
+    sample_n BIGINT, sample_yes BIGINT, weight_total DOUBLE, weight_yes DOUBLE,
+    var_yy DOUBLE, var_xy DOUBLE, var_xx DOUBLE
+"""
+
+
+def source_sql() -> str:
+    if os.path.isdir(PARTITIONED_DIR):
+        return (f"read_parquet('{PARTITIONED_DIR}/*/*.parquet', hive_partitioning=true, "
+                f"hive_types={{'survey_year': SMALLINT}})")
+    if os.path.exists(SINGLE_FILE):
+        return f"read_parquet('{SINGLE_FILE}')"
+    raise SystemExit(f"No harmonized BRFSS data in {DATA} — run harmonize_brfss.py first")
+
+
+def respondents_sql(source: str, year: int, indicators: list[str], dimensions: list[str]) -> str:
+    """One row per respondent and indicator they gave a valid answer to."""
+    dims = "".join(f", {d}" for d in dimensions if d != "all")
+    return "\nUNION ALL\n".join(f"""
+        SELECT '{name}' AS indicator, _STATE AS state, _STSTR AS stratum, _PSU AS psu,
+               _LLCPWT AS w, CAST(COALESCE({INDICATORS[name][1]}, false) AS INTEGER) AS yes{dims}
+        FROM {source}
+        WHERE survey_year = {year} AND _LLCPWT > 0 AND ({INDICATORS[name][0]})
+    """ for name in indicators)
+
+
+def cells_sql(year: int, dimension: str) -> str:
+    """Cube rows of one dimension from the `respondents` and `design` tables."""
+    level = "NULL::SMALLINT" if dimension == "all" else dimension
+    where = "" if dimension == "all" else f"WHERE {dimension} IS NOT NULL"
+    return f"""
+        WITH psus AS (
+            SELECT indicator, {level} AS level, state, stratum, psu,
+                   SUM(w) AS x, SUM(w * yes) AS y, COUNT(*) AS n, SUM(yes) AS n_yes
+            FROM respondents {where}
+            GROUP BY ALL
+        ),
+        strata AS (
+            SELECT s.indicator, s.level, s.state, d.psus,
+                   IF(d.psus > 1, d.psus / (d.psus - 1), 0) AS f,
+                   SUM(s.n) AS n, SUM(s.n_yes) AS n_yes, SUM(s.x) AS sx, SUM(s.y) AS sy,
+                   SUM(s.y * s.y) AS syy, SUM(s.x * s.y) AS sxy, SUM(s.x * s.x) AS sxx
+            FROM psus s JOIN design d USING (stratum)
+            GROUP BY s.indicator, s.level, s.state, s.stratum, d.psus
+        )
+        SELECT {year} AS survey_year, indicator, '{dimension}' AS dimension, level, state,
+               SUM(n) AS sample_n, SUM(n_yes) AS sample_yes, SUM(sx) AS weight_total, SUM(sy) AS weight_yes,
+               SUM(f * (syy - sy * sy / psus)) AS var_yy,
+               SUM(f * (sxy - sx * sy / psus)) AS var_xy,
+               SUM(f * (sxx - sx * sx / psus)) AS var_xx
+        FROM strata
+        GROUP BY GROUPING SETS ((indicator, level, state), (indicator, level))
+    """
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indicators", nargs="+", default=list(INDICATORS), help="subset of INDICATORS")
+    parser.add_argument("--dimensions", nargs="+", default=DIMENSIONS, help="subset of DIMENSIONS")
+    args = parser.parse_args()
+    for flag, chosen, known in (("--indicators", args.indicators, list(INDICATORS)),
+                                ("--dimensions", args.dimensions, DIMENSIONS)):
+        unknown = [c for c in chosen if c not in known]
+        if unknown:
+            parser.error(f"{flag}: unknown {', '.join(unknown)}; choose from {', '.join(known)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    source = source_sql()
+    con = duckdb.connect()
+    start = time.time()
+
+    dimensions = args.dimensions
+    years = [y for (y,) in con.execute(f"SELECT DISTINCT survey_year FROM {source} ORDER BY 1").fetchall()]
+    print(f"{len(args.indicators)} indicators × {len(dimensions)} dimensions, years {', '.join(map(str, years))}")
+
+    con.execute(f"CREATE TABLE cube ({CUBE_COLUMNS})")
+    for year in years:
+        t = time.time()
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE design AS
+            SELECT _STSTR AS stratum, COUNT(DISTINCT _PSU) AS psus
+            FROM {source} WHERE survey_year = {year} GROUP BY 1
+        """)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE respondents AS
+            {respondents_sql(source, year, args.indicators, dimensions)}
+        """)
+        rows = con.execute("SELECT COUNT(*) FROM respondents").fetchone()[0]
+        for dimension in dimensions:
+            con.execute(f"INSERT INTO cube {cells_sql(year, dimension)}")
+        print(f"  {year}: {rows:,} respondent × indicator rows ({time.time() - t:.1f}s)")
+
+    # The national 'all' cells must reproduce the direct weighted prevalence
+    checks = "\nUNION ALL\n".join(f"""
+        SELECT survey_year, '{name}' AS indicator,
+               SUM(IF({outcome}, _LLCPWT, 0)) / SUM(_LLCPWT) AS direct
+        FROM {source} WHERE _LLCPWT > 0 AND ({valid}) GROUP BY 1
+    """ for name, (valid, outcome) in INDICATORS.items() if name in args.indicators)
+    worst = con.execute(f"""
+        SELECT MAX(ABS(c.weight_yes / c.weight_total - d.direct))
+        FROM cube c JOIN ({checks}) d USING (survey_year, indicator)
+        WHERE c.dimension = 'all' AND c.state IS NULL
+    """).fetchone()[0]
+    if worst is not None and "all" in dimensions and worst > 1e-9:
+        raise ValueError(f"cube prevalence differs from the direct estimate by up to {worst:.2e}")
+
+    tmp_file = OUTPUT_FILE + ".tmp"
+    con.execute(f"""
+        COPY (
+            SELECT survey_year, indicator, dimension, level, state,
+                   sample_n, sample_yes, weight_total, weight_yes,
+                   weight_yes / weight_total AS prevalence,
+                   SQRT(GREATEST(var_yy - 2 * (weight_yes / weight_total) * var_xy
+                                 + (weight_yes / weight_total) ** 2 * var_xx, 0)) / weight_total AS se,
+                   var_yy, var_xy, var_xx
+            FROM cube
+            ORDER BY indicator, dimension, survey_year, state NULLS FIRST, level NULLS FIRST
+        ) TO '{tmp_file}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+    """)
+    os.replace(tmp_file, OUTPUT_FILE)
+
+    rows = con.execute(f"SELECT COUNT(*) FROM '{OUTPUT_FILE}'").fetchone()[0]
+    print(f"\nOutput: {OUTPUT_FILE}")
+    print(f"  {rows:,} rows, {os.path.getsize(OUTPUT_FILE) / 1e6:.1f} MB ({time.time() - start:.0f}s)")
+
+    print("\nNational prevalence, latest year (%, ± 95% CI):")
+    for indicator, year, p, se, n in con.execute(f"""
+        SELECT indicator, survey_year, prevalence, se, sample_n FROM '{OUTPUT_FILE}'
+        WHERE dimension = 'all' AND state IS NULL
+        QUALIFY survey_year = MAX(survey_year) OVER (PARTITION BY indicator)
+        ORDER BY indicator
+    """).fetchall():
+        print(f"  {indicator:28s} {year}  {100 * p:5.1f} ± {196 * se:4.2f}  (n={n:,})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Precompute survey-weighted NHANES lab and exam statistics, written to
+data/nhanes_stats.parquet (the nhanes_stats view in query-service/src/db.ts).
+
+Run after ingest_nhanes.py. For every survey cycle, MEASURES column (the
+exam and lab components of ingest_nhanes.py), POPULATION and DIMENSION
+level, the table has one row with:
+
+    sample_n                    examined respondents with a value
+    weight_total, weight_sum    SUM(WTMEC2YR) over them / SUM(WTMEC2YR * value)
+    mean                        weight_sum / weight_total
+    se                          Taylor-linearized standard error of mean
+    p10, p25, p50, p75, p90     weighted quantiles
+    var_yy, var_xy, var_xx      the variance sums se is computed from
+
+A quantile is the smallest value whose share of weight_total, counting
+that value and all below it, reaches the quantile. The standard error is
+the with-replacement estimate over the masked variance strata (SDMVSTRA)
+and PSUs (SDMVPSU) that SUDAAN and R's survey package use for a ratio,
+treating the cell as a domain, as in aggregate_brfss_cube.py. With y = the
+weighted values and x = the weights summed per PSU, and n_h PSUs in
+stratum h:
+
+    var_yy = SUM_h n_h / (n_h - 1) * (SUM_i y_hi^2     - (SUM_i y_hi)^2 / n_h)
+    var_xy = SUM_h n_h / (n_h - 1) * (SUM_i x_hi y_hi  - SUM_i x_hi SUM_i y_hi / n_h)
+    var_xx = SUM_h n_h / (n_h - 1) * (SUM_i x_hi^2     - (SUM_i x_hi)^2 / n_h)
+    se     = SQRT(var_yy - 2 mean var_xy + mean^2 var_xx) / weight_total
+
+Strata differ between cycles. To pool cycles, scale each cycle's weight
+sums by its share of the pooled period (see ingest_nhanes.py) and its
+var_* by the square of that share, then add them. Quantiles cannot be
+pooled.
+
+The fasting-subsample components (GLU: LBXGLU; TRIGLY: LBXTLG, LBDLDL) are
+left out: they must be weighted with the fasting weight WTSAF2YR, which
+ingest_nhanes.py does not keep, and WTMEC2YR would misweight them.
+
+All sums are NumPy group reductions over one cycle's arrays: every
+measure of a dimension is reduced at once into a (level, PSU, measure)
+array, then into strata.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/ingest_nhanes.py
+    python scripts/aggregate_nhanes_stats.py
+    python scripts/aggregate_nhanes_stats.py --measures LBXGH LBXHSCRP --dimensions all income insurance
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ingest_nhanes import COLUMNS_TO_KEEP, DATASET_DIR, LATEST_CYCLE, OUTPUT_DIR
+
+SINGLE_FILE = os.path.join(OUTPUT_DIR, "nhanes_2021_2023.parquet")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "nhanes_stats.parquet")
+
+# Physical exam and laboratory components whose columns are the measures
+# (all weighted with WTMEC2YR, so not the fasting-subsample GLU and TRIGLY)
+EXAM_COMPONENTS = ["BMX", "BPXO", "GHB", "TCHOL", "HDL", "BIOPRO", "CBC", "HSCRP"]
+MEASURES = [col for comp in EXAM_COMPONENTS for col in COLUMNS_TO_KEEP[comp] if col != "SEQN"]
+
+QUANTILES = [0.10, 0.25, 0.50, 0.75, 0.90]
+QUANTILE_COLUMNS = [f"p{round(100 * q)}" for q in QUANTILES]
+
+# population: minimum age (RIDAGEYR)
+POPULATIONS = {"all": 0, "18+": 18, "20+": 20}
+
+# dimension: level code → label. Raw columns keep their NHANES codes; the
+# derived ones are coded in dimension_levels().
+DIMENSIONS: dict[str, dict[int, str]] = {
+    "all": {1: "All"},
+    "RIAGENDR": {1: "Male", 2: "Female"},
+    "age_group": {1: "Under 18", 2: "18-29", 3: "30-39", 4: "40-49", 5: "50-59", 6: "60-69", 7: "70+"},
+    "RIDRETH3": {
+        1: "Mexican American", 2: "Other Hispanic", 3: "Non-Hispanic White",
+        4: "Non-Hispanic Black", 6: "Non-Hispanic Asian", 7: "Other/Multi-Racial",
+    },
+    "DMDEDUC2": {
+        1: "Less than 9th grade", 2: "9-11th grade", 3: "High school grad/GED",
+        4: "Some college/AA", 5: "College graduate or above",
+    },
+    "income": {1: "Below 130% of poverty", 2: "130-349% of poverty", 3: "350% of poverty or more"},
+    "insurance": {1: "Private", 2: "Medicare", 3: "Medicaid/CHIP", 4: "Military/IHS", 5: "Uninsured"},
+}
+
+DEMOGRAPHICS = ["RIAGENDR", "RIDAGEYR", "RIDRETH3", "DMDEDUC2", "INDFMPIR",
+                "HIQ011", "HIQ032A", "HIQ032B", "HIQ032C", "HIQ032D", "HIQ032E", "HIQ032H", "HIQ032I"]
+DESIGN = ["WTMEC2YR", "SDMVSTRA", "SDMVPSU"]
+
+# Columns collected per cycle; mean and se are derived from them at the end
+OUTPUT_SCHEMA = pa.schema(
+    [("survey_cycle", pa.string()), ("measure", pa.string()), ("population", pa.string()),
+     ("dimension", pa.string()), ("level", pa.int16()), ("label", pa.string()),
+     ("sample_n", pa.int64()), ("weight_total", pa.float64()), ("weight_sum", pa.float64())]
+    + [(name, pa.float64()) for name in QUANTILE_COLUMNS]
+    + [("var_yy", pa.float64()), ("var_xy", pa.float64()), ("var_xx", pa.float64())]
+)
+
+
+def dimension_levels(dimension: str, cols: dict[str, np.ndarray]) -> np.ndarray:
+    """Each respondent's level code in `dimension`, 0 where they have none."""
+    if dimension == "all":
+        return np.ones(len(cols["WTMEC2YR"]), dtype=np.int64)
+    if dimension == "age_group":
+        age = cols["RIDAGEYR"]
+        return np.where(np.isnan(age), 0, np.digitize(age, [18, 30, 40, 50, 60, 70]) + 1)
+    if dimension == "income":
+        pir = cols["INDFMPIR"]
+        return np.where(np.isnan(pir), 0, np.digitize(pir, [1.3, 3.5]) + 1)
+    if dimension == "insurance":
+        # Check-all-that-apply: a box is checked when it holds any code but
+        # a refusal (77/99), and the first checked type in this order wins
+        checked = {c: cols[c] < 77 for c in ("HIQ032A", "HIQ032B", "HIQ032C", "HIQ032D",
+                                             "HIQ032E", "HIQ032H", "HIQ032I")}
+        return np.select([
+            checked["HIQ032A"],
+            checked["HIQ032B"] | checked["HIQ032C"],
+            checked["HIQ032D"] | checked["HIQ032E"],
+            checked["HIQ032H"] | checked["HIQ032I"],
+            cols["HIQ011"] == 2,
+        ], [1, 2, 3, 4, 5], 0)
+    values = cols[dimension]
+    return np.where(np.isin(values, list(DIMENSIONS[dimension])), values, 0).astype(np.int64)
+
+
+def read_cycles() -> dict[str, dict[str, np.ndarray]]:
+    """Each survey cycle's design, demographic and measure columns as arrays."""
+    columns = DESIGN + DEMOGRAPHICS + MEASURES
+    files = {
+        os.path.basename(os.path.dirname(path)).removeprefix("survey_cycle="): path
+        for path in sorted(glob.glob(os.path.join(DATASET_DIR, "survey_cycle=*", "*.parquet")))
+    }
+    if not files and os.path.exists(SINGLE_FILE):
+        files = {LATEST_CYCLE: SINGLE_FILE}
+    if not files:
+        raise SystemExit(f"No NHANES data in {OUTPUT_DIR} — run ingest_nhanes.py first")
+    cycles = {}
+    for cycle, path in files.items():
+        table = pq.read_table(path, columns=[c for c in columns if c in pq.read_schema(path).names])
+        cycles[cycle] = {
+            c: (table.column(c).to_numpy(zero_copy_only=False).astype(np.float64)
+                if c in table.column_names else np.full(table.num_rows, np.nan))
+            for c in columns
+        }
+    return cycles
+
+
+def design_psus(cols: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Respondents' PSU index (-1 if undesignated), each PSU's stratum index
+    and each stratum's PSU count, over every respondent of the cycle."""
+    stratum, psu = cols["SDMVSTRA"], cols["SDMVPSU"]
+    designated = ~np.isnan(stratum) & ~np.isnan(psu)
+    pairs, inverse = np.unique(np.column_stack([stratum[designated], psu[designated]]),
+                               axis=0, return_inverse=True)
+    respondent_psu = np.full(len(stratum), -1)
+    respondent_psu[designated] = inverse.ravel()
+    _, psu_stratum, psus = np.unique(pairs[:, 0], return_inverse=True, return_counts=True)
+    return respondent_psu, psu_stratum.ravel(), psus
+
+
+def cell_sums(codes, respondent_psu, psu_stratum, psus, w, values, valid):
+    """Counts, weight sums and variance sums for every (level, measure).
+
+    Rows are reduced to (level, PSU, measure) sums, including the PSUs where
+    a level has no respondents, and those to strata; every returned array
+    is (level, measure)."""
+    levels = codes.max() + 1
+    n_psus, n_strata = len(psu_stratum), len(psus)
+    rows = (codes > 0) & (respondent_psu >= 0)
+    keys = codes[rows] * n_psus + respondent_psu[rows]
+    wv = np.where(valid[rows], w[rows, None], 0.0)
+    yv = np.where(valid[rows], wv * np.nan_to_num(values[rows]), 0.0)
+
+    n = np.zeros((levels * n_psus, values.shape[1]))
+    x = np.zeros_like(n)
+    y = np.zeros_like(n)
+    np.add.at(n, keys, valid[rows])
+    np.add.at(x, keys, wv)
+    np.add.at(y, keys, yv)
+    n, x, y = (a.reshape(levels, n_psus, -1) for a in (n, x, y))
+
+    def by_stratum(a):
+        out = np.zeros((levels, n_strata, a.shape[2]))
+        np.add.at(out, (slice(None), psu_stratum), a)
+        return out
+
+    sx, sy = by_stratum(x), by_stratum(y)
+    f = np.where(psus > 1, psus / np.maximum(psus - 1, 1), 0.0)[None, :, None]
+    m = psus[None, :, None]
+    return {
+        "sample_n": n.sum(axis=1).astype(np.int64),
+        "weight_total": sx.sum(axis=1),
+        "weight_sum": sy.sum(axis=1),
+        "var_yy": (f * (by_stratum(y * y) - sy * sy / m)).sum(axis=1),
+        "var_xy": (f * (by_stratum(x * y) - sx * sy / m)).sum(axis=1),
+        "var_xx": (f * (by_stratum(x * x) - sx * sx / m)).sum(axis=1),
+    }
+
+
+def weighted_quantiles(codes, w, values, valid) -> np.ndarray:
+    """(level, measure, quantile) weighted quantiles, NaN for empty cells.
+
+    Per measure, respondents are sorted by (level, value) once; level +
+    cumulative weight share is then non-decreasing, so every level's
+    quantiles are one searchsorted."""
+    levels = codes.max() + 1
+    out = np.full((levels, values.shape[1], len(QUANTILES)), np.nan)
+    q = np.array(QUANTILES)
+    for j in range(values.shape[1]):
+        rows = valid[:, j] & (codes > 0)
+        if not rows.any():
+            continue
+        code, v, wt = codes[rows], values[rows, j], w[rows]
+        order = np.lexsort((v, code))
+        code, v, cum = code[order], v[order], np.cumsum(wt[order])
+        present, start, count = np.unique(code, return_index=True, return_counts=True)
+        before = cum[start] - wt[order][start]
+        total = cum[start + count - 1] - before
+        share = (cum - np.repeat(before, count)) / np.repeat(total, count)
+        targets = present[:, None] + q[None, :] - 1e-12
+        index = np.searchsorted(code + share, targets.ravel()).reshape(targets.shape)
+        out[present, j] = v[np.minimum(index, len(v) - 1)]
+    return out
+
+
+def cycle_rows(cycle: str, cols: dict[str, np.ndarray], measures: list[str],
+               dimensions: list[str]) -> dict[str, list]:
+    respondent_psu, psu_stratum, psus = design_psus(cols)
+    w = np.nan_to_num(cols["WTMEC2YR"])
+    values = np.column_stack([cols[m] for m in measures])
+    examined = (w > 0) & (respondent_psu >= 0)
+    out: dict[str, list] = {name: [] for name in OUTPUT_SCHEMA.names}
+    for population, min_age in POPULATIONS.items():
+        in_population = examined & (cols["RIDAGEYR"] >= min_age)
+        valid = in_population[:, None] & ~np.isnan(values)
+        for dimension in dimensions:
+            codes = np.where(in_population, dimension_levels(dimension, cols), 0)
+            sums = cell_sums(codes, respondent_psu, psu_stratum, psus, w, values, valid)
+            quantiles = weighted_quantiles(codes, w, values, valid)
+            for level, label in DIMENSIONS[dimension].items():
+                if level >= len(sums["sample_n"]):
+                    continue
+                for j, measure in enumerate(measures):
+                    if sums["sample_n"][level, j] == 0:
+                        continue
+                    out["survey_cycle"].append(cycle)
+                    out["measure"].append(measure)
+                    out["population"].append(population)
+                    out["dimension"].append(dimension)
+                    out["level"].append(None if dimension == "all" else level)
+                    out["label"].append(label)
+                    for name, a in sums.items():
+                        out[name].append(a[level, j].item())
+                    for name, value in zip(QUANTILE_COLUMNS, quantiles[level, j]):
+                        out[name].append(value.item())
+    return out
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--measures", nargs="+", default=MEASURES, help="subset of MEASURES")
+    parser.add_argument("--dimensions", nargs="+", default=list(DIMENSIONS), help="subset of DIMENSIONS")
+    args = parser.parse_args()
+    for flag, chosen, known in (("--measures", args.measures, MEASURES),
+                                ("--dimensions", args.dimensions, list(DIMENSIONS))):
+        unknown = [c for c in chosen if c not in known]
+        if unknown:
+            parser.error(f"{flag}: unknown {', '.join(unknown)}; choose from {', '.join(known)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    start = time.time()
+    cycles = read_cycles()
+    print(f"{len(args.measures)} measures × {len(args.dimensions)} dimensions × {len(POPULATIONS)} populations, "
+          f"cycles {', '.join(cycles)}")
+
+    columns: dict[str, list] = {name: [] for name in OUTPUT_SCHEMA.names}
+    for cycle, cols in cycles.items():
+        t = time.time()
+        rows = cycle_rows(cycle, cols, args.measures, args.dimensions)
+        for name, values in rows.items():
+            columns[name].extend(values)
+        print(f"  {cycle}: {len(cols['WTMEC2YR']):,} respondents → {len(rows['measure']):,} rows "
+              f"({time.time() - t:.1f}s)")
+
+    table = pa.table(columns, schema=OUTPUT_SCHEMA)
+    weight_total = table.column("weight_total").to_numpy()
+    mean = table.column("weight_sum").to_numpy() / weight_total
+    var = (table.column("var_yy").to_numpy() - 2 * mean * table.column("var_xy").to_numpy()
+           + mean ** 2 * table.column("var_xx").to_numpy())
+    at = table.schema.get_field_index("weight_sum") + 1
+    table = (table.add_column(at, "mean", pa.array(mean))
+             .add_column(at + 1, "se", pa.array(np.sqrt(np.maximum(var, 0)) / weight_total))
+             .sort_by([("measure", "ascending"), ("population", "ascending"), ("dimension", "ascending"),
+                       ("survey_cycle", "ascending"), ("level", "ascending")]))
+
+    # The whole-population cells must reproduce the direct weighted mean
+    overall = table.filter(pc.and_(pc.equal(table.column("population"), "all"),
+                                   pc.equal(table.column("dimension"), "all")))
+    for cycle, measure, mean in zip(*(overall.column(c).to_pylist() for c in ("survey_cycle", "measure", "mean"))):
+        cols = cycles[cycle]
+        rows = (cols["WTMEC2YR"] > 0) & ~np.isnan(cols[measure])
+        direct = np.average(cols[measure][rows], weights=cols["WTMEC2YR"][rows])
+        if abs(mean - direct) > 1e-9 * max(abs(direct), 1):
+            raise ValueError(f"{cycle} {measure}: mean {mean} differs from the direct estimate {direct}")
+
+    tmp_file = OUTPUT_FILE + ".tmp"
+    pq.write_table(table, tmp_file, compression="snappy")
+    os.replace(tmp_file, OUTPUT_FILE)
+    print(f"\nOutput: {OUTPUT_FILE}")
+    print(f"  {table.num_rows:,} rows, {os.path.getsize(OUTPUT_FILE) / 1e6:.1f} MB ({time.time() - start:.1f}s)")
+
+    latest = max(cycles)
+    adults = table.filter(pc.and_(pc.and_(pc.equal(table.column("survey_cycle"), latest),
+                                          pc.equal(table.column("population"), "20+")),
+                                  pc.equal(table.column("dimension"), "all")))
+    print(f"\nAdults 20+, {latest} (weighted mean ± 95% CI, median):")
+    for measure, n, mean, se, p50 in zip(*(adults.column(c).to_pylist()
+                                           for c in ("measure", "sample_n", "mean", "se", "p50"))):
+        print(f"  {measure:10s} {mean:9.2f} ± {1.96 * se:6.2f}  median {p50:8.2f}  (n={n:,})")
+
+
+if __name__ == "__main__":
+    main()
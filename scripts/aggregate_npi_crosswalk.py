@@ -0,0 +1,200 @@
+"""
+Build the NPI crosswalk: one row per NPI per year across Medicaid, Medicare
+Part B, Part D and DAC, for cross-dataset questions that would otherwise join
+the fact tables on their differently named NPI columns at query time.
+
+Each row carries presence flags, a state, a primary specialty and the
+NPI's totals in each dataset for that year:
+
+    npi, year,
+    in_medicaid, in_medicare, in_partd, in_dac,
+    state, specialty,
+    medicaid_paid, medicaid_claims,          -- billing NPI, provider_stats
+    medicare_paid, medicare_services,        -- SUM(Avg_Mdcr_Pymt_Amt * Tot_Srvcs), SUM(Tot_Srvcs)
+    partd_drug_cost, partd_claims            -- SUM(Tot_Drug_Cst), SUM(Tot_Clms)
+
+DAC is a snapshot, so in_dac is the same on every row of an NPI, and NPIs
+found only in DAC get a single row with a NULL year. The state is the
+Medicare, Part D, npi_lookup or DAC one, in that order; the specialty is the
+NPI's most common DAC pri_spec, else the Medicare or Part D provider type,
+upper-cased to DAC's spelling.
+
+Sources that have not been built are skipped (their flags are false). The
+output is sorted by npi with the small row groups and bloom filters of
+aggregate_providers.py, so a lookup by NPI reads one row group.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/aggregate_providers.py    # provider_stats, for Medicaid
+    python scripts/aggregate_npi_crosswalk.py
+"""
+
+import glob
+import os
+import time
+
+import duckdb
+
+from ingest_dac import COMPAT_VIEW_SQL, TABLES as DAC_TABLES
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+DATA = os.path.join(ROOT, "data")
+PROVIDER_STATS = os.path.join(DATA, "provider-aggregates", "provider_stats.parquet")
+NPI_LOOKUP = os.path.join(ROOT, "web", "public", "data", "npi_lookup.parquet")
+DAC_DIR = os.path.join(DATA, "dac")
+DAC_WIDE_FILE = os.path.join(DATA, "dac_clinicians.parquet")
+OUTPUT_FILE = os.path.join(DATA, "npi_crosswalk.parquet")
+
+ROW_GROUP_SIZE = int(os.environ.get("PROVIDER_ROW_GROUP_SIZE", 100_000))
+COPY_OPTIONS = (
+    f"FORMAT PARQUET, COMPRESSION SNAPPY, ROW_GROUP_SIZE {ROW_GROUP_SIZE}, "
+    f"DICTIONARY_SIZE_LIMIT {ROW_GROUP_SIZE}, BLOOM_FILTER_FALSE_POSITIVE_RATIO 0.01"
+)
+
+# Per-source rollups to (npi, year), or to npi for the yearless sources.
+# Medicare and Part D read the same globs as the query-service views.
+SOURCES = {
+    "medicaid": (
+        [PROVIDER_STATS],
+        """
+        SELECT CAST(billing_npi AS VARCHAR) AS npi, CAST(year AS SMALLINT) AS year,
+               SUM(total_paid)::DOUBLE AS medicaid_paid, SUM(total_claims)::BIGINT AS medicaid_claims
+        FROM read_parquet({files}) GROUP BY ALL
+        """,
+    ),
+    "medicare": (
+        sorted(glob.glob(os.path.join(DATA, "medicare_*.parquet"))),
+        """
+        SELECT CAST(Rndrng_NPI AS VARCHAR) AS npi, CAST(data_year AS SMALLINT) AS year,
+               SUM(Avg_Mdcr_Pymt_Amt * Tot_Srvcs)::DOUBLE AS medicare_paid,
+               SUM(Tot_Srvcs)::DOUBLE AS medicare_services,
+               ANY_VALUE(Rndrng_Prvdr_State_Abrvtn) AS medicare_state,
+               ANY_VALUE(Rndrng_Prvdr_Type) AS medicare_type
+        FROM read_parquet({files}, union_by_name=true) GROUP BY ALL
+        """,
+    ),
+    "partd": (
+        sorted(glob.glob(os.path.join(DATA, "partd_*.parquet"))),
+        """
+        SELECT CAST(Prscrbr_NPI AS VARCHAR) AS npi, CAST(data_year AS SMALLINT) AS year,
+               SUM(Tot_Drug_Cst)::DOUBLE AS partd_drug_cost, SUM(Tot_Clms)::BIGINT AS partd_claims,
+               ANY_VALUE(Prscrbr_State_Abrvtn) AS partd_state,
+               ANY_VALUE(Prscrbr_Type) AS partd_type
+        FROM read_parquet({files}, union_by_name=true) GROUP BY ALL
+        """,
+    ),
+    "lookup": (
+        [NPI_LOOKUP],
+        "SELECT CAST(billing_npi AS VARCHAR) AS npi, ANY_VALUE(state) AS lookup_state FROM read_parquet({files}) GROUP BY 1",
+    ),
+    "dac": (
+        [],  # registered by register_dac()
+        "SELECT npi, MODE(pri_spec) AS dac_specialty, MODE(state) AS dac_state FROM dac GROUP BY 1",
+    ),
+}
+
+# Empty stand-ins for sources that have not been built
+EMPTY_SOURCES = {
+    "medicaid": "npi VARCHAR, year SMALLINT, medicaid_paid DOUBLE, medicaid_claims BIGINT",
+    "medicare": "npi VARCHAR, year SMALLINT, medicare_paid DOUBLE, medicare_services DOUBLE, "
+                "medicare_state VARCHAR, medicare_type VARCHAR",
+    "partd": "npi VARCHAR, year SMALLINT, partd_drug_cost DOUBLE, partd_claims BIGINT, "
+             "partd_state VARCHAR, partd_type VARCHAR",
+    "lookup": "npi VARCHAR, lookup_state VARCHAR",
+    "dac": "npi VARCHAR, dac_specialty VARCHAR, dac_state VARCHAR",
+}
+
+CROSSWALK_SQL = """
+    WITH yearly AS (
+        SELECT npi, year FROM medicaid
+        UNION SELECT npi, year FROM medicare
+        UNION SELECT npi, year FROM partd
+    ),
+    keys AS (
+        SELECT * FROM yearly
+        UNION ALL
+        SELECT npi, NULL::SMALLINT FROM dac ANTI JOIN yearly USING (npi)
+    )
+    SELECT
+        k.npi,
+        k.year,
+        m.npi IS NOT NULL AS in_medicaid,
+        b.npi IS NOT NULL AS in_medicare,
+        d.npi IS NOT NULL AS in_partd,
+        c.npi IS NOT NULL AS in_dac,
+        COALESCE(b.medicare_state, d.partd_state, l.lookup_state, c.dac_state) AS state,
+        COALESCE(c.dac_specialty, UPPER(b.medicare_type), UPPER(d.partd_type)) AS specialty,
+        m.medicaid_paid,
+        m.medicaid_claims,
+        b.medicare_paid,
+        b.medicare_services,
+        d.partd_drug_cost,
+        d.partd_claims
+    FROM keys k
+    LEFT JOIN medicaid m ON m.npi = k.npi AND m.year = k.year
+    LEFT JOIN medicare b ON b.npi = k.npi AND b.year = k.year
+    LEFT JOIN partd d ON d.npi = k.npi AND d.year = k.year
+    LEFT JOIN lookup l ON l.npi = k.npi
+    LEFT JOIN dac c ON c.npi = k.npi
+    ORDER BY k.npi, k.year
+"""
+
+
+def register_dac(con) -> bool:
+    """Create a `dac` view over the normalized tables, or the wide file."""
+    if os.path.isdir(DAC_DIR):
+        for table in DAC_TABLES:
+            con.execute(f"CREATE VIEW dac_{table} AS SELECT * FROM read_parquet('{DAC_DIR}/{table}.parquet')")
+        con.execute(f"CREATE VIEW dac AS {COMPAT_VIEW_SQL}")
+        return True
+    if os.path.exists(DAC_WIDE_FILE):
+        con.execute(f"CREATE VIEW dac AS SELECT * FROM read_parquet('{DAC_WIDE_FILE}')")
+        return True
+    return False
+
+
+def main():
+    con = duckdb.connect()
+    start = time.time()
+
+    print("Sources:")
+    has_dac = register_dac(con)
+    for name, (files, sql) in SOURCES.items():
+        t = time.time()
+        files = [f for f in files if os.path.exists(f)]
+        if (has_dac if name == "dac" else files):
+            con.execute(f"CREATE TEMP TABLE {name} AS {sql.format(files=files)}")
+            rows = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            print(f"  {name}: {rows:,} rows ({time.time() - t:.1f}s)")
+        else:
+            con.execute(f"CREATE TEMP TABLE {name} ({EMPTY_SOURCES[name]})")
+            print(f"  {name}: not built — skipped")
+
+    t = time.time()
+    tmp_file = OUTPUT_FILE + ".tmp"
+    con.execute(f"COPY ({CROSSWALK_SQL}) TO '{tmp_file}' ({COPY_OPTIONS})")
+    os.replace(tmp_file, OUTPUT_FILE)
+
+    con.execute(f"CREATE VIEW npi_crosswalk AS SELECT * FROM read_parquet('{OUTPUT_FILE}')")
+    rows, npis = con.execute("SELECT COUNT(*), COUNT(DISTINCT npi) FROM npi_crosswalk").fetchone()
+    print(f"\nOutput: {OUTPUT_FILE}")
+    print(f"  {rows:,} rows, {npis:,} NPIs, {os.path.getsize(OUTPUT_FILE) / 1e6:.1f} MB ({time.time() - t:.1f}s)")
+
+    print("\nNPIs by dataset coverage (any year):")
+    coverage = con.execute("""
+        SELECT CONCAT_WS(' + ', IF(m, 'medicaid', NULL), IF(b, 'medicare', NULL),
+                         IF(d, 'partd', NULL), IF(c, 'dac', NULL)) AS datasets, COUNT(*) AS npis
+        FROM (
+            SELECT BOOL_OR(in_medicaid) m, BOOL_OR(in_medicare) b, BOOL_OR(in_partd) d, BOOL_OR(in_dac) c
+            FROM npi_crosswalk GROUP BY npi
+        )
+        GROUP BY 1 ORDER BY npis DESC
+    """).fetchall()
+    for datasets, count in coverage:
+        print(f"  {datasets:35s} {count:>10,}")
+
+    print(f"\nDone in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
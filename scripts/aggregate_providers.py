@@ -1,32 +1,104 @@
-"""Pre-aggregate provider-level data from raw Medicaid Parquet for fast detail page lookups."""
+"""Pre-aggregate provider-level data from raw Medicaid Parquet for fast detail page lookups.
 
+All three outputs are derived from the billing_npi × hcpcs_code × claim_month
+rollup shared with aggregate.py (see incremental.py).
+
+The provider detail page reads these by a single billing_npi, so every output
+is clustered by billing_npi with small row groups: row-group min/max stats
+then skip all but one or two row groups, and per-row-group bloom filters on
+the dictionary-encoded billing_npi column rule out the rest. Row group size
+can be tuned with PROVIDER_ROW_GROUP_SIZE (see bench_provider_lookup.py).
+
+Usage:
+    python scripts/aggregate_providers.py                 # full rebuild
+    python scripts/aggregate_providers.py --incremental   # only months changed since last run
+"""
+
+import argparse
 import duckdb
 import os
+import sys
 import time
 
+from incremental import changed_months, load_state, merge_parquet, refresh_rollup, save_state, sql_dates
+
 RAW = os.path.join(os.path.dirname(__file__), "..", "medicaid-provider-spending.parquet")
 OUT = os.path.join(os.path.dirname(__file__), "..", "data", "provider-aggregates")
+ROW_GROUP_SIZE = int(os.environ.get("PROVIDER_ROW_GROUP_SIZE", 100_000))
+
+# Dictionary pages (and so bloom filters) are only written while a row group's
+# distinct values fit the dictionary; one row group never exceeds its row count.
+COPY_OPTIONS = (
+    f"FORMAT PARQUET, COMPRESSION SNAPPY, ROW_GROUP_SIZE {ROW_GROUP_SIZE}, "
+    f"DICTIONARY_SIZE_LIMIT {ROW_GROUP_SIZE}, BLOOM_FILTER_FALSE_POSITIVE_RATIO 0.01"
+)
+
+OUTPUTS = ["provider_stats.parquet", "provider_hcpcs.parquet", "provider_monthly.parquet"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--incremental", action="store_true", help="only rebuild months changed since the last run")
+INCREMENTAL = parser.parse_args().incremental
 
 os.makedirs(OUT, exist_ok=True)
 con = duckdb.connect()
 
 start = time.time()
 
+# Months to rebuild; None means a full rebuild of every output
+changed = None
+
 
-def write_parquet(name: str, sql: str):
+def scope(name: str, source: str, predicate: str):
+    """Restrict `source` to the groups being rebuilt (all of it on a full run)."""
+    if changed is None:
+        con.sql(f"CREATE OR REPLACE TEMP VIEW {name} AS SELECT * FROM {source}")
+        return
     t = time.time()
-    con.sql(f"COPY ({sql}) TO '{OUT}/{name}.parquet' (FORMAT PARQUET, COMPRESSION SNAPPY)")
-    rows = con.sql(f"SELECT count(*) FROM '{OUT}/{name}.parquet'").fetchone()[0]
-    size = os.path.getsize(f"{OUT}/{name}.parquet")
+    con.sql(f"CREATE OR REPLACE TEMP TABLE {name} AS SELECT * FROM {source} WHERE {predicate}")
+    rows = con.sql(f"SELECT count(*) FROM {name}").fetchone()[0]
+    print(f"  {name} — {rows:,} rows ({time.time() - t:.1f}s)")
+
+
+def write_parquet(name: str, sql: str, stale: str, order_by: str):
+    """Write an output, or on an incremental run replace its `stale` rows."""
+    t = time.time()
+    path = f"{OUT}/{name}.parquet"
+    if changed is None:
+        con.sql(f"COPY ({sql} ORDER BY {order_by}) TO '{path}' ({COPY_OPTIONS})")
+    else:
+        merge_parquet(con, path, sql, stale, order_by, COPY_OPTIONS)
+    rows = con.sql(f"SELECT count(*) FROM '{path}'").fetchone()[0]
+    size = os.path.getsize(path)
     print(f"  {name}.parquet — {rows:,} rows, {size / 1e6:.1f} MB ({time.time() - t:.1f}s)")
     return rows
 
 
+# ---------------------------------------------------------------------------
+# 0. Rollup — the only pass over the raw file
+# ---------------------------------------------------------------------------
+print("\n[0/3] rollup")
+months = refresh_rollup(con, RAW, INCREMENTAL)
+previous = load_state(OUT, {}, OUTPUTS) if INCREMENTAL else None
+if previous is not None:
+    changed = changed_months(previous, months)
+    if not changed:
+        print("\nNo new or restated months — outputs are up to date.")
+        sys.exit(0)
+    print(f"  changed months: {', '.join(changed)}")
+
+# Yearly outputs are rebuilt for every year containing a changed month
+changed_dates = sql_dates(changed or [])
+changed_years = sorted({int(m[:4]) for m in changed or []})
+year_months = sql_dates(m for m in set(months) | set(changed or []) if int(m[:4]) in changed_years)
+stale_years = f"year IN ({', '.join(map(str, changed_years)) or 'NULL'})"
+scope("month_base", "base", f"claim_month IN ({changed_dates})")
+scope("year_base", "base", f"claim_month IN ({year_months})")
+
 # ---------------------------------------------------------------------------
 # 1. provider_stats — 1 row per provider per year (~2.4M rows)
 # ---------------------------------------------------------------------------
 print("\n[1/3] provider_stats")
-write_parquet("provider_stats", f"""
+write_parquet("provider_stats", """
     SELECT
         billing_npi,
         YEAR(claim_month) AS year,
@@ -36,15 +108,15 @@ write_parquet("provider_stats", f"""
         COUNT(DISTINCT hcpcs_code)::INT AS procedures_billed,
         MIN(claim_month) AS first_month,
         MAX(claim_month) AS last_month
-    FROM '{RAW}'
+    FROM year_base
     GROUP BY billing_npi, YEAR(claim_month)
-""")
+""", stale=stale_years, order_by="billing_npi, year")
 
 # ---------------------------------------------------------------------------
 # 2. provider_hcpcs — per-provider per-year procedure totals (~19M rows)
 # ---------------------------------------------------------------------------
 print("\n[2/3] provider_hcpcs")
-write_parquet("provider_hcpcs", f"""
+write_parquet("provider_hcpcs", """
     SELECT
         billing_npi,
         YEAR(claim_month) AS year,
@@ -52,24 +124,25 @@ write_parquet("provider_hcpcs", f"""
         SUM(total_paid)::DOUBLE AS total_paid,
         SUM(total_claims)::BIGINT AS total_claims,
         SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries
-    FROM '{RAW}'
+    FROM year_base
     GROUP BY billing_npi, YEAR(claim_month), hcpcs_code
-""")
+""", stale=stale_years, order_by="billing_npi, year, hcpcs_code")
 
 # ---------------------------------------------------------------------------
 # 3. provider_monthly — per-provider monthly trend (~20M rows)
 # ---------------------------------------------------------------------------
 print("\n[3/3] provider_monthly")
-write_parquet("provider_monthly", f"""
+write_parquet("provider_monthly", """
     SELECT
         billing_npi,
         claim_month,
         SUM(total_paid)::DOUBLE AS total_paid,
         SUM(total_claims)::BIGINT AS total_claims
-    FROM '{RAW}'
+    FROM month_base
     GROUP BY billing_npi, claim_month
-    ORDER BY billing_npi, claim_month
-""")
+""", stale=f"claim_month IN ({changed_dates})", order_by="billing_npi, claim_month")
+
+save_state(OUT, months, {})
 
 elapsed = time.time() - start
 print(f"\nAll done in {elapsed:.0f}s")
@@ -0,0 +1,208 @@
+"""
+Measure what narrower column types would save on the Medicare and Part D
+outputs.
+
+Rewrites the existing partd_*.parquet / medicare_*.parquet files with the
+types below into a temp dir, then compares per-column storage and the
+latency of typical queries over both layouts, through views defined the way
+query-service/src/db.ts defines them (NPIs cast to VARCHAR).
+
+This is why the ingests write the source types. Counts as INTEGER instead of
+BIGINT saved ~1% on Part D and nothing on Medicare (bench_pipeline.py's
+synthetic data), with queries 0.67x-1.18x as fast. NPIs as BIGINT saved
+2-4%, but the views CAST them back to VARCHAR, and a filter on the cast
+cannot be pushed into the scan, so single-NPI lookups were ~2.5x slower.
+DECIMAL(14,2) amounts stored ~13% smaller, but SUM over a DECIMAL
+accumulates in 128 bits and made high-cardinality GROUP BYs (top
+prescribers) ~3x slower. Parquet has no ENUM type: DuckDB writes an ENUM as
+a dictionary-encoded string, which its writer already does for these
+VARCHAR columns; the bench checks they come out dictionary-encoded.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/ingest_partd.py            # and/or ingest_medicare*.py
+    python scripts/bench_compact_types.py [repeats]
+"""
+
+import glob
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import duckdb
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data")
+
+# Narrower types compared against the source types
+PARTD_TYPES = {
+    "Tot_Clms": "INTEGER",
+    "Tot_Day_Suply": "INTEGER",
+    "Tot_Benes": "INTEGER",
+    "GE65_Tot_Clms": "INTEGER",
+    "GE65_Tot_Day_Suply": "INTEGER",
+    "GE65_Tot_Benes": "INTEGER",
+}
+
+MEDICARE_TYPES = {
+    "Tot_Benes": "INTEGER",
+    "Tot_Bene_Day_Srvcs": "INTEGER",
+}
+
+# Low-cardinality strings that should always be dictionary-encoded
+PARTD_DICTIONARY_COLUMNS = [
+    "Prscrbr_City", "Prscrbr_State_Abrvtn", "Prscrbr_State_FIPS", "Prscrbr_Type",
+    "Prscrbr_Type_Src", "Brnd_Name", "Gnrc_Name", "GE65_Sprsn_Flag", "GE65_Bene_Sprsn_Flag",
+]
+MEDICARE_DICTIONARY_COLUMNS = [
+    "Rndrng_Prvdr_Crdntls", "Rndrng_Prvdr_Ent_Cd", "Rndrng_Prvdr_City", "Rndrng_Prvdr_State_Abrvtn",
+    "Rndrng_Prvdr_State_FIPS", "Rndrng_Prvdr_RUCA", "Rndrng_Prvdr_RUCA_Desc", "Rndrng_Prvdr_Cntry",
+    "Rndrng_Prvdr_Type", "Rndrng_Prvdr_Mdcr_Prtcptg_Ind", "HCPCS_Cd", "HCPCS_Desc", "HCPCS_Drug_Ind",
+    "Place_Of_Srvc",
+]
+
+
+def replace_clause(types: dict[str, str]) -> str:
+    """`* REPLACE (...)` list casting `types`' columns, for SELECT * {clause}."""
+    casts = ", ".join(f"CAST({col} AS {t}) AS {col}" for col, t in types.items())
+    return f"REPLACE ({casts})"
+
+
+# Same NPI cast as GLOB_VIEW_COLUMNS in query-service/src/db.ts
+MEDICARE_COLS = "CAST(Rndrng_NPI AS VARCHAR) AS Rndrng_NPI, * EXCLUDE (Rndrng_NPI)"
+PARTD_COLS = "CAST(Prscrbr_NPI AS VARCHAR) AS Prscrbr_NPI, * EXCLUDE (Prscrbr_NPI)"
+
+# Queries modeled on the web app's Part D / Medicare query patterns;
+# $year is the latest year present and $npi a sampled provider.
+PARTD_QUERIES = {
+    "top drugs": """
+        SELECT Gnrc_Name, SUM(Tot_Clms) AS claims, ROUND(SUM(Tot_Drug_Cst), 0)
+        FROM v WHERE data_year = $year GROUP BY Gnrc_Name ORDER BY claims DESC LIMIT 10
+    """,
+    "top prescribers": """
+        SELECT Prscrbr_NPI, Prscrbr_State_Abrvtn, ROUND(SUM(Tot_Drug_Cst), 0) AS cost
+        FROM v WHERE data_year = $year GROUP BY ALL ORDER BY cost DESC LIMIT 20
+    """,
+    "by state": """
+        SELECT Prscrbr_State_Abrvtn, SUM(Tot_Drug_Cst), COUNT(DISTINCT Prscrbr_NPI)
+        FROM v WHERE data_year = $year GROUP BY 1
+    """,
+    "one prescriber": "SELECT Gnrc_Name, Tot_Clms, Tot_Drug_Cst FROM v WHERE Prscrbr_NPI = $npi",
+}
+MEDICARE_QUERIES = {
+    "top HCPCS": """
+        SELECT HCPCS_Cd, SUM(Tot_Srvcs * Avg_Mdcr_Pymt_Amt) AS paid
+        FROM v WHERE data_year = $year GROUP BY 1 ORDER BY paid DESC LIMIT 20
+    """,
+    "by specialty": """
+        SELECT Rndrng_Prvdr_Type, COUNT(DISTINCT Rndrng_NPI), SUM(Tot_Benes)
+        FROM v WHERE data_year = $year GROUP BY 1
+    """,
+    "by state": """
+        SELECT Rndrng_Prvdr_State_Abrvtn, SUM(Tot_Srvcs), SUM(Tot_Bene_Day_Srvcs)
+        FROM v GROUP BY 1
+    """,
+    "one provider": "SELECT HCPCS_Cd, Tot_Srvcs FROM v WHERE Rndrng_NPI = $npi",
+}
+
+DATASETS = [
+    # name, file pattern, compact types, view columns, queries, npi column, dictionary columns
+    ("partd", r"partd_\d{4}\.parquet", PARTD_TYPES, PARTD_COLS, PARTD_QUERIES,
+     "Prscrbr_NPI", PARTD_DICTIONARY_COLUMNS),
+    ("medicare", r"medicare_physician_2023\.parquet", MEDICARE_TYPES, MEDICARE_COLS, MEDICARE_QUERIES,
+     "Rndrng_NPI", MEDICARE_DICTIONARY_COLUMNS),
+    ("medicare_multiyear", r"medicare_(\d{4}|physician_all_years)\.parquet", MEDICARE_TYPES, MEDICARE_COLS,
+     MEDICARE_QUERIES, "Rndrng_NPI", MEDICARE_DICTIONARY_COLUMNS),
+]
+
+
+def column_bytes(con, files: list[str]) -> dict[str, int]:
+    rows = con.execute(f"""
+        SELECT path_in_schema, SUM(total_compressed_size)
+        FROM parquet_metadata({files}) GROUP BY 1
+    """).fetchall()
+    return dict(rows)
+
+
+def plain_encoded(con, files: list[str], columns: list[str]) -> list[str]:
+    """Columns of `columns` with any column chunk not dictionary-encoded."""
+    rows = con.execute(f"""
+        SELECT DISTINCT path_in_schema FROM parquet_metadata({files})
+        WHERE encodings NOT LIKE '%DICTIONARY%'
+    """).fetchall()
+    return [c for (c,) in rows if c in columns]
+
+
+def time_queries(files: list[str], view_cols: str, queries: dict, params: dict, repeats: int) -> dict[str, float]:
+    con = duckdb.connect()
+    con.execute(f"CREATE VIEW v AS SELECT {view_cols} FROM read_parquet({files}, union_by_name=true)")
+    timings = {}
+    for label, sql in queries.items():
+        used = {k: v for k, v in params.items() if f"${k}" in sql}
+        con.execute(sql, used).fetchall()  # warm the OS page cache
+        runs = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            con.execute(sql, used).fetchall()
+            runs.append((time.perf_counter() - t) * 1000)
+        timings[label] = statistics.median(runs)
+    con.close()
+    return timings
+
+
+def bench(name, pattern, types, view_cols, queries, npi_col, dict_cols, repeats: int):
+    files = sorted(f for f in glob.glob(f"{DATA}/*.parquet") if re.fullmatch(pattern, os.path.basename(f)))
+    if not files:
+        print(f"\n{name}: no files matching {pattern} — skipped")
+        return
+
+    con = duckdb.connect()
+    tmp = tempfile.mkdtemp(prefix=f"compact-{name}-")
+    try:
+        compact = []
+        for f in files:
+            out = os.path.join(tmp, os.path.basename(f))
+            con.execute(f"""
+                COPY (SELECT * {replace_clause(types)} FROM read_parquet('{f}'))
+                TO '{out}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+            """)
+            compact.append(out)
+
+        before, after = column_bytes(con, files), column_bytes(con, compact)
+        total_before, total_after = sum(before.values()), sum(after.values())
+        print(f"\n{name}: {len(files)} files, {total_before / 1e6:,.1f} MB → {total_after / 1e6:,.1f} MB "
+              f"({1 - total_after / total_before:.0%} saved)")
+        for col in sorted(before, key=lambda c: before[c] - after.get(c, 0), reverse=True)[:8]:
+            saved = before[col] - after.get(col, 0)
+            if saved > 0:
+                print(f"  {col:32s} {before[col] / 1e6:9,.1f} MB → {after[col] / 1e6:9,.1f} MB")
+        plain = plain_encoded(con, compact, dict_cols)
+        print(f"  dictionary-encoded: {len(dict_cols) - len(plain)}/{len(dict_cols)} low-cardinality columns"
+              + (f" (plain: {', '.join(plain)})" if plain else ""))
+
+        year, npi = con.execute(f"""
+            SELECT MAX(data_year), ANY_VALUE(CAST({npi_col} AS VARCHAR))
+            FROM read_parquet({files}, union_by_name=true)
+        """).fetchone()
+        con.close()
+        params = {"year": year, "npi": npi}
+        old = time_queries(files, view_cols, queries, params, repeats)
+        new = time_queries(compact, view_cols, queries, params, repeats)
+        print(f"  {'query':20s} {'original':>10s} {'compact':>18s}")
+        for label in queries:
+            print(f"  {label:20s} {old[label]:8.1f} ms {new[label]:8.1f} ms ({old[label] / new[label]:4.2f}x)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for dataset in DATASETS:
+        bench(*dataset, repeats=repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Benchmark the ingest and aggregation pipeline on synthetic data, offline.
+
+Generates Medicaid, Medicare Part B and Part D CSVs of --rows rows each
+(Medicare and Part D split over --years years), with the real files' columns
+and per-row cardinalities: Medicaid has ~370 rows per billing NPI and ~140
+per servicing NPI over 10,881 HCPCS codes and 84 months; Medicare ~8 rows per
+NPI per year over 6,000 HCPCS codes; Part D ~25 per prescriber per year over
+2,000 drugs. Provider, code and drug frequencies are skewed the way claims
+are (a few account for most rows). Values are derived from hash(row), so a
+scale always generates the same files; they are kept under
+<workdir>/<rows>/inputs and reused.
+
+Each stage then runs as its own process in a copy of the repo's scripts
+under <workdir>/<rows>/tree, with the Medicare / Part D CSVs seeded into a
+private download cache (no network access):
+
+    convert              convert_to_parquet.py
+    aggregate            scripts/aggregate.py
+    aggregate_providers  scripts/aggregate_providers.py
+    medicare             scripts/ingest_medicare_multiyear.py <years>
+    partd                scripts/ingest_partd.py <years>
+    crosswalk            scripts/aggregate_npi_crosswalk.py
+
+Before a stage runs, its earlier outputs and resume state are deleted
+(CLEARS), so each run does the full work rather than, e.g., the Medicare
+ingest skipping years its manifest says are complete. Its wall time,
+rows/sec (source rows the stage consumes), peak RSS (of its largest
+process, workers included) and output bytes (files it created or rewrote)
+are appended to a JSON history. The report compares each stage to
+the median of the previous --baseline runs on the same host and scale and
+flags anything more than --threshold slower or larger. Stage logs are kept
+in <workdir>/<rows>/logs.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/bench_pipeline.py                        # 1M rows, all stages
+    python scripts/bench_pipeline.py --rows 10M aggregate   # one stage (earlier outputs reused)
+    python scripts/bench_pipeline.py --rows 100M --workers 8
+    python scripts/bench_pipeline.py --report               # last run vs baseline, no run
+    python scripts/bench_pipeline.py --fail-on-regression   # exit 1 on a flagged stage (CI)
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import duckdb
+
+from ingest_medicare_multiyear import YEAR_URLS as MEDICARE_URLS
+from ingest_partd import CSV_SCHEMA as PARTD_CSV_SCHEMA, YEARS as PARTD_URLS
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SCRIPTS)
+WORKDIR = os.path.join(ROOT, "data", "bench")
+HISTORY_FILE = os.path.join(WORKDIR, "pipeline_history.json")
+
+# Real-file ratios the generator scales with --rows
+MEDICAID_ROWS_PER_BILLING_NPI = 370
+MEDICAID_ROWS_PER_SERVICING_NPI = 140
+MEDICAID_HCPCS = 10_881
+MEDICAID_MONTHS = 84  # 2018-01 .. 2024-12
+MEDICARE_ROWS_PER_NPI = 8
+MEDICARE_HCPCS = 6_000
+PARTD_ROWS_PER_NPI = 25
+PARTD_DRUGS = 2_000
+
+STATES = ["CA", "TX", "FL", "NY", "PA", "IL", "OH", "GA", "NC", "MI", "NJ", "VA", "WA", "AZ", "MA", "TN",
+          "IN", "MO", "MD", "WI", "CO", "MN", "SC", "AL", "LA", "KY", "OR", "OK", "CT", "UT", "PR", "DC"]
+SPECIALTIES = ["Internal Medicine", "Family Practice", "Nurse Practitioner", "Physician Assistant",
+               "Cardiology", "Diagnostic Radiology", "Orthopedic Surgery", "Emergency Medicine",
+               "Psychiatry", "Dermatology", "Anesthesiology", "Physical Therapist in Private Practice"]
+
+# name, command (relative to the tree), source datasets consumed, files it needs
+STAGES = [
+    ("convert", ["convert_to_parquet.py"], ["medicaid"], ["medicaid-provider-spending.csv"]),
+    ("aggregate", ["scripts/aggregate.py"], ["medicaid"],
+     ["medicaid-provider-spending.parquet", "web/public/data/npi_lookup.parquet"]),
+    ("aggregate_providers", ["scripts/aggregate_providers.py"], ["medicaid"],
+     ["medicaid-provider-spending.parquet"]),
+    ("medicare", ["scripts/ingest_medicare_multiyear.py"], ["medicare"], []),
+    ("partd", ["scripts/ingest_partd.py"], ["partd"], []),
+    ("crosswalk", ["scripts/aggregate_npi_crosswalk.py"], ["medicaid", "medicare", "partd"],
+     ["data/provider-aggregates/provider_stats.parquet"]),
+]
+STAGE_NAMES = [name for name, *_ in STAGES]
+# Files (globs, relative to the tree) a stage resumes from or only rewrites
+# when changed; deleted before it runs
+CLEARS = {
+    "medicare": ["data/medicare_manifest.json", "data/medicare_*.parquet"],
+    "partd": ["data/partd_*.parquet"],
+}
+# Stages that take --workers
+WORKER_STAGES = {"convert", "medicare", "partd"}
+
+
+def parse_rows(text: str) -> int:
+    text = text.strip().upper()
+    for suffix, factor in (("K", 1_000), ("M", 1_000_000), ("B", 1_000_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def label(rows: int) -> str:
+    for suffix, factor in (("B", 1_000_000_000), ("M", 1_000_000), ("K", 1_000)):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{suffix}"
+    return str(rows)
+
+
+def uniform(i: str, k: int) -> str:
+    """SQL for a deterministic uniform [0, 1) value of row `i`, stream `k`."""
+    return f"((hash({i}, {k}) % 1000000) / 1e6)"
+
+
+def skewed(i: str, k: int, n: int) -> str:
+    """SQL for a deterministic index in [0, n), cubed toward 0 like claim volumes."""
+    return f"CAST(FLOOR({n} * POW({uniform(i, k)}, 3)) AS BIGINT)"
+
+
+def pick(values: list[str], index: str) -> str:
+    quoted = ", ".join(f"'{v}'" for v in values)
+    return f"[{quoted}][1 + CAST(({index}) % {len(values)} AS BIGINT)]"
+
+
+def npi(index: str, base: int) -> str:
+    return f"CAST({base} + ({index}) * 7 AS VARCHAR)"
+
+
+def generate_medicaid(con, rows: int, csv_path: str, lookup_path: str):
+    billing = max(rows // MEDICAID_ROWS_PER_BILLING_NPI, 1)
+    servicing = max(rows // MEDICAID_ROWS_PER_SERVICING_NPI, 1)
+    con.execute(f"""
+        COPY (
+            SELECT
+                {npi(skewed('i', 1, billing), 1_000_000_000)} AS BILLING_PROVIDER_NPI_NUM,
+                {npi(skewed('i', 2, servicing), 1_000_000_003)} AS SERVICING_PROVIDER_NPI_NUM,
+                'H' || LPAD(CAST({skewed('i', 3, MEDICAID_HCPCS)} AS VARCHAR), 4, '0') AS HCPCS_CODE,
+                STRFTIME(DATE '2018-01-01' + TO_MONTHS(CAST(hash(i, 4) % {MEDICAID_MONTHS} AS INTEGER)), '%Y-%m')
+                    AS CLAIM_FROM_MONTH,
+                CAST(12 + hash(i, 5) % 400 AS INTEGER) AS TOTAL_UNIQUE_BENEFICIARIES,
+                CAST(12 + hash(i, 6) % 2000 AS INTEGER) AS TOTAL_CLAIMS,
+                ROUND(10 + 50000 * POW({uniform('i', 7)}, 4), 2) AS TOTAL_PAID
+            FROM range({rows}) t(i)
+        ) TO '{csv_path}' (HEADER)
+    """)
+    con.execute(f"""
+        COPY (
+            SELECT
+                {npi('n', 1_000_000_000)} AS billing_npi,
+                'PROVIDER ' || n AS provider_name,
+                IF(hash(n, 1) % 4 = 0, 'Organization', 'Individual') AS provider_type,
+                'CITY ' || CAST(hash(n, 2) % 500 AS VARCHAR) AS city,
+                {pick(STATES, 'hash(n, 3)')} AS state
+            FROM range({billing}) t(n)
+        ) TO '{lookup_path}' (FORMAT PARQUET)
+    """)
+
+
+def generate_medicare(con, rows: int, year: int, csv_path: str):
+    npis = max(rows // MEDICARE_ROWS_PER_NPI, 1)
+    n = skewed(f"i + {year}", 1, npis)
+    con.execute(f"""
+        COPY (
+            SELECT
+                CAST(1000000000 + n * 11 AS VARCHAR) AS Rndrng_NPI,
+                'LAST' || n AS Rndrng_Prvdr_Last_Org_Name,
+                'FIRST' || CAST(hash(n, 2) % 5000 AS VARCHAR) AS Rndrng_Prvdr_First_Name,
+                'A' AS Rndrng_Prvdr_MI,
+                {pick(["M.D.", "MD", "D.O.", "NP", "PA-C"], 'hash(n, 3)')} AS Rndrng_Prvdr_Crdntls,
+                {pick(["M", "F"], 'hash(n, 4)')} AS Rndrng_Prvdr_Gndr,
+                'I' AS Rndrng_Prvdr_Ent_Cd,
+                CAST(hash(n, 5) % 9999 AS VARCHAR) || ' MAIN ST' AS Rndrng_Prvdr_St1,
+                '' AS Rndrng_Prvdr_St2,
+                'CITY ' || CAST(hash(n, 6) % 500 AS VARCHAR) AS Rndrng_Prvdr_City,
+                {pick(STATES, 'hash(n, 7)')} AS Rndrng_Prvdr_State_Abrvtn,
+                LPAD(CAST(1 + hash(n, 7) % {len(STATES)} AS VARCHAR), 2, '0') AS Rndrng_Prvdr_State_FIPS,
+                LPAD(CAST(hash(n, 8) % 99999 AS VARCHAR), 5, '0') AS Rndrng_Prvdr_Zip5,
+                1 + hash(n, 9) % 10 AS Rndrng_Prvdr_RUCA,
+                'Metropolitan area core' AS Rndrng_Prvdr_RUCA_Desc,
+                'US' AS Rndrng_Prvdr_Cntry,
+                {pick(SPECIALTIES, 'hash(n, 10)')} AS Rndrng_Prvdr_Type,
+                'Y' AS Rndrng_Prvdr_Mdcr_Prtcptg_Ind,
+                LPAD(CAST(h AS VARCHAR), 5, '0') AS HCPCS_Cd,
+                'Procedure ' || h AS HCPCS_Desc,
+                IF(h % 20 = 0, 'Y', 'N') AS HCPCS_Drug_Ind,
+                {pick(["O", "F"], 'hash(i, 11)')} AS Place_Of_Srvc,
+                11 + hash(i, 12) % 300 AS Tot_Benes,
+                ROUND(11 + 2000 * POW({uniform('i', 13)}, 4), 1) AS Tot_Srvcs,
+                11 + hash(i, 14) % 500 AS Tot_Bene_Day_Srvcs,
+                ROUND(20 + 900 * {uniform('i', 15)}, 2) AS Avg_Sbmtd_Chrg,
+                ROUND(10 + 300 * {uniform('i', 16)}, 2) AS Avg_Mdcr_Alowd_Amt,
+                ROUND(8 + 240 * {uniform('i', 16)}, 2) AS Avg_Mdcr_Pymt_Amt,
+                ROUND(8 + 240 * {uniform('i', 17)}, 2) AS Avg_Mdcr_Stdzd_Amt
+            FROM (SELECT i, {n} AS n, {skewed('i', 18, MEDICARE_HCPCS)} AS h FROM range({rows}) t(i))
+        ) TO '{csv_path}' (HEADER)
+    """)
+
+
+def generate_partd(con, rows: int, year: int, csv_path: str):
+    npis = max(rows // PARTD_ROWS_PER_NPI, 1)
+    values = {
+        "Prscrbr_NPI": "CAST(1000000000 + n * 13 AS VARCHAR)",
+        "Prscrbr_Last_Org_Name": "'LAST' || n",
+        "Prscrbr_First_Name": "'FIRST' || CAST(hash(n, 2) % 5000 AS VARCHAR)",
+        "Prscrbr_City": "'CITY ' || CAST(hash(n, 6) % 500 AS VARCHAR)",
+        "Prscrbr_State_Abrvtn": pick(STATES, "hash(n, 7)"),
+        "Prscrbr_State_FIPS": f"LPAD(CAST(1 + hash(n, 7) % {len(STATES)} AS VARCHAR), 2, '0')",
+        "Prscrbr_Type": pick(SPECIALTIES, "hash(n, 10)"),
+        "Prscrbr_Type_Src": "'S'",
+        "Brnd_Name": "'BRAND ' || d",
+        "Gnrc_Name": "'generic ' || CAST(d // 2 AS VARCHAR)",
+        "Tot_Clms": "11 + hash(i, 12) % 400",
+        "Tot_30day_Fills": f"ROUND(11 + 600 * {uniform('i', 13)}, 1)",
+        "Tot_Day_Suply": "30 + hash(i, 14) % 12000",
+        "Tot_Drug_Cst": f"ROUND(5 + 40000 * POW({uniform('i', 15)}, 4), 2)",
+        "Tot_Benes": "IF(hash(i, 16) % 3 = 0, NULL, 11 + hash(i, 16) % 100)",
+        "GE65_Sprsn_Flag": "IF(hash(i, 17) % 3 = 0, '*', '')",
+        "GE65_Tot_Clms": "hash(i, 18) % 300",
+        "GE65_Tot_30day_Fills": f"ROUND(400 * {uniform('i', 19)}, 1)",
+        "GE65_Tot_Day_Suply": "hash(i, 20) % 9000",
+        "GE65_Tot_Drug_Cst": f"ROUND(30000 * POW({uniform('i', 21)}, 4), 2)",
+        "GE65_Bene_Sprsn_Flag": "IF(hash(i, 22) % 2 = 0, '#', '')",
+        "GE65_Tot_Benes": "IF(hash(i, 22) % 2 = 0, NULL, hash(i, 23) % 80)",
+    }
+    columns = ",\n".join(f"{values[c]} AS {c}" for c in PARTD_CSV_SCHEMA)
+    con.execute(f"""
+        COPY (
+            SELECT {columns}
+            FROM (SELECT i, {skewed(f"i + {year}", 1, npis)} AS n, {skewed('i', 24, PARTD_DRUGS)} AS d
+                  FROM range({rows}) t(i))
+        ) TO '{csv_path}' (HEADER)
+    """)
+
+
+def prepare_inputs(rows: int, years: list[int], inputs: str, cache_dir: str) -> dict[str, int]:
+    """Generate (or reuse) the synthetic inputs for `rows`; returns rows per dataset."""
+    per_year = rows // len(years)
+    counts = {"medicaid": rows, "medicare": per_year * len(years), "partd": per_year * len(years)}
+    marker = os.path.join(inputs, "complete.json")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == {"years": years, "rows": counts}:
+                print(f"Inputs: reusing {inputs}")
+                return counts
+    shutil.rmtree(inputs, ignore_errors=True)
+    os.makedirs(inputs)
+
+    print(f"Inputs: generating {label(rows)} rows per dataset in {inputs} ...")
+    con = duckdb.connect()
+    t = time.time()
+    generate_medicaid(con, rows, f"{inputs}/medicaid.csv", f"{inputs}/npi_lookup.parquet")
+    print(f"  medicaid: {rows:,} rows ({time.time() - t:.0f}s)")
+    env = {**os.environ, "DOWNLOAD_CACHE_DIR": cache_dir}
+    for dataset, generate, urls in (("medicare", generate_medicare, MEDICARE_URLS),
+                                    ("partd", generate_partd, PARTD_URLS)):
+        for year in years:
+            t = time.time()
+            path = f"{inputs}/{dataset}_{year}.csv"
+            generate(con, per_year, year, path)
+            subprocess.run([sys.executable, f"{SCRIPTS}/download_cache.py", "--seed", urls[year], path],
+                           env=env, check=True, stdout=subprocess.DEVNULL)
+            print(f"  {dataset} {year}: {per_year:,} rows ({time.time() - t:.0f}s)")
+    con.close()
+
+    with open(marker, "w") as f:
+        json.dump({"years": years, "rows": counts}, f)
+    return counts
+
+
+def prepare_tree(tree: str, inputs: str):
+    """Copy the current scripts into `tree` and link the inputs where they expect them."""
+    os.makedirs(f"{tree}/scripts", exist_ok=True)
+    os.makedirs(f"{tree}/web/public/data", exist_ok=True)
+    shutil.copy2(f"{ROOT}/convert_to_parquet.py", tree)
+    for script in glob.glob(f"{SCRIPTS}/*.py"):
+        shutil.copy2(script, f"{tree}/scripts")
+    for src, dst in ((f"{inputs}/medicaid.csv", f"{tree}/medicaid-provider-spending.csv"),
+                     (f"{inputs}/npi_lookup.parquet", f"{tree}/web/public/data/npi_lookup.parquet")):
+        if not os.path.lexists(dst):
+            os.symlink(src, dst)
+
+
+def snapshot(tree: str) -> dict[str, tuple[int, int]]:
+    """(size, mtime) of every regular file under `tree`."""
+    files = {}
+    for dirpath, _, names in os.walk(tree):
+        for name in names:
+            st = os.lstat(os.path.join(dirpath, name))
+            if not os.path.islink(os.path.join(dirpath, name)):
+                files[os.path.join(dirpath, name)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def run_stage(name: str, cmd: list[str], tree: str, log_path: str, env: dict) -> dict:
+    """Run one stage; wall time, exit code, peak RSS of its largest process and bytes written."""
+    before = snapshot(tree)
+    t = time.time()
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, *cmd], cwd=tree, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the max RSS over the process and its reaped children (the worker pools)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.time() - t
+    after = snapshot(tree)
+    written = sum(size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime))
+    return {
+        "seconds": round(seconds, 2),
+        "exit_code": proc.returncode,
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # Linux: KB
+        "output_bytes": written,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def load_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path: str, history: list[dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp, path)
+
+
+def report(run: dict, history: list[dict], baseline_runs: int, threshold: float) -> list[str]:
+    """Print `run` against the median of the previous comparable runs; returns flagged stages."""
+    previous = [r for r in history if r is not run and r["host"] == run["host"] and r["rows"] == run["rows"]
+                and r["started"] < run["started"]][-baseline_runs:]
+    print(f"\n{run['started']}  {run['commit'] or 'unknown commit'}  {label(run['rows'])} rows  "
+          f"on {run['host']} ({run['cpus']} CPUs)")
+    print(f"  baseline: median of {len(previous)} previous run(s)" if previous else "  baseline: none yet")
+    print(f"  {'stage':20s} {'seconds':>11s} {'':8s} {'rows/sec':>12s} {'peak RSS':>13s} {'':6s} {'output':>10s}")
+
+    def delta(value, past):
+        past = [p for p in past if p is not None]
+        if not past:
+            return value, None, ""
+        base = statistics.median(past)
+        change = value / base - 1 if base else 0.0
+        return value, change, f"{change:+4.0%}"
+
+    flagged = []
+    for name, stage in run["stages"].items():
+        if stage["exit_code"] != 0:
+            print(f"  {name:20s} FAILED (exit {stage['exit_code']}, see {stage['log']})")
+            flagged.append(name)
+            continue
+        past = [r["stages"][name] for r in previous if r["stages"].get(name, {}).get("exit_code") == 0]
+        seconds, d_seconds, s_seconds = delta(stage["seconds"], [p["seconds"] for p in past])
+        rss, d_rss, s_rss = delta(stage["peak_rss_mb"], [p["peak_rss_mb"] for p in past])
+        regressed = any(d is not None and d > threshold for d in (d_seconds, d_rss))
+        if regressed:
+            flagged.append(name)
+        print(f"  {name:20s} {seconds:10.1f}s {s_seconds:>8s} {stage['rows_per_sec']:>12,.0f} "
+              f"{rss:10,.0f} MB {s_rss:>6s} {stage['output_bytes'] / 1e6:7,.1f} MB"
+              f"{'  <-- REGRESSION' if regressed else ''}")
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all): {', '.join(STAGE_NAMES)}")
+    parser.add_argument("--rows", default="1M", help="rows per dataset, e.g. 1M, 10M, 100M")
+    parser.add_argument("--years", type=int, nargs="+", default=[2022, 2023],
+                        help="Medicare / Part D years to split their rows over")
+    parser.add_argument("--workers", type=int, help="--workers for convert, medicare and partd (default: theirs)")
+    parser.add_argument("--workdir", default=WORKDIR, help="where inputs and stage outputs are kept")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file")
+    parser.add_argument("--baseline", type=int, default=3, help="previous runs the report compares against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown / RSS growth to flag")
+    parser.add_argument("--report", action="store_true", help="only report the last run in the history")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if a stage is flagged")
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.stages) - set(STAGE_NAMES))
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGE_NAMES)}")
+    missing_years = sorted(y for y in args.years if y not in MEDICARE_URLS or y not in PARTD_URLS)
+    if missing_years:
+        parser.error(f"no Medicare / Part D source for {', '.join(map(str, missing_years))}")
+    history = load_history(args.history)
+
+    if args.report:
+        if not history:
+            parser.error(f"no runs in {args.history}")
+        flagged = report(history[-1], history, args.baseline, args.threshold)
+        sys.exit(1 if flagged and args.fail_on_regression else 0)
+
+    rows = parse_rows(args.rows)
+    scale_dir = os.path.join(args.workdir, label(rows))
+    inputs, tree, logs = f"{scale_dir}/inputs", f"{scale_dir}/tree", f"{scale_dir}/logs"
+    cache_dir = f"{inputs}/download-cache"
+    counts = prepare_inputs(rows, sorted(args.years), inputs, cache_dir)
+    prepare_tree(tree, inputs)
+    os.makedirs(logs, exist_ok=True)
+    env = {**os.environ, "DOWNLOAD_CACHE_DIR": cache_dir, "DOWNLOAD_CACHE_MAX_AGE": "inf"}
+
+    run = {
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "rows": rows,
+        "years": sorted(args.years),
+        "workers": args.workers,
+        "stages": {},
+    }
+    selected = args.stages or STAGE_NAMES
+    print(f"\nRunning {', '.join(selected)} in {tree}")
+    for name, cmd, datasets, needs in STAGES:
+        if name not in selected:
+            continue
+        absent = [n for n in needs if not os.path.exists(f"{tree}/{n}")]
+        if absent:
+            sys.exit(f"{name}: needs {', '.join(absent)} — run the earlier stages first")
+        for pattern in CLEARS.get(name, []):
+            for path in glob.glob(f"{tree}/{pattern}"):
+                os.remove(path)
+        cmd = list(cmd)
+        if name in ("medicare", "partd"):
+            cmd += map(str, sorted(args.years))
+        if args.workers and name in WORKER_STAGES:
+            cmd += ["--workers", str(args.workers)]
+        log_path = f"{logs}/{name}.log"
+        stage = run_stage(name, cmd, tree, log_path, env)
+        source_rows = sum(counts[d] for d in datasets)
+        stage.update(rows=source_rows, rows_per_sec=round(source_rows / stage["seconds"]), log=log_path)
+        run["stages"][name] = stage
+        status = "ok" if stage["exit_code"] == 0 else f"FAILED (exit {stage['exit_code']})"
+        print(f"  {name}: {stage['seconds']:.1f}s, {stage['peak_rss_mb']:,.0f} MB peak RSS — {status}")
+        if stage["exit_code"] != 0:
+            break
+
+    history.append(run)
+    save_history(args.history, history)
+    flagged = report(run, history, args.baseline, args.threshold)
+    print(f"\nHistory: {args.history} ({len(history)} runs)")
+    if any(s["exit_code"] != 0 for s in run["stages"].values()) or (flagged and args.fail_on_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
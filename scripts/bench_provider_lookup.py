@@ -0,0 +1,121 @@
+"""
+Benchmark per-NPI lookup latency on the provider aggregates.
+
+Rewrites provider_stats / provider_hcpcs / provider_monthly into the layout
+aggregate_providers.py used to produce (rows in arbitrary order, default row
+groups) and runs the provider detail page's queries
+(web/src/app/api/provider/[npi]/route.ts) for a sample of NPIs against both
+that layout and the current clustered one.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/aggregate_providers.py
+    python scripts/bench_provider_lookup.py [num_npis]
+"""
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import duckdb
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data", "provider-aggregates")
+TABLES = ["provider_stats", "provider_hcpcs", "provider_monthly"]
+
+# The per-NPI queries issued by the provider detail page
+QUERIES = [
+    """
+    SELECT SUM(total_paid), SUM(total_claims), SUM(unique_beneficiaries),
+           MIN(first_month), MAX(last_month)
+    FROM provider_stats WHERE billing_npi = $npi
+    """,
+    "SELECT COUNT(DISTINCT hcpcs_code) FROM provider_hcpcs WHERE billing_npi = $npi",
+    """
+    SELECT hcpcs_code, SUM(total_paid) AS total_spending, SUM(total_claims), SUM(unique_beneficiaries)
+    FROM provider_hcpcs WHERE billing_npi = $npi
+    GROUP BY hcpcs_code ORDER BY total_spending DESC LIMIT 50
+    """,
+    """
+    SELECT claim_month, total_paid, total_claims
+    FROM provider_monthly WHERE billing_npi = $npi
+    ORDER BY claim_month LIMIT 100
+    """,
+]
+
+
+def write_unclustered(src_dir: str, dst_dir: str):
+    """Reproduce the previous layout: shuffled rows, DuckDB default row groups."""
+    con = duckdb.connect()
+    for table in TABLES:
+        con.execute(f"""
+            COPY (SELECT * FROM read_parquet('{src_dir}/{table}.parquet') ORDER BY hash(billing_npi, *COLUMNS(*)))
+            TO '{dst_dir}/{table}.parquet' (FORMAT PARQUET, COMPRESSION SNAPPY)
+        """)
+    con.close()
+
+
+def describe_layout(con, data_dir: str) -> str:
+    parts = []
+    for table in TABLES:
+        path = f"{data_dir}/{table}.parquet"
+        groups = con.execute(
+            f"SELECT COUNT(DISTINCT row_group_id) FROM parquet_metadata('{path}')"
+        ).fetchone()[0]
+        parts.append(f"{table}: {groups} row groups, {os.path.getsize(path) / 1e6:.1f} MB")
+    return "; ".join(parts)
+
+
+def run(label: str, data_dir: str, npis: list[str]) -> list[float]:
+    con = duckdb.connect()
+    for table in TABLES:
+        con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{data_dir}/{table}.parquet')")
+    print(f"\n{label}: {describe_layout(con, data_dir)}")
+
+    latencies = []
+    for npi in npis:
+        t = time.perf_counter()
+        for sql in QUERIES:
+            con.execute(sql, {"npi": npi}).fetchall()
+        latencies.append((time.perf_counter() - t) * 1000)
+    con.close()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"  per-NPI lookup: median {statistics.median(latencies):.1f} ms, "
+          f"p95 {p95:.1f} ms, mean {statistics.mean(latencies):.1f} ms")
+    return latencies
+
+
+def main():
+    num_npis = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    con = duckdb.connect()
+    npis = [r[0] for r in con.execute(f"""
+        SELECT billing_npi
+        FROM (SELECT DISTINCT billing_npi FROM read_parquet('{DATA}/provider_stats.parquet'))
+        USING SAMPLE {num_npis} ROWS (reservoir, 42)
+    """).fetchall()]
+    con.close()
+    print(f"Benchmarking {len(npis)} NPIs x {len(QUERIES)} queries")
+
+    before_dir = tempfile.mkdtemp(prefix="provider-aggregates-unclustered-")
+    try:
+        write_unclustered(DATA, before_dir)
+        # Warm the OS page cache for both layouts so only query work is compared
+        run("warm-up (unclustered)", before_dir, npis[:5])
+        run("warm-up (clustered)", DATA, npis[:5])
+
+        before = run("Before — unclustered", before_dir, npis)
+        after = run("After — clustered by billing_npi", DATA, npis)
+    finally:
+        shutil.rmtree(before_dir, ignore_errors=True)
+
+    speedup = statistics.median(before) / statistics.median(after)
+    print(f"\nMedian speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
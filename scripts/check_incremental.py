@@ -0,0 +1,217 @@
+"""
+Check that an --incremental rebuild of the Medicaid aggregates matches a full
+rebuild.
+
+Builds a small raw claims file in a temp copy of the scripts, with NULL
+billing_npi and hcpcs_code rows and an npi_lookup with NULL and empty states,
+and runs aggregate.py and aggregate_providers.py in full. It then restates the
+raw data (edited rows in one month, a code dropped from another, a new month,
+more NULL keys), reruns both with --incremental, rebuilds everything from
+scratch and compares every output row for row. stats.json is also checked
+against the raw file, as the single-pass aggregate.py used to compute it, so
+rows with a NULL key must still count toward the totals.
+
+Usage:
+    source .venv/bin/activate
+    python scripts/check_incremental.py
+"""
+
+import glob
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import duckdb
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+ROWS = 20_000
+MONTHS = 12  # 2023-01 .. 2023-12; the restatement adds 2024-01
+
+
+def raw_rows(seed: int, rows: int, months: int) -> str:
+    """SQL for `rows` raw claims over `months` months from 2023-01. About 1%
+    of rows have a NULL billing_npi and 1% a NULL hcpcs_code; a quarter use a
+    provider and code seen in their month only, so a restatement leaves most
+    of those groups untouched."""
+    return f"""
+        SELECT
+            CASE WHEN hash(i, {seed}, 1) % 100 = 0 THEN NULL
+                 WHEN local THEN CAST(2000000000 + 10 * m + hash(i, {seed}, 2) % 5 AS VARCHAR)
+                 ELSE CAST(1000000000 + hash(i, {seed}, 2) % 300 AS VARCHAR) END AS billing_npi,
+            CAST(1000000000 + hash(i, {seed}, 3) % 900 AS VARCHAR) AS servicing_npi,
+            CASE WHEN hash(i, {seed}, 4) % 100 = 0 THEN NULL
+                 WHEN local THEN 'M' || CAST(10 * m + hash(i, {seed}, 5) % 3 AS VARCHAR)
+                 ELSE 'H' || CAST(hash(i, {seed}, 5) % 40 AS VARCHAR) END AS hcpcs_code,
+            (DATE '2023-01-01' + TO_MONTHS(m))::DATE AS claim_month,
+            CAST(12 + hash(i, {seed}, 7) % 50 AS INTEGER) AS unique_beneficiaries,
+            CAST(hash(i, {seed}, 8) % 200 AS INTEGER) AS total_claims,
+            ROUND(10 + (hash(i, {seed}, 9) % 500000) / 10, 2)::DOUBLE AS total_paid
+        FROM (SELECT i, CAST(hash(i, {seed}, 6) % {months} AS INTEGER) AS m, hash(i, {seed}, 10) % 4 = 0 AS local
+              FROM range({rows}) t(i))
+    """
+
+
+def write_inputs(tree: str):
+    raw = f"{tree}/medicaid-provider-spending.parquet"
+    con = duckdb.connect()
+    con.execute(f"COPY ({raw_rows(1, ROWS, MONTHS)}) TO '{raw}' (FORMAT PARQUET)")
+    con.execute(f"""
+        COPY (
+            SELECT
+                CAST(1000000000 + n AS VARCHAR) AS billing_npi,
+                'PROVIDER ' || n AS provider_name,
+                'Individual' AS provider_type,
+                'CITY' AS city,
+                CASE n % 10 WHEN 0 THEN NULL WHEN 1 THEN '' ELSE ['CA', 'TX', 'NY', 'FL'][1 + n % 4] END AS state
+            FROM range(300) t(n)
+        ) TO '{tree}/web/public/data/npi_lookup.parquet' (FORMAT PARQUET)
+    """)
+    con.close()
+
+
+def restate(tree: str):
+    """Edit month 3, drop one code from month 7, add 2024-01 and more NULL keys."""
+    raw = f"{tree}/medicaid-provider-spending.parquet"
+    con = duckdb.connect()
+    con.execute(f"CREATE TABLE raw AS SELECT * FROM '{raw}'")
+    con.execute("""
+        UPDATE raw SET total_paid = total_paid * 2
+        WHERE claim_month = DATE '2023-03-01' AND hash(billing_npi, hcpcs_code) % 3 = 0
+    """)
+    con.execute("DELETE FROM raw WHERE claim_month = DATE '2023-07-01' AND hcpcs_code = 'H7'")
+    con.execute(f"""
+        INSERT INTO raw
+        SELECT * REPLACE ((claim_month + TO_MONTHS({MONTHS}))::DATE AS claim_month)
+        FROM ({raw_rows(2, ROWS // MONTHS, 1)})
+    """)
+    con.execute(f"""
+        INSERT INTO raw
+        SELECT * REPLACE (NULL::VARCHAR AS billing_npi, NULL::VARCHAR AS hcpcs_code, DATE '2023-09-01' AS claim_month)
+        FROM ({raw_rows(3, 5, 1)})
+    """)
+    con.execute(f"COPY raw TO '{raw}' (FORMAT PARQUET)")
+    con.close()
+
+
+def run(tree: str, *cmd: str):
+    proc = subprocess.run([sys.executable, *cmd], cwd=tree, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"{' '.join(cmd)} failed:\n{proc.stdout}{proc.stderr}")
+
+
+def outputs(tree: str) -> list[str]:
+    """Output files relative to `tree`."""
+    files = glob.glob(f"{tree}/web/public/data/*") + glob.glob(f"{tree}/data/provider-aggregates/*")
+    return sorted(os.path.relpath(f, tree) for f in files
+                  if not f.endswith(("npi_lookup.parquet", ".aggregate_state.json")))
+
+
+def normalized(con, path: str) -> str:
+    """SELECT over a Parquet output with DOUBLEs rounded, since sums over a
+    different grouping order can differ in the last bits."""
+    cols = con.execute(f"DESCRIBE SELECT * FROM '{path}'").fetchall()
+    exprs = [f"ROUND({name}, 4) AS {name}" if typ == "DOUBLE" else name for name, typ, *_ in cols]
+    return f"SELECT {', '.join(exprs)} FROM '{path}'"
+
+
+def same_json(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and math.isclose(a, b, rel_tol=1e-9)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same_json(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_json(a[k], b[k]) for k in a)
+    return a == b
+
+
+def compare(incremental: str, full: str) -> list[str]:
+    """Outputs that differ between the two trees, with a reason each."""
+    problems = []
+    names = outputs(full)
+    if outputs(incremental) != names:
+        problems.append(f"output files differ: {sorted(set(outputs(incremental)) ^ set(names))}")
+    con = duckdb.connect()
+    for name in names:
+        a, b = f"{incremental}/{name}", f"{full}/{name}"
+        if not os.path.exists(a):
+            continue
+        if name.endswith(".json"):
+            with open(a) as fa, open(b) as fb:
+                if not same_json(json.load(fa), json.load(fb)):
+                    problems.append(f"{name}: contents differ")
+            continue
+        rows_a, rows_b = (con.execute(f"SELECT COUNT(*) FROM '{p}'").fetchone()[0] for p in (a, b))
+        missing = con.execute(f"SELECT COUNT(*) FROM ({normalized(con, b)} EXCEPT ALL {normalized(con, a)})").fetchone()[0]
+        extra = con.execute(f"SELECT COUNT(*) FROM ({normalized(con, a)} EXCEPT ALL {normalized(con, b)})").fetchone()[0]
+        if missing or extra:
+            problems.append(f"{name}: {rows_a:,} rows incremental vs {rows_b:,} full "
+                            f"({missing:,} missing, {extra:,} extra)")
+    con.close()
+    return problems
+
+
+def check_stats(tree: str) -> list[str]:
+    """stats.json fields that differ from the same stats over the raw file."""
+    with open(f"{tree}/web/public/data/stats.json") as f:
+        (stats,) = json.load(f)
+    con = duckdb.connect()
+    result = con.execute(f"""
+        SELECT
+            COUNT(*)::BIGINT AS total_rows,
+            MIN(claim_month) AS earliest_month,
+            MAX(claim_month) AS latest_month,
+            COUNT(DISTINCT billing_npi)::INT AS unique_providers,
+            COUNT(DISTINCT hcpcs_code)::INT AS unique_hcpcs_codes,
+            ROUND(SUM(total_paid), 2)::DOUBLE AS total_spending,
+            SUM(total_claims)::BIGINT AS total_claims
+        FROM '{tree}/medicaid-provider-spending.parquet'
+    """)
+    expected = dict(zip([d[0] for d in result.description], result.fetchone()))
+    con.close()
+    expected = {k: v.isoformat() if hasattr(v, "isoformat") else v for k, v in expected.items()}
+    return [f"stats.json {k}: {stats.get(k)!r}, raw file {v!r}"
+            for k, v in expected.items() if not same_json(stats.get(k), v)]
+
+
+def check():
+    tmp = tempfile.mkdtemp(prefix="check-incremental-")
+    checked = 0
+    try:
+        tree, snapshot = f"{tmp}/tree", f"{tmp}/incremental"
+        os.makedirs(f"{tree}/scripts")
+        os.makedirs(f"{tree}/web/public/data")
+        for script in glob.glob(f"{SCRIPTS}/*.py"):
+            shutil.copy2(script, f"{tree}/scripts")
+        write_inputs(tree)
+
+        run(tree, "scripts/aggregate.py")
+        run(tree, "scripts/aggregate_providers.py")
+        restate(tree)
+        run(tree, "scripts/aggregate.py", "--incremental")
+        run(tree, "scripts/aggregate_providers.py", "--incremental")
+        for name in outputs(tree):
+            os.makedirs(os.path.dirname(f"{snapshot}/{name}"), exist_ok=True)
+            shutil.copy2(f"{tree}/{name}", f"{snapshot}/{name}")
+
+        run(tree, "scripts/aggregate.py")
+        run(tree, "scripts/aggregate_providers.py")
+        problems = compare(snapshot, tree) + check_stats(tree)
+        checked = len(outputs(tree))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if problems:
+        print("Incremental and full rebuilds differ:")
+        for p in problems:
+            print(f"  {p}")
+        raise SystemExit(1)
+    print(f"Incremental rebuild matches the full rebuild ({checked} outputs)")
+
+
+if __name__ == "__main__":
+    check()
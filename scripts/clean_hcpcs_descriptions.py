@@ -1,16 +1,45 @@
 #!/usr/bin/env python3
 """
-One-time script: Clean up abbreviated HCPCS descriptions using Claude Sonnet.
+Clean up abbreviated HCPCS descriptions using Claude Sonnet.
 Reads hcpcs_lookup.parquet, sends batches to the API, writes cleaned descriptions back.
 Only processes codes that appear in the spending data (hcpcs_summary).
+
+Cleaned descriptions are kept in a persistent cache keyed on a hash of
+(code, original description, prompt version, model), so a rerun on a new
+quarterly CMS lookup only sends codes that are new or whose description
+changed; editing SYSTEM_PROMPT or MODEL invalidates the cache. Rows that
+already hold a cached cleaned description (a rerun on this script's own
+output) are kept as they are.
+
+Batches are sent concurrently (--concurrency) by an asyncio client. A token
+bucket paces requests at --rpm and re-syncs from the anthropic-ratelimit-*
+response headers, pausing every batch when the API reports a limit exhausted
+or answers 429. Failed batches are retried with jittered exponential backoff.
+Each finished batch is appended to the JSONL cache at once, so the cache is
+also the checkpoint an interrupted run resumes from. The lookup is written
+from an Arrow table registered with DuckDB.
+
+Usage:
+    python scripts/clean_hcpcs_descriptions.py [--concurrency 4] [--rpm 50] [--cache PATH]
+
+    # Against the local mock server (no API key, no cost):
+    python scripts/mock_messages_server.py --rpm 120 &
+    ANTHROPIC_API_KEY=test python scripts/clean_hcpcs_descriptions.py --base-url http://localhost:8787
 """
 
+import argparse
+import asyncio
+import hashlib
 import json
 import os
+import random
 import sys
 import time
+from datetime import datetime
+
 import duckdb
 import httpx
+import pyarrow as pa
 
 # --- Config ---
 BATCH_SIZE = 100
@@ -19,65 +48,14 @@ MAX_TOKENS = 4096
 PARQUET_LOOKUP = "web/public/data/hcpcs_lookup.parquet"
 PARQUET_SUMMARY = "web/public/data/hcpcs_summary.parquet"
 OUTPUT_PARQUET = "web/public/data/hcpcs_lookup.parquet"
-CHECKPOINT_FILE = "scripts/.hcpcs_clean_checkpoint.json"
-
-# Load API key
-env_path = os.path.join(os.path.dirname(__file__), "..", "web", ".env.local")
-api_key = None
-with open(env_path) as f:
-    for line in f:
-        if line.startswith("ANTHROPIC_API_KEY="):
-            api_key = line.strip().split("=", 1)[1].strip('"').strip("'")
-            break
-
-if not api_key:
-    print("ERROR: ANTHROPIC_API_KEY not found in .env.local")
-    sys.exit(1)
+CACHE_FILE = "scripts/.hcpcs_description_cache.jsonl"
+# Checkpoints of earlier versions (code → cleaned), imported into the cache
+LEGACY_CHECKPOINT_FILES = ["scripts/.hcpcs_clean_checkpoint.json", "scripts/.hcpcs_clean_checkpoint.jsonl"]
 
-# --- Load codes ---
-con = duckdb.connect()
-
-# Get all lookup codes that appear in spending data
-rows = con.execute(f"""
-    SELECT l.hcpcs_code, l.description
-    FROM read_parquet('{PARQUET_LOOKUP}') l
-    SEMI JOIN read_parquet('{PARQUET_SUMMARY}') h ON l.hcpcs_code = h.hcpcs_code
-    ORDER BY l.hcpcs_code
-""").fetchall()
-
-# Also get codes NOT in spending data (we'll keep their descriptions as-is)
-unused_rows = con.execute(f"""
-    SELECT l.hcpcs_code, l.description
-    FROM read_parquet('{PARQUET_LOOKUP}') l
-    ANTI JOIN read_parquet('{PARQUET_SUMMARY}') h ON l.hcpcs_code = h.hcpcs_code
-    ORDER BY l.hcpcs_code
-""").fetchall()
-
-print(f"Codes to clean: {len(rows)}")
-print(f"Codes to keep as-is (not in spending data): {len(unused_rows)}")
-
-# --- Load checkpoint if exists ---
-cleaned = {}
-if os.path.exists(CHECKPOINT_FILE):
-    with open(CHECKPOINT_FILE) as f:
-        cleaned = json.load(f)
-    print(f"Loaded checkpoint: {len(cleaned)} codes already cleaned")
-
-# --- Build batches ---
-to_process = [(code, desc) for code, desc in rows if code not in cleaned]
-batches = [to_process[i:i + BATCH_SIZE] for i in range(0, len(to_process), BATCH_SIZE)]
-print(f"Remaining: {len(to_process)} codes in {len(batches)} batches")
-
-# --- API client ---
-client = httpx.Client(
-    base_url="https://api.anthropic.com",
-    headers={
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json",
-    },
-    timeout=60.0,
-)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0    # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
 
 SYSTEM_PROMPT = """You are a medical coding expert. You will receive a list of HCPCS/CPT codes with their abbreviated CMS descriptions. Your job is to expand each description into a clear, readable name.
 
@@ -93,7 +71,95 @@ Rules:
 
 Respond with ONLY a JSON object mapping each HCPCS code to its cleaned description. No other text."""
 
-def process_batch(batch, batch_num, total_batches):
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
+
+def load_api_key() -> str:
+    """ANTHROPIC_API_KEY from the environment, else from web/.env.local."""
+    if os.environ.get("ANTHROPIC_API_KEY"):
+        return os.environ["ANTHROPIC_API_KEY"]
+    env_path = os.path.join(os.path.dirname(__file__), "..", "web", ".env.local")
+    if os.path.exists(env_path):
+        with open(env_path) as f:
+            for line in f:
+                if line.startswith("ANTHROPIC_API_KEY="):
+                    return line.strip().split("=", 1)[1].strip('"').strip("'")
+    print("ERROR: ANTHROPIC_API_KEY not found in the environment or .env.local")
+    sys.exit(1)
+
+
+def seconds_until(reset: str) -> float:
+    """Seconds from now until an RFC 3339 reset timestamp (0 if past)."""
+    return max(datetime.fromisoformat(reset).timestamp() - time.time(), 0.0)
+
+
+class TokenBucket:
+    """Request pacing shared by all in-flight batches.
+
+    Holds up to `capacity` tokens refilled at `capacity` per minute; each
+    request takes one. Response headers re-sync it with the server's own
+    bucket: the requests limit sets the capacity, the remaining count less
+    the requests still in flight sets the tokens, and an exhausted limit (or
+    a 429's retry-after) pauses every caller until the reset time."""
+
+    def __init__(self, rpm: float):
+        self.capacity = rpm
+        self.tokens = 1.0  # start gently; the first response tells us the real budget
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+            elif self.tokens >= 1:
+                self.tokens -= 1
+                self.in_flight += 1
+                return
+            else:
+                await asyncio.sleep((1 - self.tokens) * 60 / self.capacity)
+
+    def release(self):
+        """A request acquired earlier has been answered (or failed)."""
+        self.in_flight -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update(self, headers: httpx.Headers):
+        self._refill()
+        limit = headers.get("anthropic-ratelimit-requests-limit")
+        if limit:
+            self.capacity = float(limit)
+        remaining = headers.get("anthropic-ratelimit-requests-remaining")
+        if remaining is not None:
+            self.tokens = max(float(remaining) - self.in_flight, 0.0)
+        # Any exhausted budget (requests, input / output tokens) pauses until its reset
+        for kind in ("requests", "tokens", "input-tokens", "output-tokens"):
+            reset = headers.get(f"anthropic-ratelimit-{kind}-reset")
+            if headers.get(f"anthropic-ratelimit-{kind}-remaining") == "0" and reset:
+                self.pause(seconds_until(reset))
+        if headers.get("retry-after"):
+            self.pause(float(headers["retry-after"]))
+
+
+def parse_response(data: dict) -> dict:
+    text = data["content"][0]["text"]
+    # Parse JSON from response (handle markdown code blocks)
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1].rsplit("```", 1)[0]
+    return json.loads(text)
+
+
+async def process_batch(client: httpx.AsyncClient, bucket: TokenBucket, batch, label: str) -> dict:
     """Send a batch of codes to Claude and return cleaned descriptions."""
     codes_text = "\n".join(f"{code}: {desc}" for code, desc in batch)
 
@@ -107,89 +173,237 @@ def process_batch(batch, batch_num, total_batches):
         ],
     }
 
-    for attempt in range(3):
+    for attempt in range(MAX_ATTEMPTS):
+        await bucket.acquire()
         try:
-            resp = client.post("/v1/messages", json=payload)
-            if resp.status_code == 429:
-                wait = int(resp.headers.get("retry-after", 30))
-                print(f"  Rate limited, waiting {wait}s...")
-                time.sleep(wait)
-                continue
+            try:
+                resp = await client.post("/v1/messages", json=payload)
+            finally:
+                bucket.release()
+            bucket.update(resp.headers)
+            if resp.status_code in RETRY_STATUSES:
+                raise httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=resp.request, response=resp)
             resp.raise_for_status()
-            data = resp.json()
-            text = data["content"][0]["text"]
-            # Parse JSON from response (handle markdown code blocks)
-            if text.startswith("```"):
-                text = text.split("\n", 1)[1].rsplit("```", 1)[0]
-            result = json.loads(text)
-            return result
-        except (httpx.HTTPStatusError, json.JSONDecodeError, KeyError) as e:
-            print(f"  Attempt {attempt+1} failed: {e}")
-            if attempt < 2:
-                time.sleep(5)
-            else:
+            return parse_response(resp.json())
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            error = e
+        except (httpx.TransportError, json.JSONDecodeError, KeyError, IndexError) as e:
+            if attempt == MAX_ATTEMPTS - 1:
                 raise
-    return {}
-
-# --- Process batches ---
-start_time = time.time()
-for i, batch in enumerate(batches):
-    batch_num = i + 1
-    print(f"Batch {batch_num}/{len(batches)} ({len(batch)} codes)...", end=" ", flush=True)
-
-    result = process_batch(batch, batch_num, len(batches))
-    cleaned.update(result)
-
-    # Checkpoint every batch
-    with open(CHECKPOINT_FILE, "w") as f:
-        json.dump(cleaned, f)
-
-    elapsed = time.time() - start_time
-    rate = (i + 1) / elapsed * 60 if elapsed > 0 else 0
-    remaining = (len(batches) - i - 1) / rate * 60 if rate > 0 else 0
-    print(f"done ({len(result)} cleaned, {rate:.1f} batches/min, ~{remaining:.0f}s remaining)")
-
-    # Small delay to avoid rate limits
-    if i < len(batches) - 1:
-        time.sleep(1)
-
-print(f"\nTotal cleaned: {len(cleaned)} codes in {time.time() - start_time:.0f}s")
-
-# --- Show samples ---
-print("\nSample transformations:")
-sample_codes = ["99490", "99457", "99454", "99458", "99213", "J2785", "A0392", "80305"]
-for code in sample_codes:
-    if code in cleaned:
-        orig = dict(rows).get(code, "?")
-        print(f"  {code}: {orig}  →  {cleaned[code]}")
-
-# --- Write output ---
-# Merge: cleaned descriptions for used codes, original descriptions for unused codes
-all_records = []
-
-# Used codes: prefer cleaned, fall back to original
-for code, orig_desc in rows:
-    desc = cleaned.get(code, orig_desc)
-    all_records.append((code, desc))
-
-# Unused codes: keep original
-for code, desc in unused_rows:
-    all_records.append((code, desc))
-
-print(f"\nWriting {len(all_records)} codes to {OUTPUT_PARQUET}...")
-con.execute(f"""
-    COPY (
-        SELECT column0 AS hcpcs_code, column1 AS description
-        FROM VALUES {', '.join(f"('{code}', '{desc.replace(chr(39), chr(39)+chr(39))}')" for code, desc in all_records)}
-        ORDER BY column0
-    ) TO '{OUTPUT_PARQUET}' (FORMAT PARQUET, COMPRESSION SNAPPY)
-""")
-
-print("Done! Parquet written.")
-
-# Clean up checkpoint
-if os.path.exists(CHECKPOINT_FILE):
-    os.remove(CHECKPOINT_FILE)
-    print("Checkpoint removed.")
-
-client.close()
+            error = e
+        # Full jitter, so batches that failed together don't retry together
+        wait = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        print(f"  {label}: attempt {attempt + 1} failed ({error!r}), retrying in {wait:.1f}s")
+        await asyncio.sleep(wait)
+
+
+def cache_key(code: str, description: str) -> str:
+    """Hash of everything a cleaned description depends on."""
+    return hashlib.sha256(json.dumps([code, description, PROMPT_VERSION, MODEL]).encode()).hexdigest()
+
+
+class DescriptionCache:
+    """Append-only JSONL cache of cleaned descriptions, one line per code."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cleaned = {}    # cache key → cleaned description
+        self.outputs = set()  # (code, cleaned description) for this prompt and model
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line (a crash mid-append); that code is simply cleaned again
+                        print("  Skipping a truncated cache line")
+                        continue
+                    self.cleaned[entry["key"]] = entry["cleaned"]
+                    if entry["prompt_version"] == PROMPT_VERSION and entry["model"] == MODEL:
+                        self.outputs.add((entry["code"], entry["cleaned"]))
+
+    def get(self, code: str, description: str) -> str | None:
+        return self.cleaned.get(cache_key(code, description))
+
+    def is_output(self, code: str, description: str) -> bool:
+        """Whether `description` is already a cleaned description of `code`."""
+        return (code, description) in self.outputs
+
+    def add(self, batch, result: dict):
+        """Record a batch's results with one append."""
+        lines = []
+        for code, description in batch:
+            if code in result:
+                key = cache_key(code, description)
+                self.cleaned[key] = result[code]
+                self.outputs.add((code, result[code]))
+                lines.append(json.dumps({"key": key, "code": code, "description": description,
+                                         "cleaned": result[code], "prompt_version": PROMPT_VERSION,
+                                         "model": MODEL}))
+        with open(self.path, "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def import_checkpoints(self, rows):
+        """Move an interrupted older run's checkpoint into the cache. Its
+        entries came from this same lookup, so they are keyed on the current
+        descriptions."""
+        legacy = {}
+        for path in LEGACY_CHECKPOINT_FILES:
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                if path.endswith(".jsonl"):
+                    for line in f:
+                        try:
+                            legacy.update(json.loads(line))
+                        except json.JSONDecodeError:
+                            pass
+                else:
+                    legacy.update(json.load(f))
+        if legacy:
+            self.add([(code, desc) for code, desc in rows if code in legacy], legacy)
+            print(f"Imported {len(legacy)} codes from an earlier checkpoint")
+        for path in LEGACY_CHECKPOINT_FILES:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def clean_batches(batches, cleaned: dict, cache: DescriptionCache, args) -> list[int]:
+    """Clean `batches` concurrently, merging results into `cleaned` and
+    adding each to `cache` as it finishes. Returns the numbers of failed batches."""
+    bucket = TokenBucket(args.rpm)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failed = []
+    done = 0
+    start_time = time.time()
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={
+            "x-api-key": load_api_key(),
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+        },
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+
+        async def run(batch_num: int, batch):
+            nonlocal done
+            label = f"Batch {batch_num}/{len(batches)}"
+            async with semaphore:
+                try:
+                    result = await process_batch(client, bucket, batch, label)
+                except Exception as e:
+                    failed.append(batch_num)
+                    print(f"  {label}: FAILED after {MAX_ATTEMPTS} attempts: {e!r}")
+                    return
+            cleaned.update(result)
+            cache.add(batch, result)
+            done += 1
+            elapsed = time.time() - start_time
+            rate = done / elapsed * 60 if elapsed > 0 else 0
+            remaining = (len(batches) - done) / rate * 60 if rate > 0 else 0
+            print(f"{label} ({len(batch)} codes) done ({len(result)} cleaned, "
+                  f"{rate:.1f} batches/min, ~{remaining:.0f}s remaining)")
+
+        await asyncio.gather(*(run(i + 1, batch) for i, batch in enumerate(batches)))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="batches in flight at once")
+    parser.add_argument("--rpm", type=float, default=50,
+                        help="initial requests/minute, until the API's rate-limit headers say otherwise")
+    parser.add_argument("--base-url", default=os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com"))
+    parser.add_argument("--cache", default=CACHE_FILE, help="description cache (JSONL)")
+    args = parser.parse_args()
+
+    # --- Load codes ---
+    con = duckdb.connect()
+
+    # Get all lookup codes that appear in spending data
+    rows = con.execute(f"""
+        SELECT l.hcpcs_code, l.description
+        FROM read_parquet('{PARQUET_LOOKUP}') l
+        SEMI JOIN read_parquet('{PARQUET_SUMMARY}') h ON l.hcpcs_code = h.hcpcs_code
+        ORDER BY l.hcpcs_code
+    """).fetchall()
+
+    # Also get codes NOT in spending data (we'll keep their descriptions as-is)
+    unused_rows = con.execute(f"""
+        SELECT l.hcpcs_code, l.description
+        FROM read_parquet('{PARQUET_LOOKUP}') l
+        ANTI JOIN read_parquet('{PARQUET_SUMMARY}') h ON l.hcpcs_code = h.hcpcs_code
+        ORDER BY l.hcpcs_code
+    """).fetchall()
+
+    print(f"Codes to clean: {len(rows)}")
+    print(f"Codes to keep as-is (not in spending data): {len(unused_rows)}")
+
+    # --- Look codes up in the cache ---
+    cache = DescriptionCache(args.cache)
+    cache.import_checkpoints(rows)
+    cleaned = {}
+    to_process = []
+    already_clean = 0
+    for code, desc in rows:
+        hit = cache.get(code, desc)
+        if hit is not None:
+            cleaned[code] = hit
+        elif cache.is_output(code, desc):
+            cleaned[code] = desc
+            already_clean += 1
+        else:
+            to_process.append((code, desc))
+    hits = len(cleaned)
+    print(f"Cache ({PROMPT_VERSION}, {MODEL}): {hits:,}/{len(rows):,} hits ({hits / max(len(rows), 1):.1%}), "
+          f"of which {already_clean:,} already cleaned in the lookup")
+
+    # --- Build batches ---
+    batches = [to_process[i:i + BATCH_SIZE] for i in range(0, len(to_process), BATCH_SIZE)]
+    print(f"Remaining: {len(to_process)} codes in {len(batches)} batches "
+          f"({args.concurrency} concurrent, {args.rpm:g} requests/min to start)")
+
+    # --- Process batches ---
+    start_time = time.time()
+    failed = asyncio.run(clean_batches(batches, cleaned, cache, args))
+    print(f"\nTotal cleaned: {len(cleaned)} codes in {time.time() - start_time:.0f}s "
+          f"({hits:,} from cache, {len(cleaned) - hits:,} from {len(batches) - len(failed)} API calls)")
+    if failed:
+        print(f"ERROR: {len(failed)} batches failed ({', '.join(map(str, sorted(failed)))}); "
+              f"the cache keeps the rest — re-run to retry them.")
+        sys.exit(1)
+
+    # --- Show samples ---
+    print("\nSample transformations:")
+    sample_codes = ["99490", "99457", "99454", "99458", "99213", "J2785", "A0392", "80305"]
+    for code in sample_codes:
+        if code in cleaned:
+            orig = dict(rows).get(code, "?")
+            print(f"  {code}: {orig}  →  {cleaned[code]}")
+
+    # --- Write output ---
+    # Merge: cleaned descriptions for used codes (falling back to the original),
+    # original descriptions for unused codes
+    lookup = pa.table({
+        "hcpcs_code": [code for code, _ in rows] + [code for code, _ in unused_rows],
+        "description": [cleaned.get(code, desc) for code, desc in rows] + [desc for _, desc in unused_rows],
+    })
+
+    print(f"\nWriting {lookup.num_rows} codes to {OUTPUT_PARQUET}...")
+    con.register("cleaned_lookup", lookup)
+    tmp = OUTPUT_PARQUET + ".tmp"
+    con.execute(f"""
+        COPY (SELECT * FROM cleaned_lookup ORDER BY hcpcs_code)
+        TO '{tmp}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+    """)
+    os.replace(tmp, OUTPUT_PARQUET)
+
+    print("Done! Parquet written.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""DDSketch quantile sketches, for distributions that roll up.
+
+A percentile of paid per claim per month cannot be combined into a yearly
+or multi-code percentile, so the aggregate outputs also carry a sketch of
+the distribution: a histogram over logarithmic buckets, in which every
+value within RELATIVE_ACCURACY (1%) of a bucket's representative value
+falls into that bucket. Merging sketches is adding their bucket counts, so
+the sketch of any set of rows is exact, and every quantile read from it is
+within 1% (relative) of the true quantile however many sketches were merged.
+This is DDSketch (Masson et al., 2019), chosen over t-digest and KLL because
+its merge is a plain GROUP BY and SUM that DuckDB runs without extensions.
+
+A sketch is a list of {k, n} structs sorted by k: bucket index k (SMALLINT)
+and the weight n (BIGINT, e.g. claims) of the values in it. Bucket k holds
+values in (GAMMA^(k-1), GAMMA^k] and reports 2 * GAMMA^k / (GAMMA + 1).
+Values <= 0 (adjustments and zero-paid claims) share bucket ZERO_BUCKET,
+which sorts first and reports 0. Paid per claim from $0.01 to $1M spans
+under 1,000 buckets; a typical code-month has tens.
+
+In Python, bucket(), value(), merge() and quantile() work on sketches as
+read from Parquet (lists of {"k", "n"} dicts). The same operations are
+DuckDB macros (MACROS, created by register()):
+
+    dd_bucket(value)            a value's bucket index
+    dd_value(k)                 a bucket's representative value
+    dd_union(sketches)          the sketch of the union: dd_union(list(paid_per_claim_dd))
+    dd_quantile(sketch, q)      the q-quantile (0-1) of a sketch
+    dd_count(sketch)            total weight in a sketch
+
+Merge once and read several quantiles from the result, e.g. the yearly
+median and p90 paid per claim of one code:
+
+    SELECT year, dd_quantile(dd, 0.5) AS median, dd_quantile(dd, 0.9) AS p90
+    FROM (SELECT YEAR(claim_month) AS year, dd_union(list(paid_per_claim_dd)) AS dd
+          FROM 'web/public/data/paid_per_claim_monthly.parquet'
+          WHERE hcpcs_code = '99213' GROUP BY ALL)
+"""
+
+import math
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+ZERO_BUCKET = -32768
+
+MACROS = [
+    f"""CREATE OR REPLACE MACRO dd_bucket(value) AS
+        IF(value > 0, CAST(ceil(ln(value) / {math.log(GAMMA)!r}) AS SMALLINT), CAST({ZERO_BUCKET} AS SMALLINT))""",
+    f"""CREATE OR REPLACE MACRO dd_value(k) AS
+        IF(k = {ZERO_BUCKET}, 0.0, 2 * pow({GAMMA!r}, k) / {GAMMA + 1!r})""",
+    """CREATE OR REPLACE MACRO dd_union(sketches) AS (
+        SELECT list({'k': k, 'n': n} ORDER BY k)
+        FROM (SELECT b.k AS k, SUM(b.n)::BIGINT AS n FROM unnest(flatten(sketches)) t(b) GROUP BY b.k)
+    )""",
+    "CREATE OR REPLACE MACRO dd_count(sketch) AS list_sum(list_transform(sketch, b -> b.n))",
+    # One pass over the buckets, carrying the target weight in the accumulator:
+    # a lambda that captured q or sketch would re-evaluate it per element
+    """CREATE OR REPLACE MACRO dd_quantile(sketch, q) AS dd_value(list_reduce(sketch,
+        (acc, b) -> IF(acc.k IS NOT NULL AND acc.below >= acc.target, acc,
+                       {'k': b.k, 'below': acc.below + b.n, 'target': acc.target}),
+        {'k': NULL::SMALLINT, 'below': 0::HUGEINT, 'target': q * dd_count(sketch)}).k)""",
+]
+
+
+def register(con):
+    """Create the dd_* macros on a DuckDB connection."""
+    for sql in MACROS:
+        con.execute(sql)
+
+
+def bucket(value: float) -> int:
+    """A value's bucket index, as dd_bucket() computes it."""
+    return math.ceil(math.log(value) / math.log(GAMMA)) if value > 0 else ZERO_BUCKET
+
+
+def value(k: int) -> float:
+    """A bucket's representative value, as dd_value() computes it."""
+    return 0.0 if k == ZERO_BUCKET else 2 * GAMMA ** k / (GAMMA + 1)
+
+
+def merge(*sketches: list[dict]) -> list[dict]:
+    """The sketch of the union: bucket weights added up."""
+    buckets: dict[int, int] = {}
+    for sketch in sketches:
+        for b in sketch:
+            buckets[b["k"]] = buckets.get(b["k"], 0) + b["n"]
+    return [{"k": k, "n": n} for k, n in sorted(buckets.items())]
+
+
+def quantile(sketch: list[dict], q: float) -> float | None:
+    """The q-quantile of a sketch: the value of the first bucket whose
+    cumulative weight reaches q of the total, as dd_quantile() computes it."""
+    total = sum(b["n"] for b in sketch)
+    below = 0
+    for b in sketch:
+        below += b["n"]
+        if below >= q * total:
+            return value(b["k"])
+    return None
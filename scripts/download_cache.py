@@ -0,0 +1,281 @@
+"""
+Shared download cache for the ingest scripts.
+
+Downloads are stored content-addressed under data/download-cache/objects,
+named by their SHA-256, with an index mapping each URL to its object plus
+the ETag / Last-Modified the server sent. fetch(url) then:
+
+  - returns the cached file without touching the network if the entry was
+    validated less than DOWNLOAD_CACHE_MAX_AGE seconds ago (default 1 day),
+    so re-running an ingest after a schema change costs nothing;
+  - otherwise revalidates with If-None-Match / If-Modified-Since, and on a
+    304 returns the cached file, so re-running on an unchanged source only
+    costs one request;
+  - otherwise streams the body to a partial file, resuming an interrupted
+    download with a Range + If-Range request, and verifies the size against
+    Content-Length (and the caller's expected size / SHA-256, if given)
+    before publishing it.
+
+Only the standard library is used, so any HTTP server can stand in for
+data.cms.gov / cdc.gov, e.g. for testing:
+
+    python -m http.server -d /tmp/fixtures 8000 &
+    DOWNLOAD_CACHE_DIR=/tmp/cache python scripts/download_cache.py http://localhost:8000/x.csv
+
+Usage from an ingest script:
+
+    from download_cache import fetch
+    path = fetch(url)        # local Path, ready for DuckDB / pandas
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import urlparse
+
+CACHE_DIR = Path(os.environ.get(
+    "DOWNLOAD_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "download-cache")
+)).resolve()
+MAX_AGE = float(os.environ.get("DOWNLOAD_CACHE_MAX_AGE", 24 * 3600))
+CHUNK_SIZE = 1024 * 1024
+USER_AGENT = "medicaid-analyzer-ingest/1.0"
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+@contextmanager
+def _locked():
+    """Serialize index updates across threads and processes."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CACHE_DIR / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _load_index() -> dict:
+    path = CACHE_DIR / "index.json"
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_index(index: dict):
+    path = CACHE_DIR / "index.json"
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _object_path(sha256: str, url: str) -> Path:
+    # Keep the URL's extension so DuckDB / zipfile / read_sas sniff the format as before
+    suffix = "".join(Path(urlparse(url).path).suffixes[-2:])
+    return CACHE_DIR / "objects" / f"{sha256}{suffix}"
+
+
+def lookup(url: str) -> dict | None:
+    """The cache entry for `url` (sha256, size, etag, ...), if its object exists."""
+    entry = _load_index().get(url)
+    if entry and (CACHE_DIR / "objects" / entry["object"]).exists():
+        return entry
+    return None
+
+
+def _record(url: str, entry: dict):
+    with _locked():
+        index = _load_index()
+        index[url] = entry
+        _save_index(index)
+
+
+def _download(url: str, entry: dict | None, label: str) -> dict | None:
+    """Fetch `url` into a partial file, resuming it if possible. Returns the
+    new entry, or None if the server answered 304 for the cached `entry`."""
+    partial_dir = CACHE_DIR / "partial"
+    partial_dir.mkdir(parents=True, exist_ok=True)
+    partial = partial_dir / _url_key(url)
+    partial_meta = partial.with_suffix(".json")
+
+    headers = {"User-Agent": USER_AGENT}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    offset = partial.stat().st_size if partial.exists() else 0
+    validator = None
+    if offset and partial_meta.exists():
+        with open(partial_meta) as f:
+            validator = json.load(f).get("validator")
+    if offset and validator:
+        # If-Range: the server sends the rest only if the resource is unchanged
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    else:
+        offset = 0
+
+    try:
+        resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry:
+            return None
+        if e.code == 416 and offset:
+            # Stale partial larger than the resource — start over
+            partial.unlink()
+            return _download(url, entry, label)
+        raise
+
+    with resp:
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        length = resp.headers.get("Content-Length")
+        if resp.status == 206:
+            total = int(resp.headers["Content-Range"].rsplit("/", 1)[1])
+            mode = "ab"
+        else:
+            total = int(length) if length is not None else None
+            offset, mode = 0, "wb"
+        with open(partial_meta, "w") as f:
+            json.dump({"url": url, "validator": etag or last_modified}, f)
+
+        h = hashlib.sha256()
+        if offset:
+            with open(partial, "rb") as f:
+                while block := f.read(CHUNK_SIZE):
+                    h.update(block)
+            print(f"  {label}: resuming at {offset / 1e6:,.1f} MB")
+
+        t = time.time()
+        done = offset
+        with open(partial, mode) as f:
+            while block := resp.read(CHUNK_SIZE):
+                f.write(block)
+                h.update(block)
+                done += len(block)
+        elapsed = time.time() - t
+
+    size = partial.stat().st_size
+    if total is not None and size != total:
+        raise IOError(f"{url}: got {size:,} bytes, expected {total:,} (partial kept for resume)")
+    print(f"  {label}: downloaded {(done - offset) / 1e6:,.1f} MB in {elapsed:.0f}s")
+    return {
+        "sha256": h.hexdigest(),
+        "size": size,
+        "etag": etag,
+        "last_modified": last_modified,
+        "partial": str(partial),
+    }
+
+
+def fetch(url: str, sha256: str | None = None, size: int | None = None,
+          max_age: float | None = None, label: str | None = None) -> Path:
+    """Return a local path holding the content of `url`, downloading only
+    when the cache has no valid copy. `sha256` / `size`, if given, are
+    checked against the downloaded bytes. `max_age` overrides
+    DOWNLOAD_CACHE_MAX_AGE (0 = always revalidate)."""
+    max_age = MAX_AGE if max_age is None else max_age
+    label = label or os.path.basename(urlparse(url).path)
+    entry = lookup(url)
+
+    if entry and (sha256 is None or entry["sha256"] == sha256):
+        if time.time() - entry["validated_at"] < max_age:
+            print(f"  {label}: [cached] {entry['size'] / 1e6:,.1f} MB")
+            return CACHE_DIR / "objects" / entry["object"]
+    else:
+        entry = None
+
+    new = _download(url, entry, label)
+    if new is None:
+        entry["validated_at"] = time.time()
+        _record(url, entry)
+        print(f"  {label}: [cached, not modified] {entry['size'] / 1e6:,.1f} MB")
+        return CACHE_DIR / "objects" / entry["object"]
+
+    partial = Path(new.pop("partial"))
+    if (sha256 and new["sha256"] != sha256) or (size is not None and new["size"] != size):
+        partial.unlink()
+        partial.with_suffix(".json").unlink(missing_ok=True)
+        raise ValueError(f"{url}: checksum/size mismatch (got {new['size']:,} bytes, sha256 {new['sha256']})")
+
+    path = _object_path(new["sha256"], url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        partial.unlink()  # same content already cached under another URL
+    else:
+        os.replace(partial, path)
+    partial.with_suffix(".json").unlink(missing_ok=True)
+
+    new.update(object=path.name, validated_at=time.time(),
+               fetched_at=formatdate(usegmt=True))
+    _record(url, new)
+    return path
+
+
+def seed(url: str, path) -> Path:
+    """Record the local file `path` as the freshly validated content of
+    `url`, hard-linked into the cache when possible, so an ingest script can
+    run offline against it (see bench_pipeline.py)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(CHUNK_SIZE):
+            h.update(block)
+    obj = _object_path(h.hexdigest(), url)
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    if not obj.exists():
+        try:
+            os.link(path, obj)
+        except OSError:
+            shutil.copyfile(path, obj)
+    _record(url, {
+        "sha256": h.hexdigest(),
+        "size": obj.stat().st_size,
+        "etag": None,
+        "last_modified": None,
+        "object": obj.name,
+        "validated_at": time.time(),
+        "fetched_at": formatdate(usegmt=True),
+    })
+    return obj
+
+
+def prune():
+    """Delete objects no index entry refers to, and abandoned partials."""
+    with _locked():
+        live = {e["object"] for e in _load_index().values()}
+        freed = 0
+        for path in (CACHE_DIR / "objects").glob("*"):
+            if path.name not in live:
+                freed += path.stat().st_size
+                path.unlink()
+        shutil.rmtree(CACHE_DIR / "partial", ignore_errors=True)
+    print(f"Freed {freed / 1e6:,.1f} MB")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python scripts/download_cache.py URL [URL ...] | --prune | --seed URL PATH")
+        sys.exit(1)
+    if args == ["--prune"]:
+        prune()
+    elif args[0] == "--seed" and len(args) == 3:
+        print(seed(args[1], args[2]))
+    else:
+        for url in args:
+            print(fetch(url))
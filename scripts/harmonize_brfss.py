@@ -2,28 +2,42 @@
 harmonize_brfss.py — Download BRFSS 2014-2020 XPT files from CDC,
 harmonize column names with 2023, and produce a single Parquet file.
 
+Years are decoded in a process pool, each worker streaming its year in
+row chunks (sized from its share of --memory-limit) into a per-year part,
+data/brfss_harmonized.tmp/survey_year=YYYY/part-0.parquet. The parts are
+then merged into brfss_harmonized.parquet, or with --partitioned published
+as-is as the survey_year-partitioned dataset data/brfss_harmonized/, which
+the brfss view in query-service/src/db.ts prefers over the single file.
+
 Usage:
     source .venv/bin/activate
     python scripts/harmonize_brfss.py
+    python scripts/harmonize_brfss.py --workers 4 --memory-limit 8GB
+    python scripts/harmonize_brfss.py --partitioned
 """
 
-import io
+import argparse
 import os
-import sys
+import shutil
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from urllib.request import urlretrieve
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import pyreadstat
 
+from download_cache import fetch
+from memory import parse_size, peak_rss_mb
+
 # ── Configuration ──────────────────────────────────────────────────────
 
 YEARS = [2014, 2015, 2016, 2017, 2018, 2019, 2020, 2023, 2024]
 DOWNLOAD_DIR = Path("data/brfss_xpt")
 OUTPUT_PATH = Path("data/brfss_harmonized.parquet")
+PARTITIONED_DIR = Path("data/brfss_harmonized")
 BRFSS_2023_PATH = Path("/Users/cwhogg/Downloads/brfss_2023.parquet")
 
 # CDC download URLs — pattern varies slightly by year
@@ -171,22 +185,41 @@ COLUMN_RENAMES: dict[str, list[str]] = {
 # All canonical column names we want in the output
 CANONICAL_COLS = list(COLUMN_RENAMES.keys())
 
+# Storage type per canonical column. pyreadstat returns every XPT numeric as
+# float64, but the survey answers are category codes (1-9, 77/88/99 for
+# don't know / none / refused, day counts up to 30), so they are stored as
+# INT16 unless listed here. The final weight is the only non-integer. The
+# types are signed so that arithmetic in queries (30 - MENTHLTH,
+# ALCDAY4 - 200) can go negative instead of overflowing in DuckDB.
+COLUMN_TYPES: dict[str, pa.DataType] = {
+    "_BMI5": pa.int32(),       # BMI x 100
+    "ALCDAY4": pa.int32(),     # 101-230 days/week|month codes, 777/888/999
+    "_DRNKWK2": pa.int32(),    # drinks per week x 100, 99900 = missing
+    "_STSTR": pa.int32(),      # state + stratum, e.g. 72012
+    "_PSU": pa.int32(),        # year-prefixed record id, e.g. 2014000001
+    "_LLCPWT": pa.float64(),
+}
+
+# Unified output schema shared by all years (and NULL-filled missing
+# columns). Parts carry survey_year in their directory name; the merged file
+# as a column.
+PART_SCHEMA = pa.schema([(c, COLUMN_TYPES.get(c, pa.int16())) for c in CANONICAL_COLS])
+OUTPUT_SCHEMA = PART_SCHEMA.append(pa.field("survey_year", pa.int16()))
+
 
 def download_xpt(year: int) -> Path:
-    """Download a BRFSS XPT ZIP from CDC and extract the XPT file."""
+    """Fetch a BRFSS XPT ZIP from CDC (via the shared download cache) and
+    extract the XPT file, re-extracting only when the ZIP's content changed."""
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
     xpt_path = DOWNLOAD_DIR / f"LLCP{year}.XPT"
+    stamp_path = xpt_path.with_suffix(".XPT.sha256")
 
-    if xpt_path.exists():
-        print(f"  [cached] {xpt_path}")
+    zip_path = fetch(get_cdc_url(year), label=f"LLCP{year}XPT.zip")
+    zip_sha = zip_path.name.split(".")[0]
+    if xpt_path.exists() and stamp_path.exists() and stamp_path.read_text() == zip_sha:
+        print(f"  [extracted] {xpt_path}")
         return xpt_path
 
-    url = get_cdc_url(year)
-    zip_path = DOWNLOAD_DIR / f"LLCP{year}XPT.zip"
-
-    print(f"  Downloading {url} ...")
-    urlretrieve(url, zip_path)
-
     print(f"  Extracting ...")
     with zipfile.ZipFile(zip_path, "r") as zf:
         # Find the XPT file inside (name varies, may have trailing spaces)
@@ -195,97 +228,177 @@ def download_xpt(year: int) -> Path:
             raise ValueError(f"No XPT file found in {zip_path}")
         # Extract to our standard name
         with zf.open(xpt_names[0]) as src, open(xpt_path, "wb") as dst:
-            dst.write(src.read())
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    stamp_path.write_text(zip_sha)
 
-    # Clean up zip
-    zip_path.unlink()
     print(f"  Extracted {xpt_path} ({xpt_path.stat().st_size / 1e6:.1f} MB)")
     return xpt_path
 
 
-def load_year(year: int) -> pd.DataFrame:
-    """Load one year of BRFSS data and harmonize columns."""
-    print(f"\n{'='*60}")
-    print(f"Processing {year}")
-    print(f"{'='*60}")
-
-    if year == 2023:
-        df = pd.read_parquet(BRFSS_2023_PATH)
-        print(f"  Loaded 2023 from parquet: {len(df):,} rows, {len(df.columns)} columns")
-    else:
-        xpt_path = download_xpt(year)
-        df, meta = pyreadstat.read_xport(str(xpt_path), encoding="latin1")
-        print(f"  Loaded {year} from XPT: {len(df):,} rows, {len(df.columns)} columns")
-
-    # Uppercase all column names for consistent matching
-    df.columns = [c.upper() for c in df.columns]
-    available = set(df.columns)
-
-    # Build the harmonized dataframe
-    result = {}
-    found = []
-    missing = []
-
+def resolve_columns(available: list[str]) -> tuple[dict[str, str], list[str]]:
+    """Map each canonical column to the source column (as spelled in the
+    file) that supplies it: the canonical name first, then its variants."""
+    by_upper = {c.upper(): c for c in available}
+    matched = {}
+    renamed = []
     for canonical, variants in COLUMN_RENAMES.items():
         canon_upper = canonical.upper()
-
-        # Try canonical name first, then variants
-        candidates = [canon_upper] + [v.upper() for v in variants]
-        matched = False
-
-        for candidate in candidates:
-            if candidate in available:
-                result[canonical] = df[candidate]
+        for candidate in [canon_upper] + [v.upper() for v in variants]:
+            if candidate in by_upper:
+                matched[canonical] = by_upper[candidate]
                 if candidate != canon_upper:
-                    found.append(f"  {canonical} <- {candidate}")
-                matched = True
+                    renamed.append(f"  {canonical} <- {candidate}")
                 break
-
-        if not matched:
-            result[canonical] = pd.Series([None] * len(df), dtype="float64")
-            missing.append(canonical)
-
-    if found:
-        print(f"  Renamed columns:")
-        for f in found:
-            print(f"    {f}")
-
+    return matched, renamed
+
+
+def narrow(values: pa.Array, field: pa.Field) -> pa.Array:
+    """Cast a column to its storage type, failing rather than losing a value:
+    the safe cast rejects fractions and out-of-range codes."""
+    if pa.types.is_floating(values.type) and not pa.types.is_floating(field.type):
+        # SAS transport files store some zeros as 5.4e-79
+        values = pc.if_else(pc.less(pc.abs(values), 1e-70), 0.0, values)
+    try:
+        return pc.cast(values, field.type, safe=True)
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"{field.name}: values don't fit {field.type} — widen COLUMN_TYPES ({e})") from None
+
+
+def to_part_table(columns, matched: dict[str, str], n: int) -> pa.Table:
+    """Build a PART_SCHEMA table from a chunk's source columns (a DataFrame
+    or RecordBatch), filling unmatched columns with typed nulls."""
+    arrays = []
+    for field in PART_SCHEMA:
+        if field.name not in matched:
+            arrays.append(pa.nulls(n, type=field.type))
+        elif isinstance(columns, pa.RecordBatch):
+            arrays.append(narrow(columns.column(matched[field.name]), field))
+        else:
+            arrays.append(narrow(pa.array(columns[matched[field.name]], from_pandas=True), field))
+    return pa.Table.from_arrays(arrays, schema=PART_SCHEMA)
+
+
+def harmonize_year(year: int, source: Path, part_path: Path, chunk_rows: int) -> tuple[int, list[str]]:
+    """Worker: stream one year, reading only the columns we keep, into its
+    Parquet part. Returns the row count and the log lines to print."""
+    log = []
+    if year == 2023:
+        parquet = pq.ParquetFile(source)
+        available = parquet.schema_arrow.names
+        matched, renamed = resolve_columns(available)
+        chunks = parquet.iter_batches(batch_size=chunk_rows, columns=sorted(set(matched.values())))
+    else:
+        _, meta = pyreadstat.read_xport(str(source), metadataonly=True, encoding="latin1")
+        available = meta.column_names
+        matched, renamed = resolve_columns(available)
+        chunks = (df for df, _ in pyreadstat.read_file_in_chunks(
+            pyreadstat.read_xport, str(source), chunksize=chunk_rows,
+            encoding="latin1", usecols=sorted(set(matched.values())),
+        ))
+    log.append(f"  Reading {len(set(matched.values()))} of {len(available)} columns from {source.name}")
+
+    if renamed:
+        log.append(f"  Renamed columns:")
+        log.extend(f"    {f}" for f in renamed)
+
+    missing = [c for c in CANONICAL_COLS if c not in matched]
     if missing:
-        print(f"  Missing columns (filled NULL): {', '.join(missing)}")
-
-    out = pd.DataFrame(result)
-    out["survey_year"] = year
-    print(f"  Output: {len(out):,} rows, {len(out.columns)} columns")
-    return out
+        log.append(f"  Missing columns (filled NULL): {', '.join(missing)}")
+
+    rows = 0
+    nbytes = 0
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    with pq.ParquetWriter(part_path, PART_SCHEMA, compression="snappy") as writer:
+        for chunk in chunks:
+            n = chunk.num_rows if isinstance(chunk, pa.RecordBatch) else len(chunk)
+            if n == 0:
+                continue
+            table = to_part_table(chunk, matched, n)
+            writer.write_table(table)
+            rows += n
+            nbytes += table.nbytes
+    log.append(f"  Output: {rows:,} rows, {len(OUTPUT_SCHEMA)} columns "
+               f"({nbytes / 1e6:,.0f} MB in memory vs {rows * len(PART_SCHEMA) * 8 / 1e6:,.0f} MB as float64)")
+    return rows, log
+
+
+def merge_parts(staging: Path, years: list[int]):
+    """Merge per-year parts into OUTPUT_PATH, one year (of narrow columns,
+    so ~100 MB in memory) at a time."""
+    tmp_path = OUTPUT_PATH.with_suffix(".parquet.tmp")
+    with pq.ParquetWriter(tmp_path, OUTPUT_SCHEMA, compression="snappy") as writer:
+        for year in years:
+            table = pq.read_table(staging / f"survey_year={year}" / "part-0.parquet")
+            year_col = pa.array(np.full(table.num_rows, year, dtype=np.int16))
+            writer.write_table(table.append_column(OUTPUT_SCHEMA.field("survey_year"), year_col))
+    os.replace(tmp_path, OUTPUT_PATH)
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=min(len(YEARS), os.cpu_count() or 1),
+                        help="years decoded concurrently")
+    parser.add_argument("--memory-limit", default="8GB", help="total memory budget, split across workers")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="publish data/brfss_harmonized/survey_year=*/ instead of merging")
+    args = parser.parse_args()
+
     print("BRFSS Multi-Year Harmonization (2014-2020, 2023-2024)")
     print("=" * 60)
 
-    frames = []
+    # A worker holds ~4 copies of a chunk (readstat buffers, DataFrame,
+    # Arrow arrays, writer pages) of len(CANONICAL_COLS) float64 columns
+    per_worker = parse_size(args.memory_limit) // args.workers
+    chunk_rows = max(per_worker // (4 * 8 * len(CANONICAL_COLS)), 10_000)
+    print(f"{args.workers} workers, {per_worker / 1e9:.1f} GB / {chunk_rows:,}-row chunks each")
+
+    # Downloads are I/O-bound (and cached), so fetch them before decoding
+    sources = {}
     for year in YEARS:
-        df = load_year(year)
-        frames.append(df)
+        print(f"\n[{year}]")
+        sources[year] = BRFSS_2023_PATH if year == 2023 else download_xpt(year)
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    staging = PARTITIONED_DIR.with_suffix(".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    counts = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(harmonize_year, year, sources[year],
+                        staging / f"survey_year={year}" / "part-0.parquet", chunk_rows): year
+            for year in YEARS
+        }
+        for future in as_completed(futures):
+            year = futures[future]
+            counts[year], log = future.result()
+            print(f"\n{'='*60}")
+            print(f"Processed {year}")
+            print(f"{'='*60}")
+            print("\n".join(log))
 
     print(f"\n{'='*60}")
-    print("Concatenating all years...")
-    combined = pd.concat(frames, ignore_index=True)
-    print(f"Total: {len(combined):,} rows, {len(combined.columns)} columns")
+    print(f"Total: {sum(counts.values()):,} rows, {len(OUTPUT_SCHEMA)} columns")
 
     # Row counts per year
     print("\nRow counts by year:")
     for year in YEARS:
-        count = (combined["survey_year"] == year).sum()
-        print(f"  {year}: {count:,}")
-
-    # Write to parquet
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    print(f"\nWriting to {OUTPUT_PATH} ...")
-    combined.to_parquet(OUTPUT_PATH, engine="pyarrow", compression="snappy", index=False)
-
-    size_mb = OUTPUT_PATH.stat().st_size / 1e6
-    print(f"Done! File size: {size_mb:.1f} MB")
+        print(f"  {year}: {counts[year]:,}")
+
+    if args.partitioned:
+        shutil.rmtree(PARTITIONED_DIR, ignore_errors=True)
+        os.replace(staging, PARTITIONED_DIR)
+        files = list(PARTITIONED_DIR.glob("*/*.parquet"))
+        size_mb = sum(f.stat().st_size for f in files) / 1e6
+        print(f"\nWrote {PARTITIONED_DIR}/survey_year=*/ ({len(files)} parts)")
+    else:
+        merge_parts(staging, YEARS)
+        shutil.rmtree(staging)
+        # The brfss view prefers the partitioned dataset, so don't leave a stale one behind
+        shutil.rmtree(PARTITIONED_DIR, ignore_errors=True)
+        size_mb = OUTPUT_PATH.stat().st_size / 1e6
+
+    peak_mb, worker_mb = peak_rss_mb()
+    print(f"\nDone! Size: {size_mb:.1f} MB (peak RSS {peak_mb:,.0f} MB main, {worker_mb:,.0f} MB largest worker)")
 
     if size_mb > 200:
         print("WARNING: File exceeds 200MB target!")
@@ -0,0 +1,224 @@
+"""Shared state for incremental rebuilds of the Medicaid aggregates.
+
+The raw claims are rolled up once to billing_npi × hcpcs_code × claim_month
+and persisted as a claim_month-partitioned Parquet store under
+data/aggregate-state/rollup. A manifest records a fingerprint (raw row count
+plus a content hash) for every month in the store.
+
+An incremental refresh fingerprints the raw file by month (from Parquet
+footers alone when the raw data uses the claim_month-partitioned layout of
+convert_to_parquet.py --partitioned), re-rolls only the months whose
+fingerprint changed, and swaps those partitions in place. Each
+output script (aggregate.py, aggregate_providers.py) keeps its own state
+manifest next to its outputs listing the month fingerprints it last consumed,
+so it can tell which months changed since *its* previous run even if the
+store was refreshed by another script in between.
+
+Because the store keeps every (npi, hcpcs, month) key, distinct counts
+recomputed from it for the touched groups are exact.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+STATE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "aggregate-state")
+ROLLUP_DIR = os.path.join(STATE_DIR, "rollup")
+ROLLUP_MANIFEST = os.path.join(STATE_DIR, "rollup.json")
+STATE_FILE = ".aggregate_state.json"
+
+# Per-row hash over every raw column — summed per month it changes whenever
+# any row of that month is added, removed or edited. (Under XOR, identical
+# rows would cancel out and swapping one duplicate pair for another would go
+# unnoticed.)
+ROW_HASH = "hash(billing_npi, servicing_npi, hcpcs_code, unique_beneficiaries, total_claims, total_paid)::HUGEINT"
+
+# Bumped when the rollup's columns or fingerprints change; a store written
+# under another version is rebuilt in full
+ROLLUP_VERSION = 2
+
+ROLLUP_SELECT = f"""
+    SELECT
+        billing_npi,
+        hcpcs_code,
+        claim_month,
+        SUM(total_paid)::DOUBLE AS total_paid,
+        SUM(total_claims)::BIGINT AS total_claims,
+        SUM(unique_beneficiaries)::BIGINT AS unique_beneficiaries,
+        COUNT(*)::BIGINT AS raw_rows,
+        SUM({ROW_HASH}) AS row_hash
+    FROM {{source}}
+    {{where}}
+    GROUP BY billing_npi, hcpcs_code, claim_month
+"""
+
+
+def sql_dates(months) -> str:
+    """Render ISO month strings as a DATE literal list usable in IN (...)."""
+    return ", ".join(f"DATE '{m}'" for m in sorted(months)) or "NULL"
+
+
+def raw_source(raw: str) -> str:
+    """Table expression for the raw claims: the claim_month-partitioned layout
+    from convert_to_parquet.py --partitioned if present, else the single file."""
+    partitioned = raw.removesuffix(".parquet")
+    if os.path.isdir(partitioned):
+        return (f"read_parquet('{partitioned}/*/*.parquet', "
+                f"hive_partitioning=true, hive_types={{'claim_month': DATE}})")
+    return f"read_parquet('{raw}')"
+
+
+def load_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path: str, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def file_signature(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def partition_fingerprints(con, partitioned: str) -> dict[str, str]:
+    """Fingerprint a claim_month-partitioned raw layout from Parquet footers
+    and file stats alone — row count plus a hash of each file's size/mtime."""
+    files = con.sql(f"""
+        SELECT file_name, num_rows
+        FROM parquet_file_metadata('{partitioned}/*/*.parquet')
+    """).fetchall()
+    by_month: dict[str, list] = {}
+    for path, n in files:
+        month = os.path.basename(os.path.dirname(path)).removeprefix("claim_month=")
+        by_month.setdefault(month, []).append((n, f"{os.path.basename(path)}:{file_signature(path)}"))
+    return {
+        month: f"{sum(n for n, _ in parts)}:{hashlib.sha1(repr(sorted(parts)).encode()).hexdigest()[:16]}"
+        for month, parts in by_month.items()
+    }
+
+
+def fingerprints(con, source: str) -> dict[str, str]:
+    """Fingerprint each claim_month of `source` (raw file or rollup table)."""
+    if source == "base":
+        expr_rows, expr_hash = "SUM(raw_rows)", "SUM(row_hash)"
+    else:
+        expr_rows, expr_hash = "COUNT(*)", f"SUM({ROW_HASH})"
+    rows = con.sql(f"""
+        SELECT strftime(claim_month, '%Y-%m-%d'), {expr_rows}, {expr_hash}
+        FROM {source}
+        GROUP BY claim_month
+    """).fetchall()
+    return {month: f"{n}:{h}" for month, n, h in rows}
+
+
+def _write_partitions(con, sql: str) -> str:
+    staging = f"{ROLLUP_DIR}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    con.sql(f"COPY ({sql}) TO '{staging}' (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (claim_month))")
+    return staging
+
+
+def refresh_rollup(con, raw: str, incremental: bool) -> dict[str, str]:
+    """Bring the rollup store up to date and expose it to `con` as `base`.
+
+    A full refresh rolls up the whole raw file into a temp table and rewrites
+    the store from it. An incremental refresh re-rolls only new or changed
+    months; `base` is then a view over the store. Returns the month → fingerprint
+    map the store now reflects.
+    """
+    t = time.time()
+    os.makedirs(STATE_DIR, exist_ok=True)
+    source = raw_source(raw)
+    partitioned = raw.removesuffix(".parquet")
+    manifest = load_json(ROLLUP_MANIFEST) if incremental else None
+
+    if manifest is None or manifest.get("version") != ROLLUP_VERSION or not os.path.isdir(ROLLUP_DIR):
+        con.sql(f"CREATE OR REPLACE TEMP TABLE base AS {ROLLUP_SELECT.format(source=source, where='')}")
+        if os.path.isdir(partitioned):
+            months = partition_fingerprints(con, partitioned)
+        else:
+            months = fingerprints(con, "base")
+        staging = _write_partitions(con, "SELECT * FROM base")
+        shutil.rmtree(ROLLUP_DIR, ignore_errors=True)
+        os.replace(staging, ROLLUP_DIR)
+        save_json(ROLLUP_MANIFEST, {"months": months, "version": ROLLUP_VERSION})
+        rows = con.sql("SELECT count(*) FROM base").fetchone()[0]
+        print(f"  base — full rollup, {rows:,} rows, {len(months)} months ({time.time() - t:.1f}s)")
+        return months
+
+    previous = manifest["months"]
+    if os.path.isdir(partitioned):
+        months = partition_fingerprints(con, partitioned)
+    else:
+        months = fingerprints(con, source)
+    dirty = sorted(m for m, fp in months.items() if previous.get(m) != fp)
+    removed = sorted(set(previous) - set(months))
+
+    if dirty:
+        where = f"WHERE claim_month IN ({sql_dates(dirty)})"
+        staging = _write_partitions(con, ROLLUP_SELECT.format(source=source, where=where))
+        for month in dirty:
+            part = os.path.join(ROLLUP_DIR, f"claim_month={month}")
+            shutil.rmtree(part, ignore_errors=True)
+            os.replace(os.path.join(staging, f"claim_month={month}"), part)
+        shutil.rmtree(staging, ignore_errors=True)
+    for month in removed:
+        shutil.rmtree(os.path.join(ROLLUP_DIR, f"claim_month={month}"), ignore_errors=True)
+    save_json(ROLLUP_MANIFEST, {"months": months, "version": ROLLUP_VERSION})
+
+    con.sql(f"""
+        CREATE OR REPLACE TEMP VIEW base AS
+        SELECT * FROM read_parquet('{ROLLUP_DIR}/*/*.parquet',
+                                   hive_partitioning=true, hive_types={{'claim_month': DATE}})
+    """)
+    print(f"  base — incremental, {len(dirty)} months re-rolled, {len(removed)} removed ({time.time() - t:.1f}s)")
+    return months
+
+
+def load_state(out_dir: str, inputs: dict[str, str], outputs: list[str]):
+    """Return the month fingerprints last consumed by the script writing to
+    `out_dir`, or None if it must rebuild from scratch (no state, missing
+    outputs, or a changed side input such as npi_lookup)."""
+    state = load_json(os.path.join(out_dir, STATE_FILE))
+    if state is None or state.get("inputs") != inputs:
+        return None
+    if not all(os.path.exists(os.path.join(out_dir, name)) for name in outputs):
+        return None
+    return state["months"]
+
+
+def save_state(out_dir: str, months: dict[str, str], inputs: dict[str, str]):
+    save_json(os.path.join(out_dir, STATE_FILE), {"months": months, "inputs": inputs})
+
+
+def changed_months(previous: dict[str, str], current: dict[str, str]) -> list[str]:
+    """Months added, removed or restated between two fingerprint maps."""
+    return sorted(m for m in set(previous) | set(current) if previous.get(m) != current.get(m))
+
+
+def merge_parquet(con, path: str, sql: str, stale: str, order_by: str | None = None,
+                  options: str = "FORMAT PARQUET, COMPRESSION SNAPPY"):
+    """Rewrite `path` keeping existing rows that don't match `stale` plus the
+    rows produced by `sql`, which must cover exactly the stale groups."""
+    tmp = f"{path}.tmp"
+    order = f"ORDER BY {order_by}" if order_by else ""
+    con.sql(f"""
+        COPY (
+            SELECT * FROM (
+                SELECT * FROM read_parquet('{path}') WHERE NOT ({stale})
+                UNION ALL BY NAME
+                ({sql})
+            )
+            {order}
+        ) TO '{tmp}' ({options})
+    """)
+    os.replace(tmp, path)
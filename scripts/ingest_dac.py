@@ -5,102 +5,205 @@ and convert to Parquet.
 Source: https://data.cms.gov/provider-data/dataset/mj5m-pzi6
 Download: https://data.cms.gov/provider-data/sites/default/files/resources/52c3f098d7e56028a298fd297cb0b38d_1771632339/DAC_NationalDownloadableFile.csv
 
-Each row = clinician/enrollment/group/address combination.
-Clinicians with multiple enrollments or locations appear on multiple rows.
+Each source row = clinician/enrollment/group/address combination, so
+clinicians with multiple enrollments or locations appear on multiple rows.
+The ingest normalizes it into data/dac/:
+
+    clinicians.parquet   one row per NPI (name, credentials, school), sorted by NPI
+    enrollments.parquet  one row per NPI + enrollment (specialties, telehealth, assignment)
+    addresses.parquet    one row per address ID
+    locations.parquet    one row per source row: the NPI, enrollment, group and address
+
+The query-service registers each as a dac_<table> view, for per-NPI lookups
+and clinician/specialty counts without the address and group duplication.
+The wide file, data/dac_clinicians.parquet, is still written for the dac
+view: full scans of it are ~4x faster than of the 4-way join. Without it the
+dac view falls back to joining the tables back into the wide shape
+(COMPAT_VIEW_SQL). Before publishing, the ingest checks that the join
+reproduces the source rows exactly.
 
 Usage:
     source .venv/bin/activate
     python scripts/ingest_dac.py
 """
 
-import duckdb
 import os
+import shutil
+
+import duckdb
+
+from download_cache import fetch
 
 SOURCE_URL = "https://data.cms.gov/provider-data/sites/default/files/resources/52c3f098d7e56028a298fd297cb0b38d_1771632339/DAC_NationalDownloadableFile.csv"
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "dac_clinicians.parquet")
+DAC_DIR = os.path.join(OUTPUT_DIR, "dac")
+WIDE_FILE = os.path.join(OUTPUT_DIR, "dac_clinicians.parquet")  # read by the dac view
+
+# The wide row, in the column order of the original dac_clinicians.parquet
+WIDE_SELECT = """
+    SELECT
+        CAST(NPI AS VARCHAR) AS npi,
+        CAST(Ind_PAC_ID AS VARCHAR) AS ind_pac_id,
+        CAST(Ind_enrl_ID AS VARCHAR) AS ind_enrl_id,
+        "Provider Last Name" AS provider_last_name,
+        "Provider First Name" AS provider_first_name,
+        "Provider Middle Name" AS provider_middle_name,
+        suff,
+        gndr,
+        Cred AS cred,
+        Med_sch AS med_sch,
+        CAST(Grd_yr AS VARCHAR) AS grd_yr,
+        pri_spec,
+        sec_spec_1,
+        sec_spec_2,
+        sec_spec_3,
+        sec_spec_4,
+        sec_spec_all,
+        Telehlth AS telehlth,
+        "Facility Name" AS facility_name,
+        CAST(org_pac_id AS VARCHAR) AS org_pac_id,
+        CAST(num_org_mem AS INTEGER) AS num_org_mem,
+        adr_ln_1,
+        adr_ln_2,
+        ln_2_sprs,
+        "City/Town" AS city,
+        State AS state,
+        CAST("ZIP Code" AS VARCHAR) AS zip_code,
+        "Telephone Number" AS telephone,
+        ind_assgn,
+        grp_assgn,
+        CAST(adrs_id AS VARCHAR) AS adrs_id
+    FROM read_csv_auto('{csv_path}', header=true, all_varchar=true)
+"""
+
+# Table → (key columns, other columns). Each table is SELECT DISTINCT of its
+# columns from the wide rows, and the ingest fails if a key maps to more
+# than one row. locations has no key: it keeps every wide row.
+TABLES = {
+    "clinicians": (
+        ["npi"],
+        ["ind_pac_id", "provider_last_name", "provider_first_name", "provider_middle_name",
+         "suff", "gndr", "cred", "med_sch", "grd_yr"],
+    ),
+    "enrollments": (
+        ["npi", "ind_enrl_id"],
+        ["pri_spec", "sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4", "sec_spec_all",
+         "telehlth", "ind_assgn"],
+    ),
+    "addresses": (
+        ["adrs_id"],
+        ["adr_ln_1", "adr_ln_2", "city", "state", "zip_code"],
+    ),
+    "locations": (
+        [],
+        ["npi", "ind_enrl_id", "org_pac_id", "facility_name", "num_org_mem", "grp_assgn",
+         "adrs_id", "ln_2_sprs", "telephone"],
+    ),
+}
+
+# Matches the dac view in query-service/src/db.ts: same columns, same order
+# as the wide file
+COMPAT_VIEW_SQL = """
+    SELECT
+        l.npi, c.ind_pac_id, l.ind_enrl_id,
+        c.provider_last_name, c.provider_first_name, c.provider_middle_name, c.suff, c.gndr, c.cred,
+        c.med_sch, c.grd_yr,
+        e.pri_spec, e.sec_spec_1, e.sec_spec_2, e.sec_spec_3, e.sec_spec_4, e.sec_spec_all, e.telehlth,
+        l.facility_name, l.org_pac_id, l.num_org_mem,
+        a.adr_ln_1, a.adr_ln_2, l.ln_2_sprs, a.city, a.state, a.zip_code, l.telephone,
+        e.ind_assgn, l.grp_assgn, l.adrs_id
+    FROM dac_locations l
+    LEFT JOIN dac_clinicians c ON c.npi = l.npi
+    LEFT JOIN dac_enrollments e ON e.npi = l.npi
+        AND e.ind_enrl_id = l.ind_enrl_id
+    LEFT JOIN dac_addresses a ON a.adrs_id = l.adrs_id
+"""
+
+
+def write_table(con, name: str, staging: str):
+    key, cols = TABLES[name]
+    out = os.path.join(staging, f"{name}.parquet")
+    con.execute(f"""
+        COPY (SELECT {"DISTINCT" if key else ""} {", ".join(key + cols)} FROM wide ORDER BY {", ".join(key or ["npi"])})
+        TO '{out}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+    """)
+    con.execute(f"CREATE OR REPLACE VIEW dac_{name} AS SELECT * FROM read_parquet('{out}')")
+    if not key:
+        return
+    rows, keys = con.execute(f"SELECT COUNT(*), COUNT(DISTINCT ({', '.join(key)})) FROM dac_{name}").fetchone()
+    if rows != keys:
+        example = con.execute(f"SELECT {', '.join(key)} FROM dac_{name} GROUP BY ALL HAVING COUNT(*) > 1").fetchone()
+        raise ValueError(f"{name}: {rows - keys:,} keys have conflicting values "
+                         f"(e.g. {dict(zip(key, example))}); the split in TABLES doesn't hold")
 
 
 def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     con = duckdb.connect()
 
-    # Enable httpfs for remote CSV reads
-    con.execute("INSTALL httpfs; LOAD httpfs;")
-    con.execute("SET force_download=true;")
+    print("Downloading...")
+    csv_path = fetch(SOURCE_URL)
+
+    staging = f"{DAC_DIR}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    wide_path = os.path.join(staging, "wide.parquet")
 
-    print("Downloading and converting to Parquet...")
+    print("Converting to Parquet...")
     con.execute(f"""
-        COPY (
-            SELECT
-                CAST(NPI AS VARCHAR) AS npi,
-                CAST(Ind_PAC_ID AS VARCHAR) AS ind_pac_id,
-                CAST(Ind_enrl_ID AS VARCHAR) AS ind_enrl_id,
-                "Provider Last Name" AS provider_last_name,
-                "Provider First Name" AS provider_first_name,
-                "Provider Middle Name" AS provider_middle_name,
-                suff,
-                gndr,
-                Cred AS cred,
-                Med_sch AS med_sch,
-                CAST(Grd_yr AS VARCHAR) AS grd_yr,
-                pri_spec,
-                sec_spec_1,
-                sec_spec_2,
-                sec_spec_3,
-                sec_spec_4,
-                sec_spec_all,
-                Telehlth AS telehlth,
-                "Facility Name" AS facility_name,
-                CAST(org_pac_id AS VARCHAR) AS org_pac_id,
-                CAST(num_org_mem AS INTEGER) AS num_org_mem,
-                adr_ln_1,
-                adr_ln_2,
-                ln_2_sprs,
-                "City/Town" AS city,
-                State AS state,
-                CAST("ZIP Code" AS VARCHAR) AS zip_code,
-                "Telephone Number" AS telephone,
-                ind_assgn,
-                grp_assgn,
-                CAST(adrs_id AS VARCHAR) AS adrs_id
-            FROM read_csv_auto('{SOURCE_URL}', header=true, all_varchar=true)
-        ) TO '{OUTPUT_FILE}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+        COPY ({WIDE_SELECT.format(csv_path=csv_path)})
+        TO '{wide_path}' (FORMAT PARQUET, COMPRESSION SNAPPY)
     """)
+    con.execute(f"CREATE VIEW wide AS SELECT * FROM read_parquet('{wide_path}')")
+
+    print("Normalizing...")
+    for name in TABLES:
+        write_table(con, name, staging)
+
+    # The join must give back exactly the source rows: same count and the
+    # same order-independent checksum over whole rows
+    checks = [
+        con.execute(f"SELECT COUNT(*), SUM(hash(t)) FROM ({sql}) t").fetchone()
+        for sql in ("SELECT * FROM wide", COMPAT_VIEW_SQL)
+    ]
+    if checks[0] != checks[1]:
+        raise ValueError(f"dac view doesn't reproduce the source rows: {checks[0][0]:,} rows → {checks[1][0]:,}")
+    wide_mb = os.path.getsize(wide_path) / (1024 * 1024)
+    con.execute("DROP VIEW wide")
+
+    os.replace(wide_path, WIDE_FILE)
+    shutil.rmtree(DAC_DIR, ignore_errors=True)
+    os.replace(staging, DAC_DIR)
 
     # Verify
-    result = con.execute(
-        f"SELECT COUNT(*) FROM read_parquet('{OUTPUT_FILE}')"
-    ).fetchone()
-    print(f"Rows: {result[0]:,}")
-
-    unique_npis = con.execute(
-        f"SELECT COUNT(DISTINCT npi) FROM read_parquet('{OUTPUT_FILE}')"
-    ).fetchone()
-    print(f"Unique NPIs: {unique_npis[0]:,}")
-
-    cols = con.execute(
-        f"DESCRIBE SELECT * FROM read_parquet('{OUTPUT_FILE}')"
-    ).fetchall()
-    print(f"\nColumns ({len(cols)}):")
+    print(f"\nRows: {checks[0][0]:,} (dac view verified against the source)")
+    total_mb = 0
+    for name, (key, _) in TABLES.items():
+        path = os.path.join(DAC_DIR, f"{name}.parquet")
+        con.execute(f"CREATE OR REPLACE VIEW dac_{name} AS SELECT * FROM read_parquet('{path}')")
+        rows = con.execute(f"SELECT COUNT(*) FROM dac_{name}").fetchone()[0]
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        total_mb += size_mb
+        print(f"  dac_{name:12s} {rows:>12,} rows  {size_mb:8.1f} MB  key: {', '.join(key) or '-'}")
+    print(f"  total {total_mb:.1f} MB, plus the wide file for the dac view: {wide_mb:.1f} MB")
+
+    cols = con.execute(f"DESCRIBE {COMPAT_VIEW_SQL}").fetchall()
+    print(f"\nColumns of the dac view ({len(cols)}):")
     for col in cols:
         print(f"  {col[0]:40s} {col[1]}")
 
     # Sample specialties
-    specs = con.execute(f"""
-        SELECT pri_spec, COUNT(*) as cnt
-        FROM read_parquet('{OUTPUT_FILE}')
+    specs = con.execute("""
+        SELECT pri_spec, COUNT(DISTINCT npi) as cnt
+        FROM dac_enrollments
         GROUP BY pri_spec
         ORDER BY cnt DESC
         LIMIT 15
     """).fetchall()
-    print("\nTop specialties:")
+    print("\nTop specialties (clinicians):")
     for s in specs:
         print(f"  {s[0]:40s} {s[1]:>10,}")
-
-    size_mb = os.path.getsize(OUTPUT_FILE) / (1024 * 1024)
-    print(f"\nFile size: {size_mb:.1f} MB")
     con.close()
 
 
@@ -11,6 +11,8 @@ import duckdb
 import os
 import sys
 
+from download_cache import fetch
+
 # 2023 CSV direct download (no auth required)
 # If this URL 404s, visit https://data.cms.gov/provider-summary-by-type-of-service/medicare-physician-other-practitioners/medicare-physician-other-practitioners-by-provider-and-service
 # and grab the current CSV download link.
@@ -30,8 +32,8 @@ def main():
         print(f"Using local CSV: {local_csv}")
         source = local_csv
     else:
-        print(f"Downloading from CMS (this is ~3GB, may take a few minutes)...")
-        source = CSV_URL
+        print(f"Downloading from CMS (this is ~3GB, may take a few minutes; cached for reruns)...")
+        source = fetch(CSV_URL)
 
     print("Converting to Parquet...")
     con.execute(f"""
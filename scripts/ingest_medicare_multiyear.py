@@ -1,21 +1,36 @@
 """
 Download CMS Medicare Physician & Other Practitioners data for ALL years (2013-2023)
-and combine into a single Parquet file with a data_year column.
+and convert each year to its own Parquet file with a data_year column.
 
 All years have identical column schemas (29 columns). Each year is ~9-10M rows.
 Combined: ~100M+ rows, estimated ~3-4GB Parquet.
 
+Years are converted independently and concurrently (--workers) to
+data/medicare_<year>.parquet, which the query-service `medicare_*.parquet`
+glob picks up directly. A manifest (data/medicare_manifest.json) records each
+completed year with its row count and SHA-256, so a rerun skips years whose
+output is intact and only redoes failed or missing ones. --compact folds the
+per-year files into medicare_physician_all_years.parquet afterwards.
+
 Usage:
     source .venv/bin/activate
-    python scripts/ingest_medicare_multiyear.py
+    python scripts/ingest_medicare_multiyear.py                  # all years, resumable
+    python scripts/ingest_medicare_multiyear.py 2022 2023        # subset of years
+    python scripts/ingest_medicare_multiyear.py --workers 4 --compact
 
 Source: https://data.cms.gov/provider-summary-by-type-of-service/medicare-physician-other-practitioners/
         medicare-physician-other-practitioners-by-provider-and-service
 """
 
+import argparse
 import duckdb
+import hashlib
+import json
 import os
-import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from download_cache import fetch
 
 # Direct download URLs for each year — if a URL 404s, visit the CMS page above
 # and grab the updated CSV download link for that year.
@@ -66,66 +81,177 @@ COLUMNS = """
 """
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "medicare_physician_all_years.parquet")
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "medicare_manifest.json")
+# Matches the medicare_*.parquet glob, so per-year files are removed once compacted
+COMPACT_FILE = os.path.join(OUTPUT_DIR, "medicare_physician_all_years.parquet")
 
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def year_file(year: int) -> str:
+    return os.path.join(OUTPUT_DIR, f"medicare_{year}.parquet")
 
-    # Allow specifying subset of years via command line
-    if len(sys.argv) > 1:
-        years = [int(y) for y in sys.argv[1:]]
-    else:
-        years = sorted(YEAR_URLS.keys())
 
-    con = duckdb.connect()
-    con.execute("INSTALL httpfs; LOAD httpfs;")
+def per_year_files() -> list[int]:
+    """Years with a medicare_<year>.parquet on disk, whichever run wrote it."""
+    return [y for y in sorted(YEAR_URLS) if os.path.exists(year_file(y))]
+
+
+def sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest() -> dict:
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    return {"years": {}, "compacted": None}
+
+
+def save_manifest(manifest: dict):
+    tmp = f"{MANIFEST_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def compacted_intact(manifest: dict) -> bool:
+    compacted = manifest.get("compacted")
+    return bool(compacted) and os.path.exists(COMPACT_FILE) and sha256(COMPACT_FILE) == compacted["sha256"]
+
 
-    # Build UNION ALL query across all years
-    union_parts = []
-    for year in years:
-        url = YEAR_URLS[year]
-        union_parts.append(f"""
+def is_complete(manifest: dict, year: int, compacted_ok: bool) -> bool:
+    """A year is done if its recorded output is present and unmodified, either
+    as its own file or inside the compacted file."""
+    entry = manifest["years"].get(str(year))
+    if not entry or entry["url"] != YEAR_URLS[year]:
+        return False
+    if os.path.exists(year_file(year)):
+        return sha256(year_file(year)) == entry["sha256"]
+    compacted = manifest.get("compacted")
+    return compacted_ok and year in compacted["years"]
+
+
+def ingest_year(year: int, memory_limit: str) -> dict:
+    """Convert one year's CSV to medicare_<year>.parquet via a temp file."""
+    t = time.time()
+    out = year_file(year)
+    tmp = f"{out}.tmp"
+    csv_path = fetch(YEAR_URLS[year], label=str(year))
+    con = duckdb.connect(config={"memory_limit": memory_limit})
+    rows = con.execute(f"""
+        COPY (
             SELECT {COLUMNS}, {year} AS data_year
-            FROM read_csv_auto('{url}')
-        """)
+            FROM read_csv_auto('{csv_path}')
+        ) TO '{tmp}' (FORMAT PARQUET, COMPRESSION SNAPPY, ROW_GROUP_SIZE 500000)
+    """).fetchone()[0]
+    con.close()
+    os.replace(tmp, out)
+    return {
+        "url": YEAR_URLS[year],
+        "rows": rows,
+        "bytes": os.path.getsize(out),
+        "sha256": sha256(out),
+        "seconds": round(time.time() - t, 1),
+    }
 
-    union_query = " UNION ALL ".join(union_parts)
 
-    print(f"Combining {len(years)} years: {min(years)}-{max(years)}")
-    print("This downloads ~30GB of CSVs and writes a single Parquet. May take 30-60 minutes...")
+def compact(manifest: dict):
+    """Fold per-year files into COMPACT_FILE. Years with a per-year file
+    replace their rows in any previous compacted file."""
+    per_year = per_year_files()
+    parts = [f"SELECT * FROM read_parquet('{year_file(y)}')" for y in per_year]
+    previous = manifest.get("compacted")
+    if previous and os.path.exists(COMPACT_FILE):
+        replaced = ", ".join(map(str, per_year)) or "NULL"
+        parts.append(f"SELECT * FROM read_parquet('{COMPACT_FILE}') WHERE data_year NOT IN ({replaced})")
+    if not per_year:
+        print("Nothing to compact.")
+        return
 
+    print(f"\nCompacting {len(per_year)} per-year files into {COMPACT_FILE} ...")
+    tmp = f"{COMPACT_FILE}.tmp"
+    con = duckdb.connect()
     con.execute(f"""
-        COPY ({union_query})
-        TO '{OUTPUT_FILE}' (FORMAT PARQUET, COMPRESSION SNAPPY, ROW_GROUP_SIZE 500000)
+        COPY (
+            SELECT * FROM ({" UNION ALL BY NAME ".join(parts)})
+            ORDER BY data_year
+        ) TO '{tmp}' (FORMAT PARQUET, COMPRESSION SNAPPY, ROW_GROUP_SIZE 500000)
     """)
+    con.close()
+    os.replace(tmp, COMPACT_FILE)
+    years = sorted(set(previous["years"] if previous else []) | set(per_year))
+    manifest["compacted"] = {"years": years, "sha256": sha256(COMPACT_FILE)}
+    save_manifest(manifest)
+    for y in per_year:
+        os.remove(year_file(y))
+
 
-    # Verify
-    result = con.execute(f"SELECT COUNT(*) FROM read_parquet('{OUTPUT_FILE}')").fetchone()
-    print(f"\nTotal rows: {result[0]:,}")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("years", nargs="*", type=int, help="subset of years (default: all)")
+    parser.add_argument("--workers", type=int, default=3, help="years converted concurrently")
+    parser.add_argument("--memory-limit", default="4GB", help="DuckDB memory limit per worker")
+    parser.add_argument("--compact", action="store_true",
+                        help="fold per-year files into one Parquet after ingesting")
+    args = parser.parse_args()
 
-    # Per-year breakdown
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    years = args.years or sorted(YEAR_URLS.keys())
+    manifest = load_manifest()
+
+    compacted_ok = compacted_intact(manifest)
+    pending = [y for y in years if not is_complete(manifest, y, compacted_ok)]
+    skipped = sorted(set(years) - set(pending))
+    if skipped:
+        print(f"Already complete (skipping): {', '.join(map(str, skipped))}")
+    print(f"Ingesting {len(pending)} years with {args.workers} workers: {', '.join(map(str, pending))}")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(ingest_year, year, args.memory_limit): year for year in pending}
+        for future in as_completed(futures):
+            year = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"  {year}: FAILED — {e}")
+                failed.append(year)
+                continue
+            # Recording each year as it lands is what makes a rerun resume
+            manifest["years"][str(year)] = entry
+            save_manifest(manifest)
+            print(f"  {year}: {entry['rows']:,} rows, {entry['bytes'] / (1024 * 1024):.1f} MB "
+                  f"({entry['seconds']:.0f}s)")
+
+    # Rows per year
     print("\nRows per year:")
-    year_counts = con.execute(f"""
-        SELECT data_year, COUNT(*) as cnt
-        FROM read_parquet('{OUTPUT_FILE}')
-        GROUP BY data_year ORDER BY data_year
-    """).fetchall()
-    for year, cnt in year_counts:
-        print(f"  {year}: {cnt:,}")
-
-    # Columns
-    cols = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{OUTPUT_FILE}')").fetchall()
-    print(f"\nColumns ({len(cols)}):")
-    for col in cols:
-        print(f"  {col[0]:40s} {col[1]}")
-
-    # File size
-    size_mb = os.path.getsize(OUTPUT_FILE) / (1024 * 1024)
-    print(f"\nOutput: {OUTPUT_FILE}")
-    print(f"Size: {size_mb:.1f} MB ({size_mb/1024:.2f} GB)")
+    total = 0
+    for year in sorted(int(y) for y in manifest["years"]):
+        rows = manifest["years"][str(year)]["rows"]
+        total += rows
+        print(f"  {year}: {rows:,}")
+    print(f"Total rows: {total:,}")
 
-    con.close()
+    if failed:
+        print(f"\nFailed years: {', '.join(map(str, sorted(failed)))} — rerun to retry them.")
+        raise SystemExit(1)
+
+    # A re-ingested year still has its old rows in the compacted file, and both
+    # match the medicare_*.parquet glob, so compaction can't be skipped then.
+    # That includes per-year files left by an earlier run that failed before
+    # compacting, not just the years ingested now.
+    compacted = manifest.get("compacted")
+    stale = compacted and os.path.exists(COMPACT_FILE) and set(per_year_files()) & set(compacted["years"])
+    if stale and not args.compact:
+        print(f"\nPer-year files for compacted years {sorted(stale)} — compacting to avoid duplicate rows.")
+    if args.compact or stale:
+        compact(manifest)
+        size_mb = os.path.getsize(COMPACT_FILE) / (1024 * 1024)
+        print(f"Output: {COMPACT_FILE}")
+        print(f"Size: {size_mb:.1f} MB ({size_mb/1024:.2f} GB)")
 
 
 if __name__ == "__main__":
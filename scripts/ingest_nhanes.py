@@ -1,50 +1,138 @@
 """
-Download NHANES 2021-2023 cycle data and convert to Parquet.
+Download NHANES cycles and convert them to a survey_cycle-partitioned
+Parquet dataset.
 
-Downloads ~20 SAS Transport (.XPT) files from CDC, merges on SEQN
-(respondent sequence number), and outputs a single Parquet file.
+For each cycle, ~20 SAS Transport (.XPT) component files are downloaded
+from CDC (concurrently, through the shared download cache), decoded in a
+process pool, joined on SEQN (respondent sequence number) and written to
+data/nhanes/survey_cycle=<cycle>/part-0.parquet, which the query-service's
+nhanes_all_cycles view globs (its nhanes view is the latest cycle present).
+Only the cycles named on the command line are rewritten, so adding a
+historical cycle is one run for that cycle.
+
+Each component's selected columns become an Arrow table that is
+left-joined to the demographics spine by SEQN lookup plus take() as soon as
+it is decoded, and then dropped; the columns are assembled into one table
+once the cycle's last component is in (SeqnJoin). Nothing wide is copied
+per component, as successive pandas merges did, so peak memory is about
+the output plus the components decoded before their cycle's DEMO file.
+
+Variables are named as in 2021-2023; CYCLES lists each older cycle's file
+naming and renames, and RECODES the variables an older cycle coded
+differently. Every partition has the same columns, null where a cycle lacks
+a component or variable; those are listed as the components are decoded.
+Survey weights are per cycle: scale each by its share of the pooled years
+(2017-2020 covers 3.2) before combining cycles.
 
 Usage:
     source .venv/bin/activate
-    python scripts/ingest_nhanes.py
+    python scripts/ingest_nhanes.py                        # 2021-2023
+    python scripts/ingest_nhanes.py 2017-2020 2015-2016    # add older cycles
 """
 
+import argparse
 import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from download_cache import fetch
+from memory import peak_rss_mb
 
-BASE_URL = "https://wwwn.cdc.gov/Nchs/Data/Nhanes/Public/2021/DataFiles"
+BASE_URL = "https://wwwn.cdc.gov/Nchs/Data/Nhanes/Public/{year}/DataFiles"
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "nhanes_2021_2023.parquet")
-
-# Each tuple: (filename, short description)
-XPT_FILES = [
-    ("DEMO_L.xpt", "Demographics"),
-    ("BMX_L.xpt", "Body Measures"),
-    ("BPXO_L.xpt", "Blood Pressure"),
-    ("GHB_L.xpt", "Glycohemoglobin (HbA1c)"),
-    ("GLU_L.xpt", "Fasting Glucose & Insulin"),
-    ("TCHOL_L.xpt", "Total Cholesterol"),
-    ("HDL_L.xpt", "HDL Cholesterol"),
-    ("TRIGLY_L.xpt", "Triglycerides & LDL"),
-    ("BIOPRO_L.xpt", "Standard Biochemistry (kidney, liver, electrolytes)"),
-    ("CBC_L.xpt", "Complete Blood Count"),
-    ("HSCRP_L.xpt", "High-Sensitivity C-Reactive Protein"),
-    ("DIQ_L.xpt", "Diabetes Questionnaire"),
-    ("BPQ_L.xpt", "Blood Pressure & Cholesterol Questionnaire"),
-    ("MCQ_L.xpt", "Medical Conditions"),
-    ("DPQ_L.xpt", "Depression Screener (PHQ-9)"),
-    ("SMQ_L.xpt", "Smoking"),
-    ("ALQ_L.xpt", "Alcohol Use"),
-    ("PAQ_L.xpt", "Physical Activity"),
-    ("HIQ_L.xpt", "Health Insurance"),
-    ("SLQ_L.xpt", "Sleep Disorders"),
+DATASET_DIR = os.path.join(OUTPUT_DIR, "nhanes")
+
+# Cycle label → (URL year directory, file name pattern, variable renames).
+# File names are the pattern with the component name filled in.
+CYCLES = {
+    "2021-2023": ("2021", "{}_L.xpt", {}),
+    # Pre-pandemic 2017-March 2020 combined files. The weights cover the
+    # 3.2-year period; the triglycerides variable was renamed in 2021.
+    "2017-2020": ("2017", "P_{}.xpt", {
+        "WTINTPRP": "WTINT2YR",
+        "WTMECPRP": "WTMEC2YR",
+        "LBXTR": "LBXTLG",
+    }),
+    # No oscillometric blood pressure (BPXO) before 2017, and no ALQ111,
+    # ALQ142, ALQ270 or weekend sleep (SLD013) equivalents. Insurance was
+    # HIQ031*, with the same letters per coverage type.
+    "2015-2016": ("2015", "{}_I.xpt", {
+        "LBXTR": "LBXTLG",
+        "SLD010H": "SLD012",
+        **{f"HIQ031{x}": f"HIQ032{x}" for x in "ABCDEHI"},
+    }),
+}
+LATEST_CYCLE = "2021-2023"
+
+
+def marital_status_z(df: pd.DataFrame) -> pd.Series:
+    """DMDMARTZ from the six-category DMDMARTL (1 married, 2 widowed,
+    3 divorced, 4 separated, 5 never married, 6 living with partner)."""
+    return df["DMDMARTL"].map({1: 1, 6: 1, 2: 2, 3: 2, 4: 2, 5: 3, 77: 77, 99: 99})
+
+
+def drinking_frequency(df: pd.DataFrame) -> pd.Series:
+    """ALQ121's categories (0 never ... 1 every day ... 10 once or twice a
+    year) from ALQ120Q times per ALQ120U unit (1 week, 2 month, 3 year).
+    Approximate: ALQ120Q was only asked of those with 12+ drinks in a year
+    or a lifetime, where ALQ121 is asked of anyone who ever drank."""
+    times, unit = df["ALQ120Q"], df["ALQ120U"]
+    per_year = times * unit.map({1: 52, 2: 12, 3: 1})
+    codes = np.select(
+        [times == 0, times == 777, times == 999, per_year >= 365, per_year >= 260, per_year >= 156,
+         per_year >= 104, per_year >= 52, per_year >= 24, per_year >= 12, per_year >= 7, per_year >= 3,
+         per_year >= 1],
+        [0, 77, 99, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+        default=np.nan,
+    )
+    return pd.Series(codes, index=df.index)
+
+
+# Cycle → 2021-2023 variable → (source variables, function of the component's
+# DataFrame), for variables whose older coding differs
+RECODES = {
+    "2015-2016": {
+        "DMDMARTZ": (["DMDMARTL"], marital_status_z),
+        "ALQ121": (["ALQ120Q", "ALQ120U"], drinking_frequency),
+    },
+}
+
+# Each tuple: (component, short description); DEMO is the join spine
+COMPONENTS = [
+    ("DEMO", "Demographics"),
+    ("BMX", "Body Measures"),
+    ("BPXO", "Blood Pressure"),
+    ("GHB", "Glycohemoglobin (HbA1c)"),
+    ("GLU", "Fasting Glucose & Insulin"),
+    ("TCHOL", "Total Cholesterol"),
+    ("HDL", "HDL Cholesterol"),
+    ("TRIGLY", "Triglycerides & LDL"),
+    ("BIOPRO", "Standard Biochemistry (kidney, liver, electrolytes)"),
+    ("CBC", "Complete Blood Count"),
+    ("HSCRP", "High-Sensitivity C-Reactive Protein"),
+    ("DIQ", "Diabetes Questionnaire"),
+    ("BPQ", "Blood Pressure & Cholesterol Questionnaire"),
+    ("MCQ", "Medical Conditions"),
+    ("DPQ", "Depression Screener (PHQ-9)"),
+    ("SMQ", "Smoking"),
+    ("ALQ", "Alcohol Use"),
+    ("PAQ", "Physical Activity"),
+    ("HIQ", "Health Insurance"),
+    ("SLQ", "Sleep Disorders"),
 ]
 
-# Columns to keep from each file (None = keep all)
+# Columns to keep from each component (2021-2023 names)
 # We curate to ~100 most useful columns
 COLUMNS_TO_KEEP = {
-    "DEMO_L.xpt": [
+    "DEMO": [
         "SEQN",
         "RIAGENDR",   # Gender (1=Male, 2=Female)
         "RIDAGEYR",   # Age in years at screening
@@ -57,14 +145,14 @@ COLUMNS_TO_KEEP = {
         "SDMVSTRA",   # Masked variance stratum
         "SDMVPSU",    # Masked variance PSU
     ],
-    "BMX_L.xpt": [
+    "BMX": [
         "SEQN",
         "BMXWT",      # Weight (kg)
         "BMXHT",      # Standing height (cm)
         "BMXBMI",     # Body mass index
         "BMXWAIST",   # Waist circumference (cm)
     ],
-    "BPXO_L.xpt": [
+    "BPXO": [
         "SEQN",
         "BPXOSY1",    # Systolic BP reading 1
         "BPXODI1",    # Diastolic BP reading 1
@@ -73,28 +161,28 @@ COLUMNS_TO_KEEP = {
         "BPXOSY3",    # Systolic BP reading 3
         "BPXODI3",    # Diastolic BP reading 3
     ],
-    "GHB_L.xpt": [
+    "GHB": [
         "SEQN",
         "LBXGH",      # Glycohemoglobin HbA1c (%)
     ],
-    "GLU_L.xpt": [
+    "GLU": [
         "SEQN",
         "LBXGLU",     # Fasting glucose (mg/dL)
     ],
-    "TCHOL_L.xpt": [
+    "TCHOL": [
         "SEQN",
         "LBXTC",      # Total cholesterol (mg/dL)
     ],
-    "HDL_L.xpt": [
+    "HDL": [
         "SEQN",
         "LBDHDD",     # Direct HDL-cholesterol (mg/dL)
     ],
-    "TRIGLY_L.xpt": [
+    "TRIGLY": [
         "SEQN",
         "LBXTLG",     # Triglycerides (mg/dL) — 2021-2023 cycle name
         "LBDLDL",     # LDL-cholesterol (mg/dL, calculated)
     ],
-    "BIOPRO_L.xpt": [
+    "BIOPRO": [
         "SEQN",
         "LBXSCR",     # Creatinine (mg/dL)
         "LBXSBU",     # Blood urea nitrogen (mg/dL)
@@ -115,7 +203,7 @@ COLUMNS_TO_KEEP = {
         "LBXSPH",     # Phosphorus (mg/dL)
         "LBXSCH",     # Cholesterol, serum (mg/dL)
     ],
-    "CBC_L.xpt": [
+    "CBC": [
         "SEQN",
         "LBXWBCSI",   # White blood cell count (1000 cells/uL)
         "LBXRBCSI",   # Red blood cell count (million cells/uL)
@@ -124,23 +212,23 @@ COLUMNS_TO_KEEP = {
         "LBXMCVSI",   # Mean cell volume (fL)
         "LBXPLTSI",   # Platelet count (1000 cells/uL)
     ],
-    "HSCRP_L.xpt": [
+    "HSCRP": [
         "SEQN",
         "LBXHSCRP",   # hs-CRP (mg/L)
     ],
-    "DIQ_L.xpt": [
+    "DIQ": [
         "SEQN",
         "DIQ010",     # Doctor told you have diabetes
         "DIQ050",     # Taking insulin now
         "DIQ070",     # Taking oral diabetes medication
     ],
-    "BPQ_L.xpt": [
+    "BPQ": [
         "SEQN",
         "BPQ020",     # Ever told high blood pressure
         "BPQ030",     # Told more than once high BP
         "BPQ080",     # Ever told high cholesterol
     ],
-    "MCQ_L.xpt": [
+    "MCQ": [
         "SEQN",
         "MCQ010",     # Ever told asthma
         "MCQ035",     # Still have asthma
@@ -152,7 +240,7 @@ COLUMNS_TO_KEEP = {
         "MCQ220",     # Ever told cancer/malignancy
         "MCQ160L",    # Ever told liver condition
     ],
-    "DPQ_L.xpt": [
+    "DPQ": [
         "SEQN",
         "DPQ010",     # Little interest in doing things
         "DPQ020",     # Feeling down/depressed/hopeless
@@ -164,23 +252,23 @@ COLUMNS_TO_KEEP = {
         "DPQ080",     # Moving/speaking slowly or fidgety
         "DPQ090",     # Thoughts of self-harm
     ],
-    "SMQ_L.xpt": [
+    "SMQ": [
         "SEQN",
         "SMQ020",     # Smoked at least 100 cigarettes in life
         "SMQ040",     # Do you now smoke cigarettes
     ],
-    "ALQ_L.xpt": [
+    "ALQ": [
         "SEQN",
         "ALQ111",     # Ever had a drink of alcohol
         "ALQ121",     # Past 12 mo: how often drank
         "ALQ142",     # Past 12 mo: # drinks on drinking days
         "ALQ270",     # Past 12 mo: binge drinking frequency
     ],
-    "PAQ_L.xpt": [
+    "PAQ": [
         "SEQN",
         "PAD680",     # Sedentary activity (minutes/day)
     ],
-    "HIQ_L.xpt": [
+    "HIQ": [
         "SEQN",
         "HIQ011",     # Covered by health insurance
         "HIQ032A",    # Covered by private insurance
@@ -191,7 +279,7 @@ COLUMNS_TO_KEEP = {
         "HIQ032H",    # Covered by military health care
         "HIQ032I",    # Covered by Indian Health Service
     ],
-    "SLQ_L.xpt": [
+    "SLQ": [
         "SEQN",
         "SLD012",     # Sleep hours — weekdays/workdays
         "SLD013",     # Sleep hours — weekends
@@ -200,81 +288,191 @@ COLUMNS_TO_KEEP = {
 }
 
 
-def download_xpt(filename: str) -> pd.DataFrame:
-    """Download a single XPT file from CDC."""
-    url = f"{BASE_URL}/{filename}"
-    print(f"  Downloading {filename}...")
-    try:
-        df = pd.read_sas(url, format="xport")
-    except Exception:
-        # Some pandas versions need the file locally
-        import urllib.request
-        import tempfile
-        tmp = os.path.join(tempfile.gettempdir(), filename)
-        urllib.request.urlretrieve(url, tmp)
-        df = pd.read_sas(tmp, format="xport")
-        os.remove(tmp)
-    print(f"    → {len(df):,} rows, {len(df.columns)} columns")
-    return df
+# Output schema shared by every survey_cycle partition (SAS numerics are doubles)
+SCHEMA = pa.schema(
+    [("SEQN", pa.int64())]
+    + [(col, pa.float64()) for comp, _ in COMPONENTS for col in COLUMNS_TO_KEEP[comp] if col != "SEQN"]
+)
+
+
+def component_url(cycle: str, component: str) -> str:
+    year, pattern, _ = CYCLES[cycle]
+    return f"{BASE_URL.format(year=year)}/{pattern.format(component)}"
+
+
+def load_component(path: str, component: str, cycle: str) -> pa.Table:
+    """Worker: read one XPT file's selected columns (after the cycle's
+    renames and recodes) into an Arrow table with an int64 SEQN."""
+    df = pd.read_sas(path, format="xport").rename(columns=CYCLES[cycle][2])
+    for col, (sources, recode) in RECODES.get(cycle, {}).items():
+        if col in COLUMNS_TO_KEEP[component] and all(c in df.columns for c in sources):
+            df[col] = recode(df)
+    df = df[[c for c in COLUMNS_TO_KEEP[component] if c in df.columns]]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    del df
+    # SEQN comes as float from SAS
+    seqn = table.column("SEQN").cast(pa.int64())
+    table = table.set_column(table.schema.get_field_index("SEQN"), "SEQN", seqn)
+    if pc.count_distinct(seqn).as_py() != table.num_rows:
+        raise ValueError(f"{os.path.basename(path)}: duplicate SEQN values")
+    return table
+
+
+class SeqnJoin:
+    """Left-join components to a spine on SEQN, one component at a time.
+
+    Each component's row for every spine SEQN is looked up once (index_in)
+    and its columns are gathered into spine order with that index; the
+    component itself can then be freed. Columns are only collected, not
+    concatenated, so each output column is materialized exactly once and
+    table() assembles the result without copying."""
+
+    def __init__(self, spine: pa.Table):
+        self.seqn = spine.column("SEQN")
+        self.columns = dict(zip(spine.column_names, spine.columns))
+
+    def add(self, component: pa.Table):
+        rows = pc.index_in(self.seqn, value_set=component.column("SEQN"))
+        for name in component.column_names:
+            if name == "SEQN":
+                continue
+            if name in self.columns:
+                raise ValueError(f"column {name} appears in more than one component")
+            self.columns[name] = component.column(name).take(rows)
+
+    def table(self, schema: pa.Schema) -> pa.Table:
+        """The joined table in `schema`'s column order; columns no component
+        supplied are all null."""
+        n = len(self.seqn)
+        return pa.table(
+            [self.columns[f.name].cast(f.type) if f.name in self.columns else pa.nulls(n, f.type)
+             for f in schema],
+            schema=schema,
+        )
 
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    # Step 1: Download demographics as the spine
-    print("Downloading NHANES 2021-2023 data files...\n")
-    demo_file, demo_desc = XPT_FILES[0]
-    print(f"[1/{len(XPT_FILES)}] {demo_desc}")
-    merged = download_xpt(demo_file)
-
-    # Keep only selected columns from demo
-    demo_cols = COLUMNS_TO_KEEP.get(demo_file)
-    if demo_cols:
-        available = [c for c in demo_cols if c in merged.columns]
-        merged = merged[available]
-
-    # Step 2: Download and merge each component file
-    for i, (filename, desc) in enumerate(XPT_FILES[1:], start=2):
-        print(f"\n[{i}/{len(XPT_FILES)}] {desc}")
-        try:
-            df = download_xpt(filename)
-
-            # Keep only selected columns
-            keep_cols = COLUMNS_TO_KEEP.get(filename)
-            if keep_cols:
-                available = [c for c in keep_cols if c in df.columns]
-                df = df[available]
-
-            # Merge on SEQN
-            merged = merged.merge(df, on="SEQN", how="left")
-            print(f"    → Merged: {len(merged):,} rows, {len(merged.columns)} columns")
-        except Exception as e:
-            print(f"    !! FAILED: {e}")
-            print(f"    Skipping {filename}")
-            continue
-
-    # Step 3: Add survey cycle column
-    merged["survey_cycle"] = "2021-2023"
-
-    # Step 4: Cast SEQN to integer (it comes as float from SAS)
-    merged["SEQN"] = merged["SEQN"].astype(int)
-
-    # Step 5: Write to Parquet
-    print(f"\nWriting to {OUTPUT_FILE}...")
-    merged.to_parquet(OUTPUT_FILE, compression="snappy", index=False)
-
-    # Step 6: Verify
-    size_mb = os.path.getsize(OUTPUT_FILE) / (1024 * 1024)
-    print(f"\nDone!")
-    print(f"  Rows: {len(merged):,}")
-    print(f"  Columns: {len(merged.columns)}")
-    print(f"  Size: {size_mb:.1f} MB")
-    print(f"\nColumn list:")
-    for col in merged.columns:
-        dtype = merged[col].dtype
-        nulls = merged[col].isna().sum()
-        null_pct = nulls / len(merged) * 100
-        print(f"  {col:25s} {str(dtype):15s} {null_pct:5.1f}% null")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cycles", nargs="*",
+                        help=f"cycles to (re)write, of {', '.join(CYCLES)} (default: {LATEST_CYCLE})")
+    parser.add_argument("--downloads", type=int, default=8, help="concurrent component downloads")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes decoding XPT files")
+    args = parser.parse_args()
+    cycles = args.cycles or [LATEST_CYCLE]
+    unknown = [c for c in cycles if c not in CYCLES]
+    if unknown:
+        parser.error(f"unknown cycle(s) {', '.join(unknown)}; known: {', '.join(CYCLES)}")
+
+    start = time.time()
+    descriptions = dict(COMPONENTS)
+    jobs = [(cycle, comp) for cycle in cycles for comp, _ in COMPONENTS]
+    print(f"Downloading {len(jobs)} NHANES component files for {', '.join(cycles)} "
+          f"({args.downloads} at a time)...\n")
+
+    # Step 1: Fetch components concurrently; each is decoded in the process
+    # pool as soon as its download finishes and joined as soon as it is
+    # decoded (components that arrive before their cycle's DEMO spine wait
+    # for it), so a cycle holds its joined columns, not its components
+    staging = f"{DATASET_DIR}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    joins: dict[str, SeqnJoin] = {}
+    waiting: dict[str, list[pa.Table]] = {cycle: [] for cycle in cycles}
+    remaining = {cycle: len(COMPONENTS) for cycle in cycles}
+    written = {}
+
+    def finish(cycle: str):
+        """Count one component of `cycle` done; stage the partition after the last."""
+        remaining[cycle] -= 1
+        if remaining[cycle]:
+            return
+        if cycle not in joins:
+            waiting.pop(cycle, None)
+            print(f"\n{cycle}: no demographics file — cycle skipped")
+            return
+        merged = joins.pop(cycle).table(SCHEMA)
+        part_dir = os.path.join(staging, f"survey_cycle={cycle}")
+        os.makedirs(part_dir)
+        pq.write_table(merged, os.path.join(part_dir, "part-0.parquet"), compression="snappy")
+        written[cycle] = merged
+
+    with ThreadPoolExecutor(max_workers=args.downloads) as downloads, \
+            ProcessPoolExecutor(max_workers=args.workers) as decoders:
+        fetches = {
+            downloads.submit(fetch, component_url(cycle, comp), label=f"{cycle} {comp}"): (cycle, comp)
+            for cycle, comp in jobs
+        }
+        decodes = {}
+        downloaded = time.time()
+        pending = set(fetches)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetches:
+                    cycle, comp = fetches.pop(future)
+                    try:
+                        path = future.result()
+                    except Exception as e:
+                        print(f"  {cycle} {comp}: !! download FAILED: {e} — skipping")
+                        finish(cycle)
+                        continue
+                    decode = decoders.submit(load_component, str(path), comp, cycle)
+                    decodes[decode] = (cycle, comp)
+                    pending.add(decode)
+                    if not fetches:
+                        downloaded = time.time()
+                    continue
+
+                cycle, comp = decodes.pop(future)
+                try:
+                    table = future.result()
+                except Exception as e:
+                    print(f"  {cycle} {comp}: !! decode FAILED: {e} — skipping")
+                    finish(cycle)
+                    continue
+                print(f"  {cycle} {descriptions[comp]}: {table.num_rows:,} rows, {table.num_columns} columns")
+                missing = [c for c in COLUMNS_TO_KEEP[comp] if c not in table.column_names]
+                if missing:
+                    print(f"    not in this cycle's file, left null: {', '.join(missing)}")
+                if comp == "DEMO":
+                    joins[cycle] = SeqnJoin(table)
+                    for early in waiting.pop(cycle):
+                        joins[cycle].add(early)
+                elif cycle in joins:
+                    joins[cycle].add(table)
+                else:
+                    waiting[cycle].append(table)
+                del table
+                finish(cycle)
+    decoded = time.time()
+
+    # Step 3: Swap the new partitions into place, leaving other cycles alone
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    for cycle in written:
+        final = os.path.join(DATASET_DIR, f"survey_cycle={cycle}")
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(os.path.join(staging, f"survey_cycle={cycle}"), final)
+    shutil.rmtree(staging, ignore_errors=True)
+    elapsed = time.time() - start
+
+    # Step 4: Verify
+    own_rss, worker_rss = peak_rss_mb()
+    print(f"\nDone in {elapsed:.1f}s (download {downloaded - start:.1f}s, decode {decoded - downloaded:.1f}s "
+          f"after the last download, join/write {elapsed - (decoded - start):.1f}s)")
+    print(f"  Peak RSS: {own_rss:,.0f} MB (main), {worker_rss:,.0f} MB (largest worker)")
+    for cycle, merged in written.items():
+        size_mb = os.path.getsize(os.path.join(DATASET_DIR, f"survey_cycle={cycle}", "part-0.parquet")) / (1024 * 1024)
+        print(f"  {cycle}: {merged.num_rows:,} rows, {merged.num_columns} columns, {size_mb:.1f} MB")
+
+    if written:
+        print(f"\nColumn list (% null):")
+        print(f"  {'':25s} {'':8s} " + " ".join(f"{cycle:>9s}" for cycle in written))
+        for field in SCHEMA:
+            nulls = " ".join(
+                f"{merged.column(field.name).null_count / merged.num_rows * 100:8.1f}%"
+                for merged in written.values()
+            )
+            print(f"  {field.name:25s} {str(field.type):8s} {nulls}")
 
 
 if __name__ == "__main__":
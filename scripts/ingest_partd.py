@@ -7,13 +7,29 @@ Source: https://data.cms.gov/provider-summary-by-type-of-service/medicare-part-d
 Each row = one prescriber (NPI) + one drug (brand/generic name) for a given year.
 ~25M rows/year, 11 years (2013-2023), ~276M total.
 
+The CSV is parsed with an explicit typed schema, matched to the header by
+column name. Rows that don't parse are written to
+data/partd-quarantine/partd_<year>_rejects.csv (line number, errors and raw
+line) instead of being dropped. A year missing any schema column fails;
+reordered or extra columns are fine. Years are converted concurrently within
+a total --memory-limit.
+
 Usage:
     source .venv/bin/activate
-    python scripts/ingest_partd.py
+    python scripts/ingest_partd.py                                  # all years
+    python scripts/ingest_partd.py 2022 2023                        # subset of years
+    python scripts/ingest_partd.py --workers 4 --memory-limit 16GB
 """
 
+import argparse
+import csv
 import duckdb
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from download_cache import fetch
+from memory import parse_size
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 
@@ -32,66 +48,141 @@ YEARS = {
     2013: "https://data.cms.gov/sites/default/files/2024-05/5fb694b1-2ec5-4e00-8efe-14161bdbdbea/MUP_DPR_RY24_P04_V10_DY13_NPIBN.csv",
 }
 
-COLUMN_SELECT = """
-    CAST(Prscrbr_NPI AS VARCHAR) AS Prscrbr_NPI,
-    Prscrbr_Last_Org_Name,
-    Prscrbr_First_Name,
-    Prscrbr_City,
-    Prscrbr_State_Abrvtn,
-    CAST(Prscrbr_State_FIPS AS VARCHAR) AS Prscrbr_State_FIPS,
-    Prscrbr_Type,
-    Prscrbr_Type_Src,
-    Brnd_Name,
-    Gnrc_Name,
-    CAST(Tot_Clms AS BIGINT) AS Tot_Clms,
-    CAST(Tot_30day_Fills AS DOUBLE) AS Tot_30day_Fills,
-    CAST(Tot_Day_Suply AS BIGINT) AS Tot_Day_Suply,
-    CAST(Tot_Drug_Cst AS DOUBLE) AS Tot_Drug_Cst,
-    CAST(Tot_Benes AS BIGINT) AS Tot_Benes,
-    GE65_Sprsn_Flag,
-    CAST(GE65_Tot_Clms AS BIGINT) AS GE65_Tot_Clms,
-    CAST(GE65_Tot_30day_Fills AS DOUBLE) AS GE65_Tot_30day_Fills,
-    CAST(GE65_Tot_Day_Suply AS BIGINT) AS GE65_Tot_Day_Suply,
-    CAST(GE65_Tot_Drug_Cst AS DOUBLE) AS GE65_Tot_Drug_Cst,
-    GE65_Bene_Sprsn_Flag,
-    CAST(GE65_Tot_Benes AS BIGINT) AS GE65_Tot_Benes,
-    {year} AS data_year
-"""
+# Source CSV schema, in file order. Parsed typed (no all_varchar + CAST) so a
+# value that doesn't fit its type is rejected and quarantined rather than
+# silently turned into NULL. NPIs and FIPS codes stay VARCHAR (leading zeros).
+CSV_SCHEMA = {
+    "Prscrbr_NPI": "VARCHAR",
+    "Prscrbr_Last_Org_Name": "VARCHAR",
+    "Prscrbr_First_Name": "VARCHAR",
+    "Prscrbr_City": "VARCHAR",
+    "Prscrbr_State_Abrvtn": "VARCHAR",
+    "Prscrbr_State_FIPS": "VARCHAR",
+    "Prscrbr_Type": "VARCHAR",
+    "Prscrbr_Type_Src": "VARCHAR",
+    "Brnd_Name": "VARCHAR",
+    "Gnrc_Name": "VARCHAR",
+    "Tot_Clms": "BIGINT",
+    "Tot_30day_Fills": "DOUBLE",
+    "Tot_Day_Suply": "BIGINT",
+    "Tot_Drug_Cst": "DOUBLE",
+    "Tot_Benes": "BIGINT",
+    "GE65_Sprsn_Flag": "VARCHAR",
+    "GE65_Tot_Clms": "BIGINT",
+    "GE65_Tot_30day_Fills": "DOUBLE",
+    "GE65_Tot_Day_Suply": "BIGINT",
+    "GE65_Tot_Drug_Cst": "DOUBLE",
+    "GE65_Bene_Sprsn_Flag": "VARCHAR",
+    "GE65_Tot_Benes": "BIGINT",
+}
 
+QUARANTINE_DIR = os.path.join(OUTPUT_DIR, "partd-quarantine")
+
+
+def read_header(path: str) -> list[str]:
+    """The CSV's column names; fails the year if any CSV_SCHEMA column is missing."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), [])
+    missing = [c for c in CSV_SCHEMA if c not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing {', '.join(missing)}")
+    return header
+
+
+def csv_source(path: str, header: list[str]) -> str:
+    # types= is keyed by name; columns the schema doesn't know are read as
+    # VARCHAR, so they can't reject a row, and left out of the SELECT
+    types = {c: CSV_SCHEMA.get(c, "VARCHAR") for c in header}
+    return (f"read_csv('{path}', header=true, types={types}, "
+            f"store_rejects=true, rejects_table='rejects', rejects_scan='reject_scans')")
+
+
+def ingest_year(year: int, url: str, memory_limit: str, threads: int) -> dict:
+    """Convert one year's CSV to partd_<year>.parquet; rejected rows go to
+    partd-quarantine/partd_<year>_rejects.csv."""
+    t = time.time()
+    csv_path = fetch(url, label=str(year))
+    header = read_header(csv_path)
+    output_file = os.path.join(OUTPUT_DIR, f"partd_{year}.parquet")
+    tmp = f"{output_file}.tmp"
+
+    con = duckdb.connect(config={"memory_limit": memory_limit, "threads": threads})
+    rows = con.execute(f"""
+        COPY (
+            SELECT {", ".join(CSV_SCHEMA)}, {year} AS data_year FROM {csv_source(csv_path, header)}
+        ) TO '{tmp}' (FORMAT PARQUET, COMPRESSION SNAPPY)
+    """).fetchone()[0]
+    os.replace(tmp, output_file)
+
+    quarantine = os.path.join(QUARANTINE_DIR, f"partd_{year}_rejects.csv")
+    # One rejects entry per error, and a short line gets one per missing column
+    rejected = con.execute("SELECT COUNT(DISTINCT (file_id, line)) FROM rejects").fetchone()[0]
+    if rejected:
+        os.makedirs(QUARANTINE_DIR, exist_ok=True)
+        con.execute(f"""
+            COPY (
+                SELECT line, string_agg(error_message, '; ') AS errors, csv_line
+                FROM rejects GROUP BY line, csv_line ORDER BY line
+            ) TO '{quarantine}' (HEADER)
+        """)
+    elif os.path.exists(quarantine):
+        os.remove(quarantine)
+    con.close()
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    con = duckdb.connect()
-    con.execute("INSTALL httpfs; LOAD httpfs;")
-    con.execute("SET force_download=true;")
+    return {
+        "rows": rows,
+        "rejected": rejected,
+        "size_mb": os.path.getsize(output_file) / (1024 * 1024),
+        "seconds": time.time() - t,
+    }
 
-    total_rows = 0
 
-    for year, url in sorted(YEARS.items()):
-        output_file = os.path.join(OUTPUT_DIR, f"partd_{year}.parquet")
-        print(f"\n--- {year} ---")
-        print(f"Downloading from: {url}")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("years", nargs="*", type=int, help="subset of years (default: all)")
+    parser.add_argument("--workers", type=int, default=3, help="years converted concurrently")
+    parser.add_argument("--memory-limit", default="12GB", help="total DuckDB memory budget, split across workers")
+    args = parser.parse_args()
 
-        cols = COLUMN_SELECT.format(year=year)
-        con.execute(f"""
-            COPY (
-                SELECT {cols}
-                FROM read_csv_auto('{url}', header=true, all_varchar=true, ignore_errors=true)
-            ) TO '{output_file}' (FORMAT PARQUET, COMPRESSION SNAPPY)
-        """)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    years = sorted(args.years or YEARS.keys())
+    workers = max(1, min(args.workers, len(years)))
+    per_worker = f"{parse_size(args.memory_limit) // workers // (1024 * 1024)}MB"
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Ingesting {len(years)} years, {workers} at a time ({per_worker} / {threads} threads each)")
 
-        count = con.execute(
-            f"SELECT COUNT(*) FROM read_parquet('{output_file}')"
-        ).fetchone()[0]
-        size_mb = os.path.getsize(output_file) / (1024 * 1024)
-        print(f"  Rows: {count:,}  |  Size: {size_mb:.1f} MB")
-        total_rows += count
+    total_rows = 0
+    total_rejected = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_year, year, YEARS[year], per_worker, threads): year for year in years}
+        for future in as_completed(futures):
+            year = futures[future]
+            try:
+                r = future.result()
+            except Exception as e:
+                print(f"  {year}: FAILED — {e}")
+                failed.append(year)
+                continue
+            total_rows += r["rows"]
+            total_rejected += r["rejected"]
+            quarantined = f"  |  Quarantined: {r['rejected']:,}" if r["rejected"] else ""
+            print(f"  {year}: Rows: {r['rows']:,}  |  Size: {r['size_mb']:.1f} MB  |  "
+                  f"{r['seconds']:.0f}s{quarantined}")
 
     print(f"\n{'='*50}")
     print(f"Total rows: {total_rows:,}")
+    if total_rejected:
+        print(f"Quarantined rows: {total_rejected:,} (see {QUARANTINE_DIR})")
+    if failed:
+        print(f"Failed years: {', '.join(map(str, sorted(failed)))}")
+        raise SystemExit(1)
+
+    con = duckdb.connect()
 
-    # Verify the first file's schema
-    sample_file = os.path.join(OUTPUT_DIR, "partd_2023.parquet")
+    # Verify the latest file's schema
+    latest = max(years)
+    sample_file = os.path.join(OUTPUT_DIR, f"partd_{latest}.parquet")
     cols = con.execute(
         f"DESCRIBE SELECT * FROM read_parquet('{sample_file}')"
     ).fetchall()
@@ -107,7 +198,7 @@ def main():
         ORDER BY claims DESC
         LIMIT 10
     """).fetchall()
-    print("\nTop 10 drugs by claims (2023):")
+    print(f"\nTop 10 drugs by claims ({latest}):")
     for d in drugs:
         print(f"  {d[0]:40s} {d[1]:>12,}")
 
@@ -0,0 +1,24 @@
+"""
+Memory-budget helpers shared by the conversion and ingest scripts.
+
+Used by convert_to_parquet.py (as scripts.memory), ingest_partd.py,
+harmonize_brfss.py and ingest_nhanes.py.
+"""
+
+import resource
+
+
+def parse_size(text: str) -> int:
+    """Parse a DuckDB-style size such as '16GB' or '512MB' into bytes."""
+    text = text.strip().upper()
+    for unit, factor in (("KB", 1024), ("MB", 1024 ** 2), ("GB", 1024 ** 3), ("TB", 1024 ** 4)):
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(text)
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """Peak RSS of this process and of the largest worker, in MB (Linux: KB units)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic Messages API, for exercising
+clean_hcpcs_descriptions.py without a key or cost.
+
+Answers POST /v1/messages with a JSON object mapping each "CODE: desc" line
+of the user message to the description in Title Case, after --latency
+seconds. It enforces a sliding-window limit of --rpm requests per minute
+and reports it in the same anthropic-ratelimit-requests-* headers as the
+real API, answering 429 with retry-after once the window is full, and it
+fails --error-rate of requests with a 529 (overloaded).
+
+Usage:
+    python scripts/mock_messages_server.py [--port 8787] [--rpm 120] [--latency 2] [--error-rate 0.05]
+"""
+
+import argparse
+import json
+import random
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Limiter:
+    """Sliding one-minute window of accepted request times."""
+
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.accepted = deque()
+        self.lock = threading.Lock()
+
+    def admit(self) -> tuple[bool, int, float]:
+        """Try to admit a request: (admitted, remaining, reset epoch)."""
+        with self.lock:
+            now = time.time()
+            while self.accepted and self.accepted[0] <= now - 60:
+                self.accepted.popleft()
+            admitted = len(self.accepted) < self.rpm
+            if admitted:
+                self.accepted.append(now)
+            reset = self.accepted[0] + 60 if self.accepted else now
+            return admitted, self.rpm - len(self.accepted), reset
+
+
+class Handler(BaseHTTPRequestHandler):
+    limiter: Limiter
+    latency: float
+    error_rate: float
+    stats = {"ok": 0, "rate_limited": 0, "overloaded": 0}
+
+    def _reply(self, status: int, body: dict, headers: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/v1/messages":
+            self._reply(404, {"type": "error", "error": {"type": "not_found_error"}}, {})
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["content-length"])))
+
+        admitted, remaining, reset = self.limiter.admit()
+        headers = {
+            "anthropic-ratelimit-requests-limit": str(self.limiter.rpm),
+            "anthropic-ratelimit-requests-remaining": str(remaining),
+            "anthropic-ratelimit-requests-reset":
+                datetime.fromtimestamp(reset, timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        }
+        if not admitted:
+            Handler.stats["rate_limited"] += 1
+            headers["retry-after"] = str(max(int(reset - time.time()) + 1, 1))
+            self._reply(429, {"type": "error", "error": {"type": "rate_limit_error"}}, headers)
+            return
+
+        time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            Handler.stats["overloaded"] += 1
+            self._reply(529, {"type": "error", "error": {"type": "overloaded_error"}}, headers)
+            return
+
+        text = payload["messages"][-1]["content"]
+        cleaned = {}
+        for line in text.splitlines():
+            code, sep, desc = line.partition(": ")
+            if sep and " " not in code:
+                cleaned[code] = desc.title()
+        Handler.stats["ok"] += 1
+        self._reply(200, {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": json.dumps(cleaned)}],
+        }, headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--rpm", type=int, default=120, help="requests per minute before 429s")
+    parser.add_argument("--latency", type=float, default=2.0, help="mean response time in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 529")
+    args = parser.parse_args()
+
+    Handler.limiter = Limiter(args.rpm)
+    Handler.latency = args.latency
+    Handler.error_rate = args.error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # `kill` prints the stats too
+    print(f"Mock Messages API on http://localhost:{args.port} ({args.rpm} rpm, ~{args.latency:g}s latency, "
+          f"{args.error_rate:.0%} errors)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Requests: {Handler.stats}")
+
+
+if __name__ == "__main__":
+    main()
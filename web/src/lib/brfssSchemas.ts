@@ -1,7 +1,7 @@
 export function generateBRFSSSchemaPrompt(): string {
   return `## BRFSS 2014-2020, 2023-2024 Survey Data
 
-You have ONE table: **brfss** (~4M rows, 99 columns, one row per respondent)
+You have ONE respondent-level table: **brfss** (~4M rows, 99 columns, one row per respondent), plus **brfss_cube**, precomputed weighted prevalences of common indicators (see below)
 
 This is the CDC Behavioral Risk Factor Surveillance System — the largest continuously conducted telephone health survey in the world. Data spans 9 survey years: 2014, 2015, 2016, 2017, 2018, 2019, 2020, 2023, and 2024 (2021-2022 are excluded due to major variable renames).
 
@@ -270,6 +270,49 @@ END AS state_name
 
 ---
 
+### Precomputed Prevalence Cube: brfss_cube
+
+For the prevalence of one of these indicators by survey_year, state and/or ONE demographic, query **brfss_cube** instead of brfss — it is a few thousand rows per indicator and already has the weighted estimate, a survey-design standard error and sample_n:
+
+| indicator | valid response (denominator) | outcome (numerator) |
+|-----------|------------------------------|---------------------|
+| obesity | \`_BMI5CAT BETWEEN 1 AND 4\` | \`_BMI5CAT = 4\` |
+| overweight_or_obese | \`_RFBMI5 IN (1, 2)\` | \`_RFBMI5 = 2\` |
+| current_smoker | \`_SMOKER3 BETWEEN 1 AND 4\` | \`_SMOKER3 IN (1, 2)\` |
+| current_ecig | \`_CURECI2 IN (1, 2)\` | \`_CURECI2 = 2\` |
+| binge_drinking | \`_RFBING6 IN (1, 2)\` | \`_RFBING6 = 2\` |
+| heavy_drinking | \`_RFDRHV8 IN (1, 2)\` | \`_RFDRHV8 = 2\` |
+| no_leisure_activity | \`_TOTINDA IN (1, 2)\` | \`_TOTINDA = 2\` |
+| fair_poor_health | \`_RFHLTH IN (1, 2)\` | \`_RFHLTH = 2\` |
+| frequent_mental_distress | \`_MENT14D IN (1, 2)\` | \`_MENT14D = 2\` |
+| frequent_physical_distress | \`_PHYS14D IN (1, 2)\` | \`_PHYS14D = 2\` |
+| depression | \`ADDEPEV3 IN (1, 2)\` | \`ADDEPEV3 = 1\` |
+| diabetes | \`DIABETE4 BETWEEN 1 AND 4\` | \`DIABETE4 = 1\` |
+| hypertension | \`BPHIGH6 BETWEEN 1 AND 4\` | \`BPHIGH6 = 1\` |
+| heart_disease | \`_MICHD IN (1, 2)\` | \`_MICHD = 1\` |
+| copd | \`CHCCOPD3 IN (1, 2)\` | \`CHCCOPD3 = 1\` |
+| current_asthma | \`ASTHMA3 IN (1, 2)\` | \`ASTHMA3 = 1 AND ASTHNOW = 1\` |
+| no_health_plan | \`_HLTHPL1 IN (1, 2)\` | \`_HLTHPL1 = 2\` |
+| cost_barrier | \`MEDCOST1 IN (1, 2)\` | \`MEDCOST1 = 1\` |
+| flu_shot | \`_FLSHOT7 IN (1, 2)\` | \`_FLSHOT7 = 1\` |
+
+Columns: \`survey_year\`, \`indicator\`, \`dimension\` ('all', 'SEXVAR', '_AGEG5YR', '_IMPRACE', '_EDUCAG', '_INCOMG', '_INCOMG1'), \`level\` (that column's code; NULL for 'all'), \`state\` (_STATE FIPS code; NULL = national), \`sample_n\`, \`sample_yes\`, \`weight_total\`, \`weight_yes\`, \`prevalence\` (0-1), \`se\` (standard error of prevalence, 0-1), \`var_yy\`, \`var_xy\`, \`var_xx\`.
+
+Always filter on indicator, dimension and state (\`state IS NULL\` for national figures), and label levels and states with CASE WHEN as for brfss:
+\`\`\`sql
+SELECT survey_year,
+  ROUND(100 * prevalence, 1) AS obesity_pct,
+  ROUND(100 * 1.96 * se, 1) AS ci95_pct,
+  sample_n
+FROM brfss_cube
+WHERE indicator = 'obesity' AND dimension = 'all' AND state IS NULL
+ORDER BY survey_year
+\`\`\`
+
+Regions or pooled years: add the sums across the states/years, then divide (do NOT average prevalences) — \`SUM(weight_yes) / SUM(weight_total)\`, with SE \`SQRT(SUM(var_yy) - 2 * p * SUM(var_xy) + p * p * SUM(var_xx)) / SUM(weight_total)\`. Never add rows of different levels or dimensions. Use brfss for anything else (other indicators or definitions, two demographics at once, means).
+
+---
+
 ### SQL Examples
 
 **Weighted diabetes prevalence by age group:**
@@ -37,6 +37,29 @@ const JOIN_REFERENCE = `## Cross-Dataset Join Reference
 | Provider specialty | npi_lookup.provider_type | Rndrng_Prvdr_Type | Prscrbr_Type | pri_spec (ALL CAPS) | N/A | N/A | N/A |
 | Gender | N/A | Rndrng_Prvdr_Gndr | N/A | gndr (M/F) | N/A | SEXVAR (1/2) | RIAGENDR (1/2) |
 
+### NPI Crosswalk (precomputed)
+
+\`npi_crosswalk\` has one row per NPI per year (a few million rows, sorted by npi) with presence flags and per-dataset totals. Prefer it over joining the fact tables for NPI-level cross-dataset questions (overlap counts, per-provider totals across payers, state or specialty breakdowns).
+
+| Column | Type | Notes |
+|--------|------|-------|
+| npi | VARCHAR | Joins to billing_npi, Rndrng_NPI, Prscrbr_NPI, dac.npi |
+| year | SMALLINT | NULL for NPIs found only in DAC |
+| in_medicaid, in_medicare, in_partd | BOOLEAN | NPI present in that dataset that year (Medicaid: as billing NPI) |
+| in_dac | BOOLEAN | NPI in the DAC snapshot (same on every row of an NPI) |
+| state | VARCHAR | 2-letter state: Medicare, else Part D, else npi_lookup, else DAC |
+| specialty | VARCHAR | ALL CAPS: most common DAC pri_spec, else Medicare/Part D provider type |
+| medicaid_paid, medicaid_claims | DOUBLE, BIGINT | Medicaid totals as billing NPI |
+| medicare_paid, medicare_services | DOUBLE, DOUBLE | SUM(Avg_Mdcr_Pymt_Amt * Tot_Srvcs), SUM(Tot_Srvcs) |
+| partd_drug_cost, partd_claims | DOUBLE, BIGINT | SUM(Tot_Drug_Cst), SUM(Tot_Clms) |
+
+\`\`\`sql
+SELECT specialty, COUNT(*) AS providers, SUM(medicaid_paid) AS medicaid, SUM(medicare_paid) AS medicare
+FROM npi_crosswalk
+WHERE year = 2023 AND in_medicaid AND in_medicare
+GROUP BY specialty ORDER BY providers DESC LIMIT 20
+\`\`\`
+
 ### Semantic Overlaps (same concept, different representation)
 | Concept | Datasets | Notes |
 |---------|----------|-------|
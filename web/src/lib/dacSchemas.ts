@@ -1,21 +1,40 @@
 export function generateDACSchemaPrompt(): string {
   return `## CMS Doctors and Clinicians (DAC) National Downloadable File — 2026
 
-You have ONE table: **dac** (~2.8M rows, 31 columns)
+You have THREE tables:
+- **dac_clinicians** (~1.5M rows, one row per NPI): name, gender, credentials, medical school, graduation year
+- **dac_enrollments** (one row per NPI + enrollment): specialties, telehealth, Medicare assignment
+- **dac** (~2.8M rows, 31 columns): the full directory, one row per clinician/enrollment/group practice/address combination
 
-This dataset is a directory of all clinicians enrolled in Medicare. Each row represents a unique clinician/enrollment/group practice/address combination. A single NPI can appear on multiple rows if the clinician has multiple enrollment records, belongs to multiple group practices, or practices at multiple locations.
+This dataset is a directory of all clinicians enrolled in Medicare. In **dac**, a single NPI appears on multiple rows if the clinician has multiple enrollment records, belongs to multiple group practices, or practices at multiple locations.
+
+---
+
+### CRITICAL: Use the Smallest Table That Has the Columns
+
+- Looking up one NPI, or counting clinicians by gender, credentials, medical school or graduation year → **dac_clinicians**
+- Counting clinicians by specialty, telehealth or individual assignment → **dac_enrollments** (JOIN dac_clinicians USING (npi) for gender, credentials or school)
+- Anything involving state, city, ZIP, address, telephone, group practice (facility_name, org_pac_id, num_org_mem) or grp_assgn → **dac**
+
+dac_clinicians and dac_enrollments are many times smaller than dac and have no address or group duplication, so they are much faster. Their columns have the same names, types and values as in dac.
+
+**dac_clinicians** columns: npi, ind_pac_id, provider_last_name, provider_first_name, provider_middle_name, suff, gndr, cred, med_sch, grd_yr
+
+**dac_enrollments** columns: npi, ind_enrl_id, pri_spec, sec_spec_1, sec_spec_2, sec_spec_3, sec_spec_4, sec_spec_all, telehlth, ind_assgn
+
+A clinician can have more than one enrollment (and so more than one pri_spec), so still count clinicians with COUNT(DISTINCT npi) in dac_enrollments.
 
 ---
 
 ### CRITICAL: One NPI Can Have Multiple Rows
 
-Because each row is a clinician+enrollment+group+address combination, you MUST use COUNT(DISTINCT npi) when counting unique clinicians — NOT COUNT(*).
+Because each dac row is a clinician+enrollment+group+address combination (and each dac_enrollments row a clinician+enrollment), you MUST use COUNT(DISTINCT npi) when counting unique clinicians — NOT COUNT(*).
 
 **Counting clinicians correctly:**
 \`\`\`sql
 -- CORRECT: count unique clinicians
 SELECT pri_spec, COUNT(DISTINCT npi) AS clinician_count
-FROM dac GROUP BY pri_spec ORDER BY clinician_count DESC LIMIT 20
+FROM dac_enrollments GROUP BY pri_spec ORDER BY clinician_count DESC LIMIT 20
 
 -- WRONG: counts enrollment/address records, not clinicians
 SELECT pri_spec, COUNT(*) AS count FROM dac GROUP BY pri_spec
@@ -23,7 +42,7 @@ SELECT pri_spec, COUNT(*) AS count FROM dac GROUP BY pri_spec
 
 ---
 
-### Columns
+### Columns of dac
 
 **Provider Identity:**
 | Column | Type | Description |
@@ -122,7 +141,7 @@ The most common pri_spec values (use these exact strings in WHERE clauses):
 **Top specialties by clinician count:**
 \`\`\`sql
 SELECT pri_spec, COUNT(DISTINCT npi) AS clinician_count
-FROM dac
+FROM dac_enrollments
 GROUP BY pri_spec
 ORDER BY clinician_count DESC
 LIMIT 20
@@ -155,7 +174,8 @@ SELECT pri_spec,
   COUNT(DISTINCT CASE WHEN gndr = 'F' THEN npi END) AS female,
   ROUND(100.0 * COUNT(DISTINCT CASE WHEN gndr = 'F' THEN npi END) /
     NULLIF(COUNT(DISTINCT npi), 0), 1) AS pct_female
-FROM dac
+FROM dac_enrollments
+JOIN dac_clinicians USING (npi)
 GROUP BY pri_spec
 ORDER BY COUNT(DISTINCT npi) DESC
 LIMIT 20
@@ -168,7 +188,7 @@ SELECT pri_spec,
   COUNT(DISTINCT CASE WHEN telehlth = 'Y' THEN npi END) AS telehealth_clinicians,
   ROUND(100.0 * COUNT(DISTINCT CASE WHEN telehlth = 'Y' THEN npi END) /
     NULLIF(COUNT(DISTINCT npi), 0), 1) AS pct_telehealth
-FROM dac
+FROM dac_enrollments
 GROUP BY pri_spec
 ORDER BY total_clinicians DESC
 LIMIT 20
@@ -176,17 +196,26 @@ LIMIT 20
 
 **Look up a specific NPI:**
 \`\`\`sql
-SELECT npi, provider_first_name, provider_last_name, cred,
-  pri_spec, sec_spec_all, facility_name, city, state
-FROM dac
+SELECT npi, provider_first_name, provider_last_name, cred, med_sch, grd_yr,
+  pri_spec, sec_spec_all, telehlth
+FROM dac_clinicians
+LEFT JOIN dac_enrollments USING (npi)
 WHERE npi = '1234567890'
 LIMIT 10
 \`\`\`
 
+**Practice locations of a specific NPI (needs dac for addresses and groups):**
+\`\`\`sql
+SELECT DISTINCT facility_name, adr_ln_1, city, state, zip_code, telephone
+FROM dac
+WHERE npi = '1234567890'
+LIMIT 50
+\`\`\`
+
 **Medical schools producing the most clinicians:**
 \`\`\`sql
 SELECT med_sch, COUNT(DISTINCT npi) AS clinician_count
-FROM dac
+FROM dac_clinicians
 WHERE med_sch IS NOT NULL AND med_sch != 'OTHER'
 GROUP BY med_sch
 ORDER BY clinician_count DESC
@@ -207,7 +236,8 @@ LIMIT 20
 
 ---
 
-### Performance Rules (CRITICAL — 2.8M rows)
+### Performance Rules (CRITICAL — 2.8M rows in dac)
+- Use dac_clinicians / dac_enrollments whenever the question needs no location, address or group practice columns.
 - ALWAYS use COUNT(DISTINCT npi) to count clinicians, never COUNT(*).
 - ALWAYS use GROUP BY to aggregate. Never SELECT * without a WHERE filter on a specific NPI.
 - ALWAYS include a LIMIT clause (max 10000 rows).
@@ -100,8 +100,10 @@ Table: brfss (99 columns)
   Survey weight: _LLCPWT (CRITICAL: always use for population estimates)
 Key concepts: prevalence rates, self-reported conditions, health behaviors, risk factors, demographics, insurance coverage.
 
-═══ 6. nhanes ═══ NHANES clinical examination survey. 12K participants. Cycle: 2021–2023 only (single cycle, no trends).
-Table: nhanes (94 columns)
+═══ 6. nhanes ═══ NHANES clinical examination survey. 12K participants per cycle. Cycles: 2015–2016, 2017–2020 (pre-pandemic), 2021–2023.
+Table: nhanes (94 columns) — latest cycle, 2021–2023
+Table: nhanes_all_cycles — same columns for every cycle, partitioned by survey_cycle (use for earlier cycles and comparisons across cycles)
+Table: nhanes_stats — precomputed weighted mean, standard error and percentiles of each exam/lab measure by one demographic, per survey_cycle
   Demographics: SEQN (respondent ID), RIAGENDR (1=M,2=F), RIDAGEYR (age), RIDRETH3 (race/ethnicity), DMDEDUC2, INDFMPIR (income-to-poverty ratio)
   Body measures: BMXWT (kg), BMXHT (cm), BMXBMI (kg/m²), BMXWAIST (cm)
   Blood pressure: BPXOSY1/2/3 (systolic), BPXODI1/2/3 (diastolic) — 3 readings each
@@ -213,6 +215,7 @@ Key routing rules:
 - "Medicaid", "T-codes", "personal care", "Medicaid provider" → medicaid
 - "obesity rate", "smoking rate", "diabetes prevalence", "health behaviors", "survey" → brfss
 - "blood pressure measurement", "lab values", "HbA1c", "clinical exam", "PHQ-9" → nhanes
+- Measured BMI/BP/labs "over time", "since 2015", "before the pandemic" → nhanes (cycles 2015–2016, 2017–2020, 2021–2023)
 - "how many doctors", "specialist count", "provider directory", "telehealth adoption" → dac
 - Generic "Medicare spending" without qualifier → include medicare (Part B); add medicare-inpatient and/or medicare-partd only if context suggests hospital or drug spending
 - "BMI" or "diabetes" without qualifier → ambiguous between brfss and nhanes (ask)
@@ -18,6 +18,7 @@ registerDataset({
 - Always include a LIMIT clause (max 10000) unless the query is a single aggregated row.
 - Only use SELECT statements. Use DuckDB SQL syntax.
 - ALWAYS use COUNT(DISTINCT npi) to count clinicians — each NPI can appear on multiple rows.
+- For single-NPI lookups and counts by specialty, gender, credentials, school or telehealth, query dac_clinicians / dac_enrollments, not dac. Use dac only for location, address or group practice columns.
 - Specialty values are ALL CAPS strings (e.g., INTERNAL MEDICINE, not Internal Medicine).
 - Gender is coded as M/F (not Male/Female).
 - Provide readable labels via CASE WHEN for coded values (gndr, ind_assgn, grp_assgn).
@@ -26,6 +27,7 @@ registerDataset({
 - Return ONLY the SQL query. No markdown.
 - Always include LIMIT (max 10000). Only SELECT. DuckDB SQL.
 - Use COUNT(DISTINCT npi) to count clinicians, not COUNT(*).
+- Prefer dac_clinicians / dac_enrollments over dac unless location or group columns are needed.
 - Specialty values are ALL CAPS. Gender is M/F.
 - No spending or payment data — provider directory only.`,
 
@@ -72,6 +74,7 @@ registerDataset({
 - The DAC National Downloadable File is a CMS directory of all clinicians enrolled in Medicare
 - Each row = clinician + enrollment record + group practice + address combination
 - A single NPI can appear on multiple rows — always use COUNT(DISTINCT npi)
+- dac_clinicians (one row per NPI) and dac_enrollments (one row per NPI + enrollment) hold the clinician and specialty columns without the address/group duplication of dac
 - ~1.5M unique NPIs, ~2.8M total rows
 - Includes primary and up to 4 secondary specialties per clinician
 - Specialty values are ALL CAPS (e.g., INTERNAL MEDICINE, CARDIOVASCULAR DISEASE (CARDIOLOGY))
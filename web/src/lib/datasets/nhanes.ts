@@ -25,13 +25,13 @@ registerDataset({
 - For PHQ-9 depression score: sum DPQ010-DPQ090 (only when all 9 are valid 0-3). Score >= 10 = clinically significant.
 - Fasting labs (LBXGLU, LBXTLG, LBDLDL) are available for ~4K participants only. Prefer LBXGH (HbA1c) or LBXSGL (non-fasting glucose) for broader coverage.
 - For adults-only analysis, filter RIDAGEYR >= 18 (or >= 20 for education/marital status).
-- This is a SINGLE survey cycle (2021-2023). There is NO time trend capability.`,
+- nhanes is the 2021-2023 cycle only. Use nhanes_all_cycles only for earlier cycles or cross-cycle comparisons, and always filter or GROUP BY survey_cycle there.`,
   retrySystemPromptRules: `Rules:
 - Return ONLY the SQL query. No markdown.
 - Always include LIMIT (max 10000). Only SELECT. DuckDB SQL.
 - Use WTMEC2YR for weighted estimates.
 - Filter NULLs and refusal codes. Add readable labels via CASE WHEN.
-- Single cycle (2021-2023), no trends.`,
+- nhanes is 2021-2023 only; nhanes_all_cycles needs a survey_cycle filter or GROUP BY.`,
 
   pageTitle: "Analyze NHANES Clinical Data",
   pageSubtitle: "Ask questions about NHANES lab results, physical measurements, and health questionnaires (2021-2023)",
@@ -61,7 +61,7 @@ registerDataset({
     const outOfScope = [
       { patterns: ["medicaid", "medicare", "claims", "billing", "reimbursement", "provider spending", "hcpcs", "npi"], reason: "NHANES is a clinical health survey, not a claims/billing dataset. Try the Medicaid or Medicare dataset for spending questions." },
       { patterns: ["brfss", "behavioral risk factor", "phone survey"], reason: "This is the NHANES dataset with clinical measurements, not BRFSS. Try the BRFSS dataset for phone-survey health data." },
-      { patterns: ["trend over time", "over the years", "changed since", "year over year"], reason: "This dataset covers a single survey cycle (2021-2023). For health trends over time, try the BRFSS dataset which spans 2014-2023." },
+      { patterns: ["year over year"], reason: "NHANES is released in multi-year survey cycles, so it cannot show year-over-year change. Compare survey cycles instead, or try the BRFSS dataset which spans 2014-2023." },
       { patterns: ["individual patient", "specific person", "patient record"], reason: "NHANES is anonymized survey data — individual participants cannot be identified." },
       { patterns: ["state", "by state", "which state", "county", "zip code", "geographic"], reason: "NHANES does not include geographic identifiers (state, county, ZIP) for privacy. For geographic health data, try the BRFSS dataset." },
     ];
@@ -77,7 +77,7 @@ registerDataset({
 - NHANES is a CDC program that assesses the health/nutrition of adults and children in the US through interviews and physical examinations
 - Unlike BRFSS (phone survey, self-reported), NHANES includes actual lab values, measured blood pressure, and physical exams
 - The 2021-2023 cycle is the most recent complete cycle (~12K participants, ~8.8K examined)
-- Data is cross-sectional (single cycle), NOT longitudinal — cannot track trends
+- Data is cross-sectional, NOT longitudinal — the same people are not followed; earlier cycles (2015-2016, 2017-March 2020) can be compared cycle by cycle via nhanes_all_cycles
 - Survey weights (WTMEC2YR) are essential for nationally representative estimates
 - Lab values have varying availability: CBC and biochemistry ~63%, HbA1c ~56%, fasting glucose/lipids ~31%
 - Key clinical thresholds: Diabetes (HbA1c >= 6.5%), Prediabetes (5.7-6.4%), Hypertension (SBP >= 130 or DBP >= 80), Obesity (BMI >= 30)
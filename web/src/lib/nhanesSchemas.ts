@@ -1,7 +1,7 @@
 export function generateNHANESSchemaPrompt(): string {
   return `## NHANES 2021-2023 Survey Data
 
-You have ONE table: **nhanes** (11,933 rows, 94 columns, one row per survey participant)
+You have ONE participant-level table: **nhanes** (11,933 rows, 94 columns, one row per survey participant, 2021-2023 cycle only), plus **nhanes_stats**, precomputed weighted means and percentiles of the exam and lab measures (see below), and **nhanes_all_cycles**, the same columns for every ingested survey cycle (see "Earlier Survey Cycles")
 
 This is the CDC National Health and Nutrition Examination Survey (NHANES) — a nationally representative survey that combines interviews, physical examinations, and laboratory tests. Unlike BRFSS (phone survey, self-reported), NHANES includes actual clinical measurements: blood draws, blood pressure readings, body measurements, and standardized questionnaires administered in-person.
 
@@ -44,6 +44,31 @@ GROUP BY <group_column>
 
 ---
 
+### Earlier Survey Cycles (nhanes_all_cycles)
+
+Use **nhanes** for every question unless the user asks about an earlier cycle or a comparison across cycles. **nhanes_all_cycles** has the same columns with one partition per ingested cycle:
+- **2015-2016** — no oscillometric blood pressure (BPXOSY*/BPXODI* are NULL); ALQ111, ALQ142, ALQ270 and SLD013 are NULL; ALQ121 is approximated from that cycle's drinks-per-week/month/year question
+- **2017-2020** — pre-pandemic January 2017-March 2020; its WTMEC2YR/WTINT2YR are 3.2-year weights
+- **2021-2023** — identical to nhanes
+
+Each cycle's weights sum to the whole US population, so in nhanes_all_cycles you MUST either filter one cycle (\`WHERE survey_cycle = '2017-2020'\`) or GROUP BY survey_cycle. Never sum weights across cycles without one of these.
+
+**Comparing cycles:**
+\`\`\`sql
+SELECT survey_cycle,
+  ROUND(100.0 * SUM(CASE WHEN BMXBMI >= 30 THEN WTMEC2YR ELSE 0 END)
+    / NULLIF(SUM(CASE WHEN BMXBMI IS NOT NULL THEN WTMEC2YR ELSE 0 END), 0), 1) AS obesity_pct,
+  COUNT(*) FILTER (WHERE BMXBMI IS NOT NULL) AS sample_n
+FROM nhanes_all_cycles
+WHERE RIDAGEYR >= 20 AND BMXBMI IS NOT NULL
+GROUP BY survey_cycle
+ORDER BY survey_cycle
+\`\`\`
+
+**Pooling cycles** (only when the user asks for a combined estimate): scale each cycle's weight by its share of the pooled years — 2015-2016 and 2021-2023 span 2 years, 2017-2020 spans 3.2 — e.g. pooling 2017-2020 with 2021-2023 uses \`WTMEC2YR * CASE survey_cycle WHEN '2017-2020' THEN 3.2 / 5.2 ELSE 2 / 5.2 END\`.
+
+---
+
 ### Missing Value Conventions
 
 - NULL = not examined, not applicable, or component not done
@@ -63,7 +88,7 @@ GROUP BY <group_column>
 - \`DMDEDUC2\` — Education level, adults 20+ (1=Less than 9th grade, 2=9-11th grade, 3=High school grad/GED, 4=Some college/AA, 5=College graduate or above, 7=Refused, 9=Don't know) — NULL for ages <20
 - \`DMDMARTZ\` — Marital status (1=Married/Living with partner, 2=Widowed/Divorced/Separated, 3=Never married, 77=Refused, 99=Don't know) — NULL for ages <20
 - \`INDFMPIR\` — Ratio of family income to poverty (0-5, continuous; values >5 are capped at 5)
-- \`survey_cycle\` VARCHAR — Always "2021-2023"
+- \`survey_cycle\` VARCHAR — Always "2021-2023" in nhanes; in nhanes_all_cycles one of "2015-2016", "2017-2020", "2021-2023"
 
 **Age group helper:**
 \`\`\`sql
@@ -347,6 +372,40 @@ For insurance type questions, these are CHECK-ALL-THAT-APPLY (value is 1 if chec
 
 ---
 
+### Precomputed Lab & Exam Statistics: nhanes_stats
+
+For the weighted mean, standard error or percentiles of ONE body measure, blood pressure reading or lab value (every column in the Body Measures, Blood Pressure, Diabetes Markers, Lipid Panel, Kidney & Liver, Complete Blood Count and Inflammation sections, except the fasting-subsample LBXGLU, LBXTLG and LBDLDL) by at most ONE demographic, query **nhanes_stats** instead of nhanes. It is already weighted with WTMEC2YR and has a survey-design standard error.
+
+nhanes_stats has NO rows for LBXGLU, LBXTLG or LBDLDL: they need the fasting subsample weight (WTSAF2YR), which is not in the data. For glucose use LBXGH or LBXSGL; for lipids use LBXTC and LBDHDD. Only if the user asks specifically for fasting glucose, triglycerides or LDL, query nhanes with WTMEC2YR; that estimate is approximate.
+
+Columns: \`survey_cycle\`, \`measure\` (the nhanes column name, e.g. 'LBXGH'), \`population\` ('all' ages, '18+', '20+'), \`dimension\`, \`level\`, \`label\` (readable level name), \`sample_n\`, \`weight_total\`, \`weight_sum\`, \`mean\`, \`se\` (standard error of mean), \`p10\`, \`p25\`, \`p50\` (median), \`p75\`, \`p90\`, \`var_yy\`, \`var_xy\`, \`var_xx\`.
+
+| dimension | levels (label) |
+|-----------|----------------|
+| all | NULL (All) |
+| RIAGENDR | 1=Male, 2=Female |
+| age_group | 1=Under 18, 2=18-29, 3=30-39, 4=40-49, 5=50-59, 6=60-69, 7=70+ |
+| RIDRETH3 | 1=Mexican American, 2=Other Hispanic, 3=Non-Hispanic White, 4=Non-Hispanic Black, 6=Non-Hispanic Asian, 7=Other/Multi-Racial |
+| DMDEDUC2 | 1-5 as in Demographics (refusals excluded) |
+| income | from INDFMPIR: 1=Below 130% of poverty, 2=130-349%, 3=350% or more |
+| insurance | from HIQ011/HIQ032*, first that applies: 1=Private, 2=Medicare (incl. Medi-Gap), 3=Medicaid/CHIP, 4=Military/IHS, 5=Uninsured |
+
+Always filter on survey_cycle, measure, population and dimension, and return \`label\` instead of level codes:
+\`\`\`sql
+SELECT label AS income_group,
+  ROUND(mean, 2) AS mean_hba1c,
+  ROUND(1.96 * se, 2) AS ci95,
+  ROUND(p50, 1) AS median_hba1c,
+  sample_n
+FROM nhanes_stats
+WHERE survey_cycle = '2021-2023' AND measure = 'LBXGH' AND population = '20+' AND dimension = 'income'
+ORDER BY level
+\`\`\`
+
+Percentiles are exact only for the rows as stored — never average or add them. Use nhanes for anything else (thresholds and prevalences, two demographics at once, other age cutoffs, questionnaire items).
+
+---
+
 ### SQL Examples
 
 **Total diabetes prevalence (diagnosed + undiagnosed) by age group, adults 20+:**
@@ -457,7 +516,7 @@ ORDER BY 1
 - ALWAYS use WTMEC2YR for weighted estimates when any exam or lab data is involved. Use WTINT2YR only for pure interview/demographic queries.
 - ALWAYS filter out NULLs and refusal codes (7, 9, 77, 99) before calculations.
 - ALWAYS add readable labels via CASE WHEN — never return raw numeric codes.
-- This is a single cycle (2021-2023). There is no time trend capability. If the user asks about trends over time, return CANNOT_ANSWER.
+- nhanes is the 2021-2023 cycle only. For earlier cycles or comparisons across cycles use nhanes_all_cycles, always filtering or grouping by survey_cycle. There is no time trend within a cycle.
 - ~12K total participants, ~8.8K examined. Many lab values are NULL for those not examined or not in fasting subsample.
 - Fasting glucose (LBXGLU), triglycerides (LBXTLG), and LDL (LBDLDL) are only available for the fasting subsample (~4K participants). Use LBXSGL (non-fasting serum glucose) or LBXGH (HbA1c) for broader glucose analysis.
 - For adults-only analysis (most clinical questions), filter RIDAGEYR >= 18 or >= 20.
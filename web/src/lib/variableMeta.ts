@@ -265,7 +265,7 @@ export const nhanesVariableGroups: VariableGroup[] = [
       { name: "DMDEDUC2", type: "DOUBLE", description: "Education level (adults 20+)", codes: "1=Less than 9th grade, 2=9-11th grade, 3=HS grad/GED, 4=Some college/AA, 5=College grad+" },
       { name: "DMDMARTZ", type: "DOUBLE", description: "Marital status", codes: "1=Married/Living with partner, 2=Widowed/Divorced/Separated, 3=Never married" },
       { name: "INDFMPIR", type: "DOUBLE", description: "Ratio of family income to poverty (0-5, capped at 5)" },
-      { name: "survey_cycle", type: "VARCHAR", description: "Survey cycle identifier (always 2021-2023)" },
+      { name: "survey_cycle", type: "VARCHAR", description: "Survey cycle identifier (always 2021-2023 in nhanes; 2015-2016, 2017-2020 or 2021-2023 in nhanes_all_cycles)" },
     ],
   },
   {
@@ -660,4 +660,28 @@ export const dacVariableGroups: VariableGroup[] = [
       { name: "ln_2_sprs", type: "VARCHAR", description: "Address line 2 suppression flag" },
     ],
   },
+  {
+    name: "Clinicians (dac_clinicians)",
+    description: "One row per NPI (~1.5M rows) — use for NPI lookups and gender, credential or school counts",
+    variables: [
+      { name: "npi", type: "VARCHAR", description: "National Provider Identifier (unique here)" },
+      { name: "ind_pac_id", type: "VARCHAR", description: "Individual PECOS Associate Control ID" },
+      { name: "provider_last_name", type: "VARCHAR", description: "Clinician last name (also first/middle name, suff)" },
+      { name: "gndr", type: "VARCHAR", description: "Gender", codes: "M=Male, F=Female" },
+      { name: "cred", type: "VARCHAR", description: "Credentials (MD, DO, NP, PA, etc.)" },
+      { name: "med_sch", type: "VARCHAR", description: "Medical school name" },
+      { name: "grd_yr", type: "VARCHAR", description: "Graduation year (4-digit)" },
+    ],
+  },
+  {
+    name: "Enrollments (dac_enrollments)",
+    description: "One row per NPI + enrollment — use for specialty and telehealth counts (COUNT(DISTINCT npi))",
+    variables: [
+      { name: "npi", type: "VARCHAR", description: "National Provider Identifier" },
+      { name: "ind_enrl_id", type: "VARCHAR", description: "Individual enrollment ID" },
+      { name: "pri_spec", type: "VARCHAR", description: "Primary specialty (also sec_spec_1-4, sec_spec_all)" },
+      { name: "telehlth", type: "VARCHAR", description: "Telehealth indicator", codes: "Y=Yes, blank=No" },
+      { name: "ind_assgn", type: "VARCHAR", description: "Individual Medicare assignment", codes: "Y=Yes, M=May accept" },
+    ],
+  },
 ];